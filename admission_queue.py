@@ -0,0 +1,100 @@
+import heapq
+import itertools
+from typing import *
+from PluginEngine.asserts import require
+
+
+__all__ = ['FairAdmissionQueue', 'parse_user_weights']
+
+
+def parse_user_weights(text: str) -> Dict[str, float]:
+    """
+    Parses per-user weights of the admission queue
+    :param text: like "user_1: 4, user_2: 0.5"
+    """
+    weights = {}
+    for item in text.split(','):
+        if not item.strip():
+            continue
+        username, weight = item.rsplit(':', 1)
+        weights[username.strip()] = float(weight)
+        require(weights[username.strip()] > 0.0, f'Admission weight of {username} must be positive')
+    return weights
+
+
+class FairAdmissionQueue:
+    """
+    Limits the number of simultaneously active items;
+    the waiting ones are admitted in weighted fair order per user:
+    each user's item is tagged with a virtual finish time growing by 1 / weight,
+    so a user with a few items is not starved by a user with hundreds of them
+    """
+
+    def __init__(self, max_active: int = 0, weights: Optional[Dict[str, float]] = None, default_weight: float = 1.0):
+        """
+        :param max_active: max number of active items, 0 means unlimited
+        :param weights: per-user weights, default_weight is used for the unlisted users
+        """
+        self._max_active = max_active
+        self._weights = weights or {}
+        self._default_weight = default_weight
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        self._queued: Dict[Hashable, float] = {}
+        self._active: Set[Hashable] = set()
+        self._last_tags: Dict[str, float] = {}
+        self._virtual_time = 0.0
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._queued)
+
+    def active_count(self) -> int:
+        return len(self._active)
+
+    def is_queued(self, key: Hashable) -> bool:
+        return key in self._queued
+
+    def push(self, key: Hashable, username: str):
+
+        require(key not in self._queued and key not in self._active)
+        weight = self._weights.get(username, self._default_weight)
+        tag = max(self._virtual_time, self._last_tags.get(username, 0.0)) + 1.0 / weight
+        self._last_tags[username] = tag
+        self._queued[key] = tag
+        heapq.heappush(self._heap, (tag, next(self._counter), key))
+
+    def admit(self) -> List[Hashable]:
+        """
+        Activates as many queued items as the limit allows
+        :return: the newly activated items
+        """
+        admitted = []
+        while self._heap and (self._max_active <= 0 or len(self._active) < self._max_active):
+            tag, _, key = heapq.heappop(self._heap)
+            if self._queued.get(key) != tag:
+                continue  # removed
+            del self._queued[key]
+            self._virtual_time = tag
+            self._active.add(key)
+            admitted.append(key)
+
+        if not self._queued:
+            self._last_tags.clear()
+        return admitted
+
+    def remove(self, key: Hashable) -> bool:
+        """
+        Removes the item from the queue
+        :return: whether the item was queued
+        """
+        return self._queued.pop(key, None) is not None
+
+    def release(self, key: Hashable) -> bool:
+        """
+        Frees the slot of the active item
+        :return: whether the item was active
+        """
+        if key in self._active:
+            self._active.remove(key)
+            return True
+        return False
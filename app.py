@@ -13,8 +13,9 @@ from backend.task_scheduler_service.scenario_provider import ScenarioProvider
 from backend.task_scheduler_service.task_manager import TaskManager
 from backend.task_scheduler_service.task_logger import TaskLogger
 from backend.task_scheduler_service.edit_lock_manager import EditLockManager
-from backend.task_scheduler_service.schemas import RUN_TASK_SCHEMA
+from backend.task_scheduler_service.schemas import RUN_TASK_SCHEMA, RUN_TASKS_SCHEMA
 from backend.task_scheduler_service.routes import routes
+from backend.task_scheduler_service.metrics import REGISTRY
 from backend.task_scheduler_service.consumers import *
 logging.disable(logging.INFO)
 
@@ -23,6 +24,20 @@ task_manager = None
 the_app = None
 
 
+def too_many_requests(msg: str):
+    return web.Response(status=web.HTTPTooManyRequests.status_code, text=msg,
+                        headers={'Retry-After': str(TaskManager.RETRY_AFTER)})
+
+
+def task_status_url(request, task_uuid: uuid.UUID) -> str:
+    return str(request.app.router['task_status'].url_for(uuid=str(task_uuid)))
+
+
+def task_accepted(request, task_uuid: uuid.UUID, msg: str):
+    return web.json_response({'uuid': str(task_uuid), 'message': msg}, status=web.HTTPAccepted.status_code,
+                             headers={'Location': task_status_url(request, task_uuid)})
+
+
 async def run_task(request):
     try:
         data = await request.json()
@@ -35,14 +50,65 @@ async def run_task(request):
     except ValueError as err:
         return web.Response(status=web.HTTPBadRequest.status_code, text="incorrect task id UUID")
 
-    ok, msg = await task_manager.start_task(task_id, payload=data)
+    ok, msg = task_manager.check_backpressure(task_id)
+    if not ok:
+        return too_many_requests(msg)
+
+    ok, msg, task_uuid = await task_manager.start_task(task_id, payload=data)
 
     if ok:
-        return web.Response(status=web.HTTPOk.status_code, text=f"Task {data['task_id']} has been created by {data['username']}")
+        return task_accepted(request, task_uuid, msg)
     else:
         return web.Response(status=web.HTTPInternalServerError.status_code, text=msg)
 
 
+async def run_tasks(request):
+    """
+    Creates a batch of tasks: either the list of run_task payloads ("tasks")
+    or one scenario with the list of rects ("rects") or cell lists ("cells");
+    like run_task, answers 202 with the status URL of every accepted task, 500 if no task has been accepted
+    """
+    try:
+        data = await request.json()
+        jsonschema.validate(data, RUN_TASKS_SCHEMA)
+    except (jsonschema.ValidationError, Exception) as err:
+        return web.Response(status=web.HTTPBadRequest.status_code, text=str(err))
+
+    if 'tasks' in data:
+        payloads = data['tasks']
+    else:
+        common = {key: value for key, value in data.items() if key not in ('rects', 'cells')}
+        key, items = ('rect', data['rects']) if 'rects' in data else ('cells', data['cells'])
+        payloads = [dict(common, **{key: item}) for item in items]
+
+    try:
+        tasks = [(uuid.UUID(payload['task_id']), payload) for payload in payloads]
+    except ValueError as err:
+        return web.Response(status=web.HTTPBadRequest.status_code, text="incorrect task id UUID")
+
+    ok, msg = task_manager.check_inflight(len(tasks))
+    if not ok:
+        return too_many_requests(msg)
+
+    for task_id in {task_id for task_id, _ in tasks}:
+        ok, msg = task_manager.check_backlog(task_id)
+        if not ok:
+            return too_many_requests(msg)
+
+    results = await task_manager.start_tasks(tasks)
+
+    items = []
+    for ok, msg, task_uuid in results:
+        item = {'ok': ok, 'message': msg, 'uuid': str(task_uuid) if task_uuid else None}
+        if ok:
+            item['status'] = task_status_url(request, task_uuid)
+        items.append(item)
+
+    failed = results and not any(ok for ok, _, _ in results)
+    return web.json_response({'tasks': items}, status=web.HTTPInternalServerError.status_code if failed
+                             else web.HTTPAccepted.status_code)
+
+
 async def run_task_by_id(request, task_id: uuid.UUID):
 
     try:
@@ -56,14 +122,99 @@ async def run_task_by_id(request, task_id: uuid.UUID):
     except ValueError as err:
         return web.Response(status=web.HTTPBadRequest.status_code, text="incorrect task id UUID")
 
-    ok, msg = await task_manager.start_task(task_id, payload=data)
+    ok, msg = task_manager.check_backpressure(task_id)
+    if not ok:
+        return too_many_requests(msg)
+
+    ok, msg, task_uuid = await task_manager.start_task(task_id, payload=data)
 
     if ok:
-        return web.Response(status=web.HTTPOk.status_code, text=f"Task {task_id} has been created by {data['username']}")
+        return task_accepted(request, task_uuid, msg)
     else:
         return web.Response(status=web.HTTPInternalServerError.status_code, text=msg)
 
 
+async def task_status(request):
+    """
+    Returns the task state; with since_version, waits until the task version exceeds it
+    or the long poll timeout expires
+    """
+    try:
+        task_uuid = uuid.UUID(request.match_info['uuid'])
+    except ValueError as err:
+        return web.Response(status=web.HTTPBadRequest.status_code, text="incorrect task UUID")
+
+    try:
+        since_version = int(request.query.get('since_version', -1))
+        timeout = min(float(request.query.get('timeout', TaskManager.LONG_POLL_TIMEOUT)),
+                      TaskManager.LONG_POLL_TIMEOUT)
+    except ValueError as err:
+        return web.Response(status=web.HTTPBadRequest.status_code, text=str(err))
+
+    status = await task_manager.wait_task_status(task_uuid, since_version, timeout)
+    if status is None:
+        return web.Response(status=web.HTTPNotFound.status_code, text=f'Task {task_uuid} not found')
+
+    return web.json_response(status)
+
+
+async def log_history(request):
+    """
+    Returns a page of the event log, newest first;
+    the next page is requested with less_than equal to the returned "next"
+    """
+    logger = request.app['logger']
+    try:
+        count = int(request.query.get('count', logger.max_page_size))
+        less_than = int(request.query['less_than']) if 'less_than' in request.query else None
+        filters = logger.parse_filters(request.query)
+    except ValueError as err:
+        return web.Response(status=web.HTTPBadRequest.status_code, text=str(err))
+
+    page = await logger.history(count, less_than, **filters)
+    return web.json_response({'events': page, 'next': page[-1]['id'] if page else None})
+
+
+async def search_log(request):
+    """
+    Full-text search over the event log, the hits are ordered by relevance and paginated by offset
+    """
+    logger = request.app['logger']
+    try:
+        text = request.query['q']
+        count = int(request.query.get('count', logger.max_page_size))
+        offset = int(request.query.get('offset', 0))
+        hits = await logger.search(text, count, offset, **logger.parse_filters(request.query))
+    except KeyError:
+        return web.Response(status=web.HTTPBadRequest.status_code, text='The query argument "q" is required')
+    except ValueError as err:
+        return web.Response(status=web.HTTPBadRequest.status_code, text=str(err))
+
+    return web.json_response({'hits': hits, 'next': offset + len(hits) if len(hits) == count else None})
+
+
+async def stats(request):
+    """
+    Statistics of the finished tasks per scenario and routing key from the hourly or daily rollups
+    """
+    logger = request.app['logger']
+    try:
+        filters = logger.parse_filters(request.query)
+        page = await logger.stats(request.query.get('period', 'hour'),
+                                  scenario=request.query.get('scenario'),
+                                  routing_key=request.query.get('routing_key'),
+                                  since=filters.get('since'), until=filters.get('until'),
+                                  total=request.query.get('total', '0') not in ('0', 'false'))
+    except ValueError as err:
+        return web.Response(status=web.HTTPBadRequest.status_code, text=str(err))
+
+    return web.json_response({'stats': page})
+
+
+async def metrics(request):
+    return web.Response(text=REGISTRY.render(), content_type='text/plain')
+
+
 # async def stop_task(request):
 #     data = await request.json()
 #
@@ -76,8 +227,8 @@ async def run_task_by_id(request, task_id: uuid.UUID):
 
 
 async def on_shutdown(app):
-    for ws in app['websockets']:
-        await ws.close(code=1001, message='Server shutdown')
+    for client in list(app['websockets']):
+        await client.close(code=1001, message=b'Server shutdown')
 
 
 # async def shutdown(server, app, handler):
@@ -106,10 +257,17 @@ def init(scenario_provider: ScenarioProvider):
     # route part
     app.add_routes([
         web.post(SERVICE_CONFIG['task_scheduler_service']['run_task_url'], run_task),
+        web.post(SERVICE_CONFIG['task_scheduler_service'].get('run_tasks_url', '/run_tasks'), run_tasks),
         web.post(SERVICE_CONFIG['task_scheduler_service']['import_road_url'], partial(run_task_by_id, task_id=get_id('road_osm_import'))),
         web.post(SERVICE_CONFIG['task_scheduler_service']['import_fence_url'], partial(run_task_by_id, task_id=get_id('fence_osm_import'))),
         web.post(SERVICE_CONFIG['task_scheduler_service']['import_power_line_url'], partial(run_task_by_id, task_id=get_id('powerline_osm_import'))),
-        web.post(SERVICE_CONFIG['task_scheduler_service']['import_bridge_url'], partial(run_task_by_id, task_id=get_id('bridge_osm_import')))
+        web.post(SERVICE_CONFIG['task_scheduler_service']['import_bridge_url'], partial(run_task_by_id, task_id=get_id('bridge_osm_import'))),
+        web.get(SERVICE_CONFIG['task_scheduler_service'].get('task_status_url', '/tasks/{uuid}'), task_status,
+                name='task_status'),
+        web.get(SERVICE_CONFIG['task_scheduler_service'].get('log_url', '/log'), log_history),
+        web.get(SERVICE_CONFIG['task_scheduler_service'].get('search_url', '/search'), search_log),
+        web.get(SERVICE_CONFIG['task_scheduler_service'].get('stats_url', '/stats'), stats),
+        web.get(SERVICE_CONFIG['task_scheduler_service'].get('metrics_url', '/metrics'), metrics)
     ])
 
     for route in routes:
@@ -139,6 +297,7 @@ if __name__ == '__main__':
         task_manager = TaskManager(SERVICE_CONFIG['task_scheduler_service']['amqp_url'], sp,
                                    edit_lock_manager, logger)
         task_manager.run_in_external_ioloop(web.asyncio.get_event_loop())
+        logger.run_in_loop(web.asyncio.get_event_loop())
 
         the_app['task_manager'] = task_manager
         the_app['logger'] = logger
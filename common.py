@@ -1,5 +1,6 @@
 import uuid
 import json
+import hashlib
 import jsonschema
 from typing import *
 from abc import ABC, abstractmethod
@@ -10,7 +11,7 @@ from backend.task_scheduler_service.schemas import RESPONSE_SCHEMA
 
 
 __all__ = ["TypeList", "ObjectMap", "CellMap",
-           "ResponseStatus", "ResponseObject", "shorten_uuid",
+           "ResponseStatus", "ResponseObject", "shorten_uuid", "payload_fingerprint",
            "TaskManagerInterface", "LockedData", "EditLockManagerInterface", "TaskInterface"]
 
 TypeList = NewType('TypeList', List[Tuple[int, Union[List[int], None]]])
@@ -26,6 +27,10 @@ class ResponseStatus:
     TIMEOUT_ERROR = 3
     CONSUMER_NOT_FOUND_ERROR = 4
 
+    @staticmethod
+    def verbose(status: int):
+        return ['in progress', 'completed', 'failed', 'timeout error', 'consumer not found'][status]
+
 
 class ResponseObject:
 
@@ -57,6 +62,28 @@ def shorten_uuid(_uuid: Union[uuid.UUID, str]):
     return str(_uuid)[0:8]
 
 
+def _canonical_payload_value(key: str, value: Any) -> Any:
+
+    if key == 'cells':
+        return sorted(value)
+    if key in ('locked_cells', 'locked_objects'):
+        return sorted(([type_, subtype_, sorted(items)] for type_, subtype_, items in value),
+                      key=lambda item: (item[0], -1 if item[1] is None else item[1]))
+    return value
+
+
+def payload_fingerprint(namespace: str, payload: Dict[str, Any], ignored_keys=('username', 'task_id')) -> str:
+    """
+    Digest of the task payload; it doesn't depend on the key order, the order of cells and the ignored keys
+    :param namespace: the same payloads of different namespaces (e.g. scenarios) have different digests
+    :param payload: task payload or task input
+    :param ignored_keys: payload keys which don't affect the task result
+    """
+    data = {key: _canonical_payload_value(key, value) for key, value in payload.items() if key not in ignored_keys}
+    text = json.dumps([namespace, data], sort_keys=True)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
 class LockedData:
     def __init__(self, objects: ObjectMap, unlock: Callable[[bool], None]):
         """
@@ -132,6 +159,23 @@ class EditLockManagerInterface(ABC):
         """
         pass
 
+    @abstractmethod
+    def history_watermark(self) -> int:
+        """
+        Return the id of the latest edit history record
+        """
+        pass
+
+    @abstractmethod
+    def edited_cells_since(self, watermark: int) -> Optional[List[quadtree.QCell]]:
+        """
+        Return cells of the edit history records newer than the given watermark,
+        including the records already consumed by the tasks
+        :param watermark: value returned by history_watermark
+        :return: None if the history since the watermark is no longer known
+        """
+        pass
+
 
 class TaskManagerInterface(ABC):
     """
@@ -140,12 +184,33 @@ class TaskManagerInterface(ABC):
     START_TIMEOUT = 3600
     CLOSE_TIMEOUT = 5
     TERMINATE_TIMEOUT = 5
+    """
+    Max number of simultaneously running tasks, 0 means unlimited
+    """
+    MAX_ACTIVE_TASKS = 0
+    """
+    Max number of cached step results and their max age, seconds
+    """
+    STEP_CACHE_SIZE = 1000
+    STEP_CACHE_MAX_AGE = 86400
+    """
+    Max number of the unfinished tasks and max number of ready messages in a consumer queue
+    to accept a new task, 0 means unlimited; the client is asked to retry after RETRY_AFTER seconds
+    """
+    MAX_INFLIGHT_TASKS = 0
+    MAX_QUEUE_BACKLOG = 0
+    RETRY_AFTER = 30
+    """
+    Number of the closed tasks kept for the status requests and max wait time of a status long poll, seconds
+    """
+    CLOSED_TASK_CACHE_SIZE = 1000
+    LONG_POLL_TIMEOUT = 30
 
     class ExecutionError(Exception):
         pass
 
     @abstractmethod
-    def run_request(self, task_uuid: uuid.UUID, routing_key: str):
+    def run_request(self, task_uuid: uuid.UUID, routing_key: str, tile: Optional[Dict[str, float]] = None):
         pass
 
     @abstractmethod
@@ -184,7 +249,18 @@ class TaskInterface(ABC):
         pass
 
     @abstractmethod
-    def make_task_input(self) -> TaskInputInterface:
+    def make_task_input(self, tile: Optional[Dict[str, float]] = None) -> TaskInputInterface:
+        pass
+
+    @abstractmethod
+    def tiles(self) -> List[Dict[str, float]]:
+        """
+        Tiles of the input rect processed concurrently, empty if the rect is processed as a whole
+        """
+        pass
+
+    @abstractmethod
+    def has_locked_data(self) -> bool:
         pass
 
     @abstractmethod
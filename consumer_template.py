@@ -0,0 +1,11 @@
+"""
+The last module preloaded by the consumer template, the forkserver process the consumers are forked from.
+The objects of the consumer modules imported before are moved to the permanent generation,
+so the garbage collector of the forked consumers doesn't touch them and their pages stay shared copy-on-write.
+Must not be imported by the RPC server itself
+"""
+import gc
+
+
+gc.collect()
+gc.freeze()
@@ -1,3 +1,4 @@
+import threading
 from datetime import datetime
 from typing import *
 from PluginEngine import UseDatabase, Log, quadtree
@@ -30,12 +31,23 @@ class HistoryRow:
 
 class EditLockManager(EditLockManagerInterface):
 
+    """
+    Max number of the consumed (deleted) edit history records remembered for edited_cells_since
+    """
+    MAX_CONSUMED_EDITS = 100000
+
     def __init__(self, db_handler: BackendDBHandler):
 
         self._db_handler = db_handler
         self._lock_id = 0
         self._cell_history = []
         self._table = ['edit_history_transient']
+        #  Append-only log of the records deleted by the completed tasks: (id, qtree_id) sorted by deletion
+        self._consumed_edits: List[Tuple[int, int]] = []
+        #  The records with greater ids have never been forgotten
+        self._consumed_floor = 0
+        self._consumed_max = 0
+        self._consumed_lock = threading.Lock()
 
         with UseDatabase(self._db_handler.connection_config()) as cursor:
 
@@ -52,6 +64,33 @@ class EditLockManager(EditLockManagerInterface):
         self.sync()
         return LockedObjects([], lambda x: None)
 
+    def history_watermark(self) -> int:
+
+        with UseDatabase(self._db_handler.connection_config()) as cursor:
+
+            _SQL = f"""SELECT COALESCE(MAX(id), 0) FROM {self._table[0]}"""
+            cursor.execute(_SQL)
+            watermark = cursor.fetchone()[0]
+
+        with self._consumed_lock:
+            return max(watermark, self._consumed_max)
+
+    def edited_cells_since(self, watermark: int) -> Optional[List[quadtree.QCell]]:
+
+        with UseDatabase(self._db_handler.connection_config()) as cursor:
+
+            _SQL = f"""SELECT DISTINCT qtree_id FROM {self._table[0]} WHERE id > {int(watermark)}"""
+            cursor.execute(_SQL)
+            qtree_ids = {row[0] for row in cursor}
+
+        #  Read after the table: a record is logged before its deletion is committed, so none is missed
+        with self._consumed_lock:
+            if watermark < self._consumed_floor:
+                return None
+            qtree_ids.update(qtree_id for edit_id, qtree_id in self._consumed_edits if edit_id > watermark)
+
+        return [quadtree.make_cell_by_raw_index(qtree_id + MINIMUM_BIGINT_VALUE) for qtree_id in qtree_ids]
+
     def _lock_cells(self, obj_types: TypeList) -> LockedCells:
 
         self._lock_id += 1
@@ -104,12 +143,27 @@ SELECT * FROM {self._table[0]} WHERE id IN (SELECT id FROM updated)
         with UseDatabase(self._db_handler.connection_config()) as cursor:
 
             if completed:
-                _SQL = f"""DELETE FROM {self._table[0]} WHERE lock_id = {lock_id}"""
+                _SQL = f"""DELETE FROM {self._table[0]} WHERE lock_id = {lock_id} RETURNING id, qtree_id"""
+                cursor.execute(_SQL)
+                self._log_consumed_edits(cursor.fetchall())
 
             else:
                 _SQL = f"""UPDATE {self._table[0]} SET lock_id = 0 WHERE lock_id = {lock_id}"""
-
-            cursor.execute(_SQL)
+                cursor.execute(_SQL)
+
+    def _log_consumed_edits(self, rows: List[Tuple[int, int]]):
+        """
+        The deleted records stay visible to edited_cells_since, so the step cache isn't fooled by the edits
+        consumed by another task; the oldest records are forgotten beyond MAX_CONSUMED_EDITS
+        """
+        with self._consumed_lock:
+            self._consumed_edits.extend(rows)
+            self._consumed_max = max([self._consumed_max] + [edit_id for edit_id, _ in rows])
+            overflow = len(self._consumed_edits) - self.MAX_CONSUMED_EDITS
+            if overflow > 0:
+                self._consumed_floor = max([self._consumed_floor] +
+                                           [edit_id for edit_id, _ in self._consumed_edits[:overflow]])
+                del self._consumed_edits[:overflow]
 
 
     def _log_cell_history(self, log_level=Log.TRACE):
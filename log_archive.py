@@ -0,0 +1,152 @@
+import os
+import gzip
+import json
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from functools import lru_cache
+from typing import *
+
+
+__all__ = ['LogArchive', 'Segment']
+
+
+class Segment(NamedTuple):
+    """
+    Index entry of the archive segment: the file name, the id and the creation time ranges of its events
+    """
+    name: str
+    min_id: int
+    max_id: int
+    since: datetime
+    until: datetime
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'name': self.name, 'min_id': self.min_id, 'max_id': self.max_id,
+                'since': self.since.isoformat(), 'until': self.until.isoformat()}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Segment':
+        return cls(data['name'], data['min_id'], data['max_id'],
+                   datetime.fromisoformat(data['since']), datetime.fromisoformat(data['until']))
+
+
+@lru_cache(maxsize=8)
+def _read_segment(path: str) -> List[Dict[str, Any]]:
+    # the segments are never changed once written, so the decoded ones are cached by path
+    with gzip.open(path, 'rt', encoding='utf-8') as file:
+        return [json.loads(line) for line in file]
+
+
+@lru_cache(maxsize=8)
+def _segment_ids(path: str) -> List[int]:
+    return [row['id'] for row in _read_segment(path)]
+
+
+class LogArchive:
+    """
+    Append-only archive of the old events: every segment is a gzipped JSON lines file
+    with the events sorted by id, the index of the segments is kept in a separate JSON file
+    replaced atomically after the segment is written
+    """
+
+    INDEX_FILE = 'index.json'
+
+    def __init__(self, directory: str):
+        self._directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._segments: List[Segment] = self._load_index()
+
+    def segments(self) -> List[Segment]:
+        return list(self._segments)
+
+    def last_segment(self) -> Optional[Segment]:
+        return self._segments[-1] if self._segments else None
+
+    def max_id(self) -> int:
+        """
+        :return: the greatest archived id, 0 if the archive is empty
+        """
+        with self._lock:
+            return max((segment.max_id for segment in self._segments), default=0)
+
+    def append(self, rows: List[Dict[str, Any]]) -> Segment:
+        """
+        Writes the rows to a new segment
+        :param rows: the events with id, created, username, event_type, status and data fields
+        """
+        rows = sorted(rows, key=lambda row: row['id'])
+        created = [row['created'] for row in rows]
+        name = f'events_{rows[0]["id"]}_{rows[-1]["id"]}.jsonl.gz'
+        segment = Segment(name, rows[0]['id'], rows[-1]['id'], min(created), max(created))
+
+        path = os.path.join(self._directory, name)
+        with gzip.open(path + '.tmp', 'wt', encoding='utf-8') as file:
+            for row in rows:
+                file.write(json.dumps(dict(row, created=row['created'].isoformat())) + '\n')
+        os.replace(path + '.tmp', path)
+
+        with self._lock:
+            self._segments.append(segment)
+            self._save_index()
+        return segment
+
+    def read(self, segment: Segment) -> List[Dict[str, Any]]:
+        return _read_segment(os.path.join(self._directory, segment.name))
+
+    def query(self, num_rows: int, less_than: Optional[int] = None, greater_than: Optional[int] = None,
+              username: Optional[str] = None, event_type: Optional[int] = None, status: Optional[int] = None,
+              since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """
+        Loads the events with the greatest ids matching the filters, newest first;
+        only the segments overlapping the id and time ranges are read
+        :param greater_than: the least id of the loaded events must be greater than the given arg
+        :return: the event data with created and id fields, like EventDescriptor.to_dict
+        """
+        with self._lock:
+            segments = sorted(self._segments, key=lambda item: item.max_id, reverse=True)
+
+        found = []
+        for segment in segments:
+            if len(found) >= num_rows and segment.max_id < found[num_rows - 1]['id']:
+                break  # the rest segments have only older events
+            if less_than is not None and segment.min_id >= less_than or \
+                    greater_than is not None and segment.max_id <= greater_than or \
+                    since is not None and segment.until < since or \
+                    until is not None and segment.since >= until:
+                continue
+
+            #  The rows are sorted by id, so only the id range is scanned
+            path = os.path.join(self._directory, segment.name)
+            rows, ids = _read_segment(path), _segment_ids(path)
+            begin = bisect_right(ids, greater_than) if greater_than is not None else 0
+            end = bisect_left(ids, less_than) if less_than is not None else len(ids)
+            for row in rows[begin:end]:
+                if username is not None and row['username'] != username or \
+                        event_type is not None and row['event_type'] != event_type or \
+                        status is not None and row['status'] != status or \
+                        since is not None and datetime.fromisoformat(row['created']) < since or \
+                        until is not None and datetime.fromisoformat(row['created']) >= until:
+                    continue
+                found.append(row)
+            found.sort(key=lambda row: row['id'], reverse=True)
+            del found[num_rows:]
+
+        return [dict(row['data'], id=row['id'], created=str(datetime.fromisoformat(row['created'])))
+                for row in found[:num_rows]]
+
+    def _load_index(self) -> List[Segment]:
+
+        path = os.path.join(self._directory, self.INDEX_FILE)
+        if not os.path.exists(path):
+            return []
+        with open(path, encoding='utf-8') as file:
+            return [Segment.from_dict(item) for item in json.load(file)]
+
+    def _save_index(self):
+
+        path = os.path.join(self._directory, self.INDEX_FILE)
+        with open(path + '.tmp', 'w', encoding='utf-8') as file:
+            json.dump([segment.to_dict() for segment in self._segments], file)
+        os.replace(path + '.tmp', path)
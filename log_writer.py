@@ -0,0 +1,160 @@
+import threading
+from time import time
+from typing import *
+from collections import OrderedDict
+from peewee import Database, Model, Field
+from PluginEngine import Log, LogLevel
+from backend.task_scheduler_service.metrics import REGISTRY, SIZE_BUCKETS
+
+
+__all__ = ['LogWriter']
+
+
+FLUSH_TIME = REGISTRY.histogram('task_scheduler_log_flush_seconds', 'Time of saving a batch of events to the DB')
+FLUSH_BATCH_SIZE = REGISTRY.histogram('task_scheduler_log_flush_batch_size', 'Number of events saved at once',
+                                      buckets=SIZE_BUCKETS)
+DROPPED_ROWS = REGISTRY.counter('task_scheduler_log_dropped_rows_total', 'Events dropped on the full write queue')
+
+
+class LogWriter:
+    """
+    Write-behind saving of the event log: the rows are put to the pending set without waiting
+    and inserted by the writer thread in batches limited by size and time.
+    With conflict_target the rows are upserted: a pending row with the same key is replaced by the latest one,
+    so the keyed rows are never dropped and take one place per key; only the rows without the key are dropped
+    when max_queue_size of them are pending
+    """
+
+    def __init__(self, database: Database, model: Type[Model], batch_size: int, flush_interval: float,
+                 max_queue_size: int, conflict_target: Optional[Field] = None, preserve: Sequence[Field] = ()):
+        """
+        :param batch_size: max number of rows inserted at once
+        :param flush_interval: max time a row waits for the batch to fill, seconds
+        :param max_queue_size: max number of the pending rows without the key
+        :param conflict_target: unique field identifying the updated rows, None means the rows are only inserted
+        :param preserve: fields updated on the conflict
+        """
+        self._database = database
+        self._model = model
+        self._conflict_target = conflict_target
+        self._preserve = list(preserve)
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._max_queue_size = max_queue_size
+        #  The rows by key in the order of their last put, the value is (sequence number, row)
+        self._pending: 'OrderedDict[Hashable, Tuple[int, Dict[str, Any]]]' = OrderedDict()
+        self._unkeyed_count = 0
+        self._put_seq = 0
+        self._saved_seq = 0
+        self._flush_requested = False
+        self._stopping = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='task_logger_writer', daemon=True)
+        REGISTRY.gauge('task_scheduler_log_queue_depth', 'Events waiting to be saved', self.queue_depth)
+
+    def start(self):
+        self._thread.start()
+
+    def put(self, row: Dict[str, Any]) -> bool:
+        """
+        :return: False if the row without the key has been dropped as too many of them are pending
+        """
+        key = self._key(row)
+        with self._condition:
+            if key is None:
+                if self._unkeyed_count >= self._max_queue_size:
+                    DROPPED_ROWS.inc()
+                    return False
+                self._unkeyed_count += 1
+            self._put_seq += 1
+            if key is None:
+                key = ('row', self._put_seq)
+            else:
+                self._pending.pop(key, None)
+            self._pending[key] = (self._put_seq, row)
+            self._condition.notify_all()
+        return True
+
+    def queue_depth(self) -> int:
+        return len(self._pending)
+
+    def flush(self):
+        """
+        Blocks until the rows put before the call are saved, the later rows are not waited for
+        """
+        with self._condition:
+            barrier = self._put_seq
+            self._flush_requested = True
+            self._condition.notify_all()
+            self._condition.wait_for(lambda: self._saved_seq >= barrier or not self._thread.is_alive())
+
+    def close(self):
+        """
+        Saves the pending rows and stops the writer thread
+        """
+        if self._thread.is_alive():
+            with self._condition:
+                self._stopping = True
+                self._condition.notify_all()
+            self._thread.join()
+
+    def _run(self):
+
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or self._stopping)
+                if not self._pending:
+                    break
+                #  The batch waits to be filled unless the rows are flushed
+                deadline = time() + self._flush_interval
+                self._condition.wait_for(
+                    lambda: len(self._pending) >= self._batch_size or self._flush_requested or self._stopping,
+                    timeout=max(0.0, deadline - time()))
+                batch = [self._pending.popitem(last=False)[1] for _ in range(min(self._batch_size,
+                                                                                 len(self._pending)))]
+                self._unkeyed_count -= sum(1 for _, row in batch if self._key(row) is None)
+                if not self._pending:
+                    self._flush_requested = False
+
+            try:
+                self._save([row for _, row in batch])
+            except Exception as err:
+                Log.error(f'Event log writer error: {err}')
+            finally:
+                #  The pending rows are ordered by the sequence number, so the batch ends with the greatest one
+                with self._condition:
+                    self._saved_seq = batch[-1][0]
+                    self._condition.notify_all()
+
+    def _key(self, row: Dict[str, Any]) -> Optional[Hashable]:
+        return row.get(self._conflict_target.name) if self._conflict_target is not None else None
+
+    def _save(self, rows: List[Dict[str, Any]]):
+
+        begin = time()
+        try:
+            with self._database.connection_context():
+                with self._database.atomic():
+                    query = self._model.insert_many(rows)
+                    if self._conflict_target is not None:
+                        query = query.on_conflict(conflict_target=[self._conflict_target], preserve=self._preserve)
+                    query.execute()
+        except Exception as err:
+            Log.error(f'Failed to save {len(rows)} events: {err}')
+            return
+
+        save_time = time() - begin
+        FLUSH_TIME.observe(save_time)
+        FLUSH_BATCH_SIZE.observe(len(rows))
+        self._log_stat(len(rows), save_time)
+
+    def _log_stat(self, row_count: int, save_time: float, log_level=LogLevel.TRACE):
+
+        if Log.get_log_level() <= log_level:
+            Log.log_message(log_level, f"""
+------------------------------------
+{row_count} events have been saved to db
+{self.queue_depth()} events are waiting
+save time: {save_time * 1000} ms
+------------------------------------
+""", Log.CONSOLE)
@@ -0,0 +1,135 @@
+from bisect import bisect_left
+from typing import *
+
+
+__all__ = ['Counter', 'Gauge', 'Histogram', 'MetricsRegistry', 'REGISTRY', 'LATENCY_BUCKETS', 'SIZE_BUCKETS']
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+SIZE_BUCKETS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+def _format_labels(label_names: Tuple[str, ...], values: Tuple[Any, ...], extra: str = '') -> str:
+
+    items = [f'{name}="{value}"' for name, value in zip(label_names, values)]
+    if extra:
+        items.append(extra)
+    return '{' + ','.join(items) + '}' if items else ''
+
+
+class Counter:
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values: Dict[Tuple[Any, ...], float] = {}
+
+    def inc(self, *labels, value: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + value
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        for labels, value in self._values.items():
+            lines.append(f'{self.name}{_format_labels(self.label_names, labels)} {value}')
+        return lines
+
+
+class Gauge:
+    """
+    The value is taken from the callback at the moment of rendering
+    """
+
+    def __init__(self, name: str, help_text: str, callback: Callable[[], float]):
+        self.name = name
+        self.help_text = help_text
+        self._callback = callback
+
+    def render(self) -> List[str]:
+        return [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} gauge',
+                f'{self.name} {self._callback()}']
+
+
+class Histogram:
+
+    class Series:
+
+        __slots__ = ('counts', 'sum', 'count')
+
+        def __init__(self, bucket_count: int):
+            self.counts = [0] * bucket_count
+            self.sum = 0.0
+            self.count = 0
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[Any, ...], Histogram.Series] = {}
+
+    def observe(self, value: float, *labels):
+
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = self.Series(len(self.buckets) + 1)
+
+        # the last counter is the +Inf bucket; the counts are made cumulative on rendering
+        series.counts[bisect_left(self.buckets, value)] += 1
+        series.sum += value
+        series.count += 1
+
+    def count(self, *labels) -> int:
+        series = self._series.get(labels)
+        return series.count if series else 0
+
+    def render(self) -> List[str]:
+
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for labels, series in self._series.items():
+            total = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series.counts):
+                total += count
+                le = f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.label_names, labels, le)} {total}')
+            lines.append(f'{self.name}_sum{_format_labels(self.label_names, labels)} {series.sum}')
+            lines.append(f'{self.name}_count{_format_labels(self.label_names, labels)} {series.count}')
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Metrics of the process rendered in the Prometheus text exposition format
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Union[Counter, Gauge, Histogram]] = {}
+
+    def counter(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()) -> Counter:
+        return self._add(Counter(name, help_text, label_names))
+
+    def gauge(self, name: str, help_text: str, callback: Callable[[], float]) -> Gauge:
+        # the callback is bound to a live object, so the latest registration wins
+        self._metrics[name] = Gauge(name, help_text, callback)
+        return self._metrics[name]
+
+    def histogram(self, name: str, help_text: str, label_names: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help_text, label_names, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def _add(self, metric):
+        # re-registering returns the existing metric, so the modules may be reloaded safely
+        return self._metrics.setdefault(metric.name, metric)
+
+
+REGISTRY = MetricsRegistry()
@@ -0,0 +1,93 @@
+import asyncio
+import pika
+import pika.exceptions
+from typing import *
+from PluginEngine import Log
+
+
+__all__ = ['QueueDepthMonitor']
+
+
+class QueueDepthMonitor:
+    """
+    Periodically reads the number of ready messages of the consumer queues with passive queue_declare;
+    the blocking AMQP calls are made in the executor on a dedicated connection.
+    With the exchange given the queues are declared and bound like the consumers do,
+    so the requests wait in the queue while no consumer is running
+    """
+
+    POLL_INTERVAL_SEC = 2.0
+
+    def __init__(self, amqp_url: str, queue_names: Dict[str, str], exchange: Optional[str] = None):
+        """
+        :param queue_names: queue name by routing key
+        :param exchange: the exchange to bind the declared queues to, None means the queues are not declared
+        """
+        self._amqp_url = amqp_url
+        self._queue_names = queue_names
+        self._exchange = exchange
+        self._depths: Dict[str, int] = {}
+        self._connection = None
+        self._channel = None
+        self._running = False
+
+    def depth(self, routing_key: str) -> int:
+        """
+        :return: last known number of the ready messages, 0 if unknown
+        """
+        return self._depths.get(routing_key, 0)
+
+    def run_in_loop(self, loop):
+        self._running = True
+        loop.create_task(self._poll(loop))
+
+    def stop(self):
+        self._running = False
+
+    async def _poll(self, loop):
+
+        while self._running:
+            try:
+                self._depths = await loop.run_in_executor(None, self._read_depths)
+            except Exception as err:
+                Log.warn(f'Failed to read queue depths: {err}')
+                self._close_connection()
+
+            await asyncio.sleep(self.POLL_INTERVAL_SEC)
+
+        self._close_connection()
+
+    def _read_depths(self) -> Dict[str, int]:
+
+        depths = {}
+        for routing_key, queue_name in self._queue_names.items():
+            if self._channel is None or self._channel.is_closed:
+                self._open_channel()
+            try:
+                if self._exchange is None:
+                    frame = self._channel.queue_declare(queue=queue_name, passive=True)
+                else:
+                    #  The same arguments as the consumers declare the queue with
+                    frame = self._channel.queue_declare(queue=queue_name, durable=False)
+                    self._channel.queue_bind(exchange=self._exchange, queue=queue_name, routing_key=routing_key)
+                depths[routing_key] = frame.method.message_count
+            except pika.exceptions.ChannelClosedByBroker:
+                # The queue is not declared yet: no consumer has been started (or the exchange is not declared)
+                depths[routing_key] = 0
+        return depths
+
+    def _open_channel(self):
+
+        if self._connection is None or self._connection.is_closed:
+            self._connection = pika.BlockingConnection(pika.URLParameters(self._amqp_url))
+        self._channel = self._connection.channel()
+
+    def _close_connection(self):
+
+        if self._connection is not None and self._connection.is_open:
+            try:
+                self._connection.close()
+            except Exception as err:
+                Log.warn(f'Failed to close queue monitor connection: {err}')
+        self._connection = None
+        self._channel = None
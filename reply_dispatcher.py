@@ -0,0 +1,190 @@
+import math
+import uuid
+import asyncio
+from typing import *
+from collections import deque
+from PluginEngine.asserts import require
+
+
+__all__ = ['TimerWheel', 'ReplyDispatcher']
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel: a timer is hashed into a slot by its expiration tick,
+    so scheduling and cancelling cost O(1) and a single periodic tick serves every timer
+    """
+
+    def __init__(self, tick_sec: float, slot_count: int):
+
+        require(tick_sec > 0.0 and slot_count > 0)
+        self._tick_sec = tick_sec
+        self._slots: List[Dict[Hashable, int]] = [{} for _ in range(slot_count)]
+        self._slot_of: Dict[Hashable, int] = {}
+        self._current_tick = None
+
+    def __len__(self):
+        return len(self._slot_of)
+
+    def __contains__(self, key: Hashable):
+        return key in self._slot_of
+
+    def schedule(self, key: Hashable, deadline: float):
+        """
+        (Re)schedules the timer of the given key
+        :param key: timer key
+        :param deadline: expiration time, the same clock as passed to advance() must be used
+        """
+        self.cancel(key)
+
+        tick = int(math.ceil(deadline / self._tick_sec))
+        if self._current_tick is not None:
+            tick = max(tick, self._current_tick + 1)
+
+        slot = tick % len(self._slots)
+        self._slots[slot][key] = tick
+        self._slot_of[key] = slot
+
+    def cancel(self, key: Hashable):
+
+        slot = self._slot_of.pop(key, None)
+        if slot is not None:
+            del self._slots[slot][key]
+
+    def advance(self, now: float) -> List[Hashable]:
+        """
+        Moves the wheel to the given time
+        :return: keys of the expired timers, they are removed from the wheel
+        """
+        target_tick = int(now / self._tick_sec)
+        if self._current_tick is None:
+            self._current_tick = target_tick - 1
+
+        expired = []
+        step_count = min(target_tick - self._current_tick, len(self._slots))
+
+        for step in range(1, step_count + 1):
+            slot = self._slots[(self._current_tick + step) % len(self._slots)]
+            due = [key for key, tick in slot.items() if tick <= target_tick]
+            for key in due:
+                del slot[key]
+                del self._slot_of[key]
+            expired.extend(due)
+
+        self._current_tick = max(self._current_tick, target_tick)
+        return expired
+
+
+class ReplyDispatcher:
+    """
+    Routes RPC replies to the coroutines waiting for them;
+    reply timeouts of all the pending requests are tracked by one timer wheel
+    """
+
+    TICK_SEC = 1.0
+    SLOT_COUNT = 512
+
+    class PendingRequest:
+
+        __slots__ = ('replies', 'waiter', 'timeout', 'deadline')
+
+        def __init__(self, timeout: float, deadline: float):
+            self.replies = deque()
+            self.waiter = None
+            self.timeout = timeout
+            self.deadline = deadline
+
+    def __init__(self):
+        self._io_loop = None
+        self._requests: Dict[uuid.UUID, ReplyDispatcher.PendingRequest] = {}
+        self._wheel = TimerWheel(self.TICK_SEC, self.SLOT_COUNT)
+
+    def __contains__(self, request_id: uuid.UUID):
+        return request_id in self._requests
+
+    def __len__(self):
+        return len(self._requests)
+
+    def run_in_loop(self, io_loop: asyncio.AbstractEventLoop):
+        self._io_loop = io_loop
+        self._io_loop.call_later(self.TICK_SEC, self._on_tick)
+
+    def register(self, request_id: uuid.UUID, timeout: float):
+        """
+        Starts waiting for replies of the given request
+        :param timeout: max time between two replies, seconds
+        """
+        require(self._io_loop is not None)
+        require(request_id not in self._requests)
+        deadline = self._io_loop.time() + timeout
+        self._requests[request_id] = self.PendingRequest(timeout, deadline)
+        self._wheel.schedule(request_id, deadline)
+
+    def unregister(self, request_id: uuid.UUID):
+
+        req = self._requests.pop(request_id, None)
+        if req is None:
+            return
+        self._wheel.cancel(request_id)
+        if req.waiter is not None and not req.waiter.done():
+            req.waiter.cancel()
+
+    def set_timeout(self, request_id: uuid.UUID, timeout: float):
+        """
+        Changes the reply timeout and restarts the countdown
+        """
+        req = self._requests[request_id]
+        req.timeout = timeout
+        req.deadline = self._io_loop.time() + timeout
+        self._wheel.schedule(request_id, req.deadline)
+
+    def dispatch(self, request_id: uuid.UUID, reply: Any) -> bool:
+        """
+        Passes the reply to the coroutine waiting for it
+        :return: whether the request is known
+        """
+        req = self._requests.get(request_id)
+        if req is None:
+            return False
+
+        # The wheel entry is not touched: an expired entry is rescheduled lazily on the tick
+        req.deadline = self._io_loop.time() + req.timeout
+        if req.waiter is not None and not req.waiter.done():
+            req.waiter.set_result(reply)
+        else:
+            req.replies.append(reply)
+        return True
+
+    async def get(self, request_id: uuid.UUID) -> Any:
+        """
+        Returns the next reply of the request;
+        raises asyncio.TimeoutError if no reply has come within the request timeout
+        """
+        req = self._requests[request_id]
+        if req.replies:
+            return req.replies.popleft()
+
+        req.waiter = self._io_loop.create_future()
+        try:
+            return await req.waiter
+        finally:
+            req.waiter = None
+
+    # protected
+    def _on_tick(self):
+
+        now = self._io_loop.time()
+
+        for request_id in self._wheel.advance(now):
+
+            req = self._requests[request_id]
+            if req.deadline > now:
+                self._wheel.schedule(request_id, req.deadline)
+                continue
+
+            req.deadline = now + req.timeout
+            self._wheel.schedule(request_id, req.deadline)
+            if req.waiter is not None and not req.waiter.done():
+                req.waiter.set_exception(asyncio.TimeoutError())
+
+        self._io_loop.call_later(self.TICK_SEC, self._on_tick)
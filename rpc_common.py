@@ -6,6 +6,7 @@ https://pymotw.com/3/asyncio/executors.html
 """
 
 
+import os
 import uuid
 import time
 import json
@@ -13,7 +14,7 @@ import jsonschema
 import asyncio
 from typing import *
 from enum import Enum
-from multiprocessing import Pipe
+from multiprocessing import Pipe, RawValue
 from multiprocessing.connection import Connection, wait
 from PluginEngine import Log
 from PluginEngine.common import empty_uuid
@@ -25,7 +26,7 @@ from backend.task_scheduler_service.scenario_common import Scenario, ExecutableN
 
 class CMDTypeEnum:
 
-    OK, CLOSE_TASK, NOTIFY_TASK_CLOSED, LOAD_LOG, TERMINATE_TASK = __list = range(5)
+    OK, CLOSE_TASK, NOTIFY_TASK_CLOSED, LOAD_LOG, TERMINATE_TASK, RESYNC, SEARCH = __list = range(7)
 
     def __iter__(self):
         return self.__list.__iter__()
@@ -64,6 +65,17 @@ CMD_WAIT_TIMEOUT_SEC = 0.002
 CMD_SLEEP_SEC = 0.02
 
 
+def current_rss() -> Optional[int]:
+    """
+    Resident set size of the current process in bytes, None if unknown (no procfs)
+    """
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
 class CMDHandlerMock:
 
     def __init__(self, conn: Connection):
@@ -78,13 +90,21 @@ class CMDHandlerMock:
     def notify_task_closed(self):
         pass
 
+    def is_retire_requested(self):
+        return False
+
 
 class CMDHandler:
+    """
+    Consumer side of the CMD channel: the task open/close handshake goes through the pipe,
+    the close and retire requests are read from the flags in the shared memory set by CMDManager
+    """
 
-    def __init__(self, conn: Connection):
+    def __init__(self, conn: Connection, close_flag: 'RawValue', retire_flag: 'RawValue'):
         self._conn = conn
+        self._close_flag = close_flag
+        self._retire_flag = retire_flag
         self._task_started = False
-        self._close_requested = False
         self._task_uuid = empty_uuid
 
     def try_open_task(self, task_uuid: uuid.UUID) -> bool:
@@ -107,21 +127,24 @@ class CMDHandler:
         """
         Whether the task close has been requested by server;
         can only be used after the try_open_task has been called;
-        blocks the execution for CMD_WAIT_TIMEOUT_SEC seconds
+        doesn't block: the flag is set by CMDManager for the opened task and reset on the handshake
         """
         require(self._task_started)
+        return bool(self._close_flag.value)
 
-        if not self._close_requested:
-            self._close_requested = self._wait_reply_timed_out() == CMDType.CLOSE_TASK
-
-        return self._close_requested
+    def is_retire_requested(self):
+        """
+        Whether the process should stop consuming and exit: the pool of the consumers is being scaled down
+        or the process is to be recycled
+        """
+        return bool(self._retire_flag.value)
 
     def notify_task_closed(self):
         """
-        Waits until the server replied
+        Reports the resident set size of the process and waits until the server replied
         """
         self._reset()
-        self._conn.send(str(self._task_uuid))
+        self._conn.send([str(self._task_uuid), current_rss()])
         self._wait_reply()
         Log.trace(f'CMDHandler ({shorten_uuid(self._task_uuid)}): task has been closed')
 
@@ -135,39 +158,52 @@ class CMDHandler:
 
         return rsp[0]
 
-    def _wait_reply_timed_out(self):
-
-        rsp = (0, 0)
-        while rsp[1] != str(self._task_uuid):
-
-            if self._conn.poll(timeout=CMD_WAIT_TIMEOUT_SEC * 10.0):
-                rsp = self._conn.recv()
-                Log.trace(f'CMDHandler ({shorten_uuid(self._task_uuid)}): got message: {rsp}')
-            else:
-                return None
-
-        return rsp[0]
-
     def _reset(self):
 
         self._task_uuid = empty_uuid
         self._task_started = False
-        self._close_requested = False
 
 
 class CMDManager:
 
     class ProcessDescriptor:
 
-        def __init__(self, conn: Connection):
+        def __init__(self, conn: Connection, close_flag: 'RawValue', retire_flag: 'RawValue',
+                     max_tasks: int, max_rss_mb: int):
             self.conn = conn
+            self.close_flag = close_flag
+            self.retire_flag = retire_flag
             self.task_uuid = empty_uuid
             self.close_requested = False
+            self.idle_since = time.monotonic()
+            self.max_tasks = max_tasks
+            self.max_rss_mb = max_rss_mb
+            self.task_count = 0
+            self.rss = None
+            self.recycle_reason = None
+
+        def check_limits(self):
+            """
+            Called when a task is closed: the process is recycled once it has run max_tasks tasks
+            or its resident set has grown to max_rss_mb, the retire flag stops it before the next task
+            """
+            if self.max_tasks and self.task_count >= self.max_tasks:
+                self.recycle_reason = f'{self.task_count} tasks'
+            elif self.max_rss_mb and self.rss is not None and self.rss >= self.max_rss_mb * 2 ** 20:
+                self.recycle_reason = f'RSS {self.rss / 2 ** 20:.0f} MB'
+            if self.recycle_reason:
+                self.retire_flag.value = 1
+
+        def set_close_requested(self, close_requested: bool):
+
+            self.close_requested = close_requested
+            self.close_flag.value = int(close_requested)
 
         def reset_task(self):
 
             self.task_uuid = empty_uuid
-            self.close_requested = False
+            self.set_close_requested(False)
+            self.idle_since = time.monotonic()
 
         def __str__(self):
             return f'uuid: {shorten_uuid(self.task_uuid)}, close requested: {self.close_requested}'
@@ -177,6 +213,7 @@ class CMDManager:
         self._processes = {}
         self._tasks_id_to_process_id = {}
         self._close_requests = set()
+        self._loop = None  # the loop watching the pipes, None if the pipes are polled
 
     def close_request(self, task_uuid: uuid.UUID):
         require(isinstance(task_uuid, uuid.UUID))
@@ -189,15 +226,15 @@ class CMDManager:
         # Task is already consuming
         else:
             process = self._processes[self._tasks_id_to_process_id[task_uuid]]
-            if not process.close_requested:
-                process.close_requested = True
-                process.conn.send([CMDType.CLOSE_TASK, str(task_uuid)])
+            process.set_close_requested(True)
         self._log_close_info()
 
     def terminate_request(self, req_uuid: uuid.UUID):
         require(isinstance(req_uuid, uuid.UUID))
         if req_uuid in self._tasks_id_to_process_id:
             proc_id = self._tasks_id_to_process_id[req_uuid]
+            #  The consumer may still stop by itself while the process is being terminated
+            self._processes[proc_id].set_close_requested(True)
             self._rpc_server.terminate_process(proc_id)
             self._unregister_task(proc_id)
             self._remove_cmd_handler(proc_id)
@@ -205,15 +242,25 @@ class CMDManager:
                 ResponseObject(str(req_uuid), ResponseStatus.FAILED, 1.0, 'Process has been terminated'))
         self._log_close_info()
 
-    def create_cmd_handler(self, process_id: int):
+    def create_cmd_handler(self, process_id: int, max_tasks: int = 0, max_rss_mb: int = 0):
+        """
+        :param max_tasks: the process is recycled after the given number of tasks, 0 means no limit
+        :param max_rss_mb: the process is recycled after a task if its RSS reached the limit, 0 means no limit
+        """
         require(process_id not in self._processes)
 
         parent_conn, child_conn = Pipe()
-        self._processes[process_id] = self.ProcessDescriptor(parent_conn)
+        #  The bytes without a lock: only CMDManager writes them, the consumer only reads them
+        close_flag = RawValue('b', 0)
+        retire_flag = RawValue('b', 0)
+        self._processes[process_id] = self.ProcessDescriptor(parent_conn, close_flag, retire_flag,
+                                                             max_tasks, max_rss_mb)
 
         parent_conn.process_id = process_id  # TODO: ?
+        if self._loop:
+            self._add_reader(process_id)
 
-        return CMDHandler(child_conn)
+        return CMDHandler(child_conn, close_flag, retire_flag)
 
     def notify_process_is_broken(self, process_id: int):
         if process_id in self._processes:
@@ -225,19 +272,78 @@ class CMDManager:
             self._unregister_task(process_id)
             self._remove_cmd_handler(process_id)
 
+    def idle_since(self, process_id: int) -> Optional[float]:
+        """
+        :return: time.monotonic() of the last task close or of the process start, None if the process has a task
+        """
+        return self._processes[process_id].idle_since
+
+    def recycle_reason(self, process_id: int) -> Optional[str]:
+        """
+        :return: the limit the process has reached, None if the process is not to be recycled
+        """
+        process = self._processes.get(process_id)
+        return process.recycle_reason if process is not None else None
+
+    def retire_process(self, process_id: int):
+        """
+        Asks the consumer to exit once it has no task
+        """
+        self._processes[process_id].retire_flag.value = 1
+
+    def release_process(self, process_id: int):
+        """
+        Forgets the process which has exited
+        """
+        if process_id in self._processes:
+            self._unregister_task(process_id)
+            self._remove_cmd_handler(process_id)
+
     def cancel_close_request(self, task_uuid: uuid.UUID):
         self._close_requests.discard(task_uuid)
         self._log_close_info()
 
     def run_in_loop(self, io_loop: asyncio.AbstractEventLoop):
-        io_loop.create_task(self._poll_coro())
+        """
+        Handles the messages of the consumers as soon as they arrive: the pipes are watched by the selector loop
+        on POSIX; otherwise (the proactor loop, the Windows pipe handles select() can't take)
+        they are polled every CMD_SLEEP_SEC.
+        The choice doesn't depend on the pipes existing at the start, the pools may start empty
+        """
+        if os.name != 'posix' or not isinstance(io_loop, asyncio.SelectorEventLoop):
+            Log.info('CMDManager: the event loop can not watch the pipes, the consumer pipes are polled')
+            io_loop.create_task(self._poll_coro())
+            return
+
+        self._loop = io_loop
+        for process_id in self._processes:
+            self._add_reader(process_id)
 
     # protected
     def _remove_cmd_handler(self, process_id: int):
         require(process_id in self._processes)
+        if self._loop:
+            self._loop.remove_reader(self._processes[process_id].conn.fileno())
         self._processes[process_id].conn.close()
         del self._processes[process_id]
 
+    def _add_reader(self, process_id: int):
+        self._loop.add_reader(self._processes[process_id].conn.fileno(), self._on_readable, process_id)
+
+    def _on_readable(self, process_id: int):
+
+        process = self._processes.get(process_id)
+        if process is None:
+            return
+
+        try:
+            while process_id in self._processes and process.conn.poll():
+                self._poll(process.conn)
+        except EOFError as err:
+            # The closed pipe stays readable, so it is no longer watched until the process is restarted
+            self._loop.remove_reader(process.conn.fileno())
+            Log.warn(f'Process {process_id} connection is broken: {err}')
+
     async def _poll_coro(self):
 
         while True:
@@ -262,6 +368,8 @@ class CMDManager:
         process = self._processes[conn.process_id]
 
         msg = process.conn.recv()
+        #  The close message also carries the resident set size of the consumer
+        msg, rss = msg if isinstance(msg, list) else (msg, None)
         task_uuid = uuid.UUID(msg)
 
         Log.trace(f'CMDManager got message from {conn.process_id}th consumer: {msg}')
@@ -270,15 +378,21 @@ class CMDManager:
 
             require(task_uuid not in self._tasks_id_to_process_id)
 
+            #  The flag is set before the reply, so the consumer never reads the flag of the previous task
+            self._register_task(conn.process_id, task_uuid)
             if task_uuid not in self._close_requests:
+                process.set_close_requested(False)
                 process.conn.send([CMDType.OK, str(task_uuid)])
             else:
+                process.set_close_requested(True)
                 process.conn.send([CMDType.CLOSE_TASK, str(task_uuid)])
 
-            self._register_task(conn.process_id, task_uuid)
-
         else:
 
+            #  The limits are checked before the reply, so the consumer sees the flag before the next message
+            process.task_count += 1
+            process.rss = rss
+            process.check_limits()
             process.conn.send([CMDType.OK, str(empty_uuid)])
             self._unregister_task(conn.process_id)
 
@@ -286,6 +400,7 @@ class CMDManager:
 
         process = self._processes[process_id]
         process.task_uuid = task_uuid
+        process.idle_since = None
         self._tasks_id_to_process_id[task_uuid] = process_id
         self._log_close_info()
         self._log_process_info()
@@ -345,6 +460,7 @@ class RPCBase:
     CMD_ROUTING_KEY = 'rpc_manager_cmd'
 
     PREFETCH_COUNT = 1
+    RETIRE_CHECK_SEC = 1.0
 
 
 class RPCRegistry(RPCBase):
@@ -390,6 +506,13 @@ class RPCRegistry(RPCBase):
     def heartbit_timeout(cls, routing_key: str):
         return cls._known_consumers[routing_key].heartbit_timeout()
 
+    @classmethod
+    def queue_names(cls) -> Dict[str, str]:
+        """
+        :return: name of the consumer queue by routing key
+        """
+        return {routing_key: class_.get_queue_name() for routing_key, class_ in cls._known_consumers.items()}
+
 
 class ReplyCallbackInterface:
 
@@ -427,6 +550,11 @@ class RPCData:
         self.progress = progress
         self.status = status
         self.message = message
+        self.created = time.time()
+        self.started = None  # the time of the first reply
+        self.finished = None
+        self.close_requested = False
+        self.terminate_requested = False
 
     def set_in_progress(self):
         if self.status is RPCStatus.WAITING:
@@ -434,7 +562,9 @@ class RPCData:
 
     def set_completed(self):
         self.status = RPCStatus.COMPLETED
+        self.finished = time.time()
 
     def set_failed(self):
         self.status = RPCStatus.FAILED
+        self.finished = time.time()
 
@@ -82,6 +82,7 @@ class RPCConsumer(RPCBase, RPCConsumerInterface):
         self._input = None
 
         self._task_is_opened = False
+        self._in_callback = False
         self._progress = 0.0
         self._failed = False
         self._message = ""
@@ -195,6 +196,7 @@ class RPCConsumer(RPCBase, RPCConsumerInterface):
 
     def _callback(self, ch, method, properties, body):
         try:
+            self._in_callback = True
 
             #  First of all update vars
             self._ch = ch
@@ -249,6 +251,11 @@ class RPCConsumer(RPCBase, RPCConsumerInterface):
             else:
                 self._publish_error()
             self._cmd_handler.notify_task_closed()
+            self._in_callback = False
+            if self._cmd_handler.is_retire_requested():
+                #  The message is acked at the start, so the broker may have delivered the next one during the task;
+                #  stop_consuming rejects the undispatched deliveries, they are requeued for the other consumers
+                self._channel.stop_consuming()
 
     def _check_close_requested(self):
         if self.is_close_requested():
@@ -280,7 +287,19 @@ class RPCConsumer(RPCBase, RPCConsumerInterface):
                                  routing_key=self.get_routing_key())
         self._channel.basic_qos(prefetch_count=self.PREFETCH_COUNT)
         self._channel.basic_consume(queue=self.get_queue_name(), on_message_callback=self._callback, auto_ack=False)
+        self._connection.call_later(self.RETIRE_CHECK_SEC, self._check_retire_requested)
         self._channel.start_consuming()
+        self._connection.close()
+        Log.info(f'{self.get_routing_key()} consumer {input_.instance_id} has stopped consuming')
+
+    def _check_retire_requested(self):
+        """
+        Stops consuming while idle if the pool is scaled down, the unacknowledged messages are requeued
+        """
+        if self._cmd_handler.is_retire_requested() and not self._in_callback:
+            self._channel.stop_consuming()
+        else:
+            self._connection.call_later(self.RETIRE_CHECK_SEC, self._check_retire_requested)
 
 
 class GeneratorAdapter(RPCConsumer):
@@ -1,9 +1,11 @@
 import asyncio
+import gc
 import time
 import uuid
 import json
 import jsonschema
 import pika
+import multiprocessing
 from typing import *
 from multiprocessing import Process
 from PluginEngine import Log
@@ -15,13 +17,21 @@ from backend.task_scheduler_service.common import ResponseObject
 from backend.task_scheduler_service.rpc_common import RPCBase, RPCRegistry, RPCData, RPCStatus, \
     RPCErrorCallbackInterface, RPCManagerCMD, CMDManager, CMDType
 from backend.task_scheduler_service.rpc_consumer import RPCConsumerInput
+from backend.task_scheduler_service.queue_monitor import QueueDepthMonitor
 
 
 class RPCConsumerData:
 
-    def __init__(self, routing_key: str, instance_count: int):
+    def __init__(self, routing_key: str, min_instances: int, max_instances: int,
+                 max_tasks_per_process: int = 0, max_rss_mb: int = 0):
         self.routing_key = routing_key
-        self.instance_count = instance_count
+        self.min_instances = min_instances
+        self.max_instances = max_instances
+        self.max_tasks_per_process = max_tasks_per_process
+        self.max_rss_mb = max_rss_mb
+
+    def autoscaled(self) -> bool:
+        return self.max_instances > self.min_instances
 
 
 class ProcessContainer:
@@ -39,6 +49,26 @@ class RPCManager(RPCRegistry):
     STOP_WAIT_SEC = 10
     PROCESS_RESTART_DELAY = 1
 
+    """
+    Max number of the consumer processes of the server, 0 means no limit
+    """
+    MAX_PROCESSES = 0
+
+    """
+    Autoscaling: the pool grows if its queue has had messages for SCALE_UP_WAIT_SEC with all the processes busy
+    (at once if the pool is empty); an idle process is retired after SCALE_DOWN_IDLE_SEC
+    """
+    SCALE_UP_WAIT_SEC = 5.0
+    SCALE_DOWN_IDLE_SEC = 300.0
+
+    """
+    Where the consumer processes are spawned by default, they are forked from a template process
+    with all the registered consumers preloaded (forkserver) instead of importing them every time;
+    where the default is fork, the server itself is the template
+    """
+    PREFORK = True
+    TEMPLATE_MODULE = 'backend.task_scheduler_service.consumer_template'
+
     class Request:
 
         def __init__(self):
@@ -66,18 +96,36 @@ class RPCManager(RPCRegistry):
 
         # Server variables
         self._consumers: List[RPCConsumerData] = []
-        self._processes: List[ProcessContainer] = []
+        self._processes: Dict[int, ProcessContainer] = {}
+        self._next_process_id = 0
+        self._retiring: Set[int] = set()
+        self._backlog_since: Dict[str, float] = {}
+        self._queue_monitor = None
+        self._mp_context = multiprocessing.get_context()
         self._cmd_consumer = None
         self._cmd_manager = None
         self._closing = False
 
     #  Server interface
-    def add_consumer(self, routing_key: str, instance_count: int):
-
+    def add_consumer(self, routing_key: str, instance_count: int, max_instance_count: Optional[int] = None,
+                     max_tasks_per_process: int = 0, max_rss_mb: int = 0):
+        """
+        :param instance_count: number of the processes, the least one if the pool is autoscaled; may be 0
+        :param max_instance_count: the pool is autoscaled up to the given number of processes
+        :param max_tasks_per_process: a process is replaced by a fresh one after the given number of tasks,
+        0 means no limit
+        :param max_rss_mb: a process is replaced by a fresh one after the task its RSS reached the limit at,
+        0 means no limit; ignored without procfs
+        """
         require(self._regime == RPCManager.SERVER)
         require(not self._running)
         require(routing_key in self._known_consumers, f'unknown consumer: {routing_key}')
-        self._consumers.append(RPCConsumerData(routing_key, instance_count))
+        max_instance_count = instance_count if max_instance_count is None else max_instance_count
+        require(0 <= instance_count <= max_instance_count and max_instance_count > 0,
+                f'incorrect number of {routing_key} instances: {instance_count}..{max_instance_count}')
+        require(max_tasks_per_process >= 0 and max_rss_mb >= 0)
+        self._consumers.append(RPCConsumerData(routing_key, instance_count, max_instance_count,
+                                               max_tasks_per_process, max_rss_mb))
 
     # Client interface
     def request(self, routing_key: str, task_input: TaskInputInterface) -> RPCData:
@@ -173,14 +221,14 @@ class RPCManager(RPCRegistry):
         num_failed = 0
 
         # -- Wait up to STOP_WAIT_SECS for all processes to complete
-        for item in self._processes:
+        for item in self._processes.values():
             join_secs = max(0.0, min(end_time - time.time(), self.STOP_WAIT_SEC))
             item.process.join(join_secs)
 
         # -- Clear the procs list and _terminate_ any procs that
         # have not yet exited
         while self._processes:
-            item = self._processes.pop()
+            _, item = self._processes.popitem()
             if item.process.is_alive():
                 item.process.terminate()
                 num_terminated += 1
@@ -193,38 +241,95 @@ class RPCManager(RPCRegistry):
 
         return num_failed, num_terminated
 
+    def _create_mp_context(self):
+        """
+        The template process is started with the first consumer, it imports the consumer modules once
+        and freezes the garbage collector, the consumers are forked from it
+        """
+        if not self.PREFORK or multiprocessing.get_start_method() == 'fork':
+            return multiprocessing.get_context()
+        if 'forkserver' not in multiprocessing.get_all_start_methods():
+            Log.info('forkserver is not supported, the consumer processes are started without the template')
+            return multiprocessing.get_context()
+
+        context = multiprocessing.get_context('forkserver')
+        modules = sorted({class_.__module__ for class_ in self._known_consumers.values()} | {__name__})
+        context.set_forkserver_preload(modules + [self.TEMPLATE_MODULE])
+        return context
+
     def _create_process(self, routing_key: str, proc_id: int, instance_id: int):
 
+        consumer_data = next(item for item in self._consumers if item.routing_key == routing_key)
         return ProcessContainer(
-            process=Process(target=RPCManager._run_consumer,
+            process=self._mp_context.Process(target=RPCManager._run_consumer,
                             args=(self._known_consumers[routing_key],
                                   RPCConsumerInput(
                                       self._amqp_url,
                                       instance_id,
-                                      self._cmd_manager.create_cmd_handler(process_id=proc_id)))),
+                                      self._cmd_manager.create_cmd_handler(
+                                          process_id=proc_id,
+                                          max_tasks=consumer_data.max_tasks_per_process,
+                                          max_rss_mb=consumer_data.max_rss_mb)))),
             routing_key=routing_key,
             instance_id=instance_id
         )
 
-    def _restart_process(self, proc_id: int):
+    def _start_process(self, routing_key: str):
+
+        used_ids = {item.instance_id for item in self._processes.values() if item.routing_key == routing_key}
+        instance_id = next(i for i in range(len(used_ids) + 1) if i not in used_ids)
+        proc_id = self._next_process_id
+        self._next_process_id += 1
+        self._processes[proc_id] = self._create_process(routing_key, proc_id, instance_id)
+        self._start(self._processes[proc_id].process)
+
+    def _start(self, process: Process):
+        """
+        A forked consumer inherits the objects of the server frozen, so its garbage collector doesn't touch them
+        and their pages stay shared copy-on-write; the server unfreezes them at once
+        """
+        if self._mp_context.get_start_method() != 'fork':
+            process.start()
+            return
+
+        gc.freeze()
+        try:
+            process.start()
+        finally:
+            gc.unfreeze()
+
+    def _restart_process(self, proc_id: int, recycle_reason: Optional[str] = None):
         item = self._processes[proc_id]
         require(not item.process.is_alive())
         self._cmd_manager.notify_process_is_broken(proc_id)
+        start_time = time.perf_counter()
         self._processes[proc_id] = self._create_process(item.routing_key, proc_id, item.instance_id)
-        self._processes[proc_id].process.start()
-        Log.warn(f'Process: {item.routing_key}, instance {item.instance_id} has been restarted')
+        self._start(self._processes[proc_id].process)
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+        if recycle_reason:
+            Log.info(f'Process: {item.routing_key}, instance {item.instance_id} has been recycled '
+                     f'after {recycle_reason} in {elapsed_ms:.1f} ms')
+        else:
+            Log.warn(f'Process: {item.routing_key}, instance {item.instance_id} has been restarted '
+                     f'in {elapsed_ms:.1f} ms')
 
     def _run_server(self) -> (bool, str):
 
         require(self._regime == RPCManager.SERVER)
         self._cmd_manager = CMDManager(self)
         #  Here we implement the most easiest solution - blocking consuming
-        self._processes = []
+        self._processes = {}
+        self._mp_context = self._create_mp_context()
         for consumer_data in self._consumers:
-            for instance_id in range(consumer_data.instance_count):
-                self._processes.append(
-                    self._create_process(consumer_data.routing_key, len(self._processes), instance_id))
-                self._processes[-1].process.start()
+            #  The first pool also waits for the template to import the consumers
+            start_time = time.perf_counter()
+            for _ in range(consumer_data.min_instances):
+                self._start_process(consumer_data.routing_key)
+            Log.info(f'{consumer_data.routing_key} pool: {consumer_data.min_instances} processes have been started '
+                     f'in {(time.perf_counter() - start_time) * 1000:.1f} ms '
+                     f'({self._mp_context.get_start_method()})')
+        if self.MAX_PROCESSES and len(self._processes) > self.MAX_PROCESSES:
+            Log.warn(f'The least numbers of the consumers exceed the process budget {self.MAX_PROCESSES}')
 
         #  Starting command queue(async)
         self._cmd_consumer = SchedulerAsyncConsumer(self._amqp_url, self._on_cmd_message)
@@ -240,6 +345,14 @@ class RPCManager(RPCRegistry):
         self._cmd_manager.run_in_loop(loop)
         asyncio.get_event_loop().create_task(self._keep_processes_running())
 
+        autoscaled = {item.routing_key: self._known_consumers[item.routing_key].get_queue_name()
+                      for item in self._consumers if item.autoscaled()}
+        if autoscaled:
+            #  The queues are declared by the server, so the requests wait for the pool scaled down to zero
+            self._queue_monitor = QueueDepthMonitor(self._amqp_url, autoscaled, exchange=self.EXCHANGE)
+            self._queue_monitor.run_in_loop(loop)
+            loop.create_task(self._autoscale())
+
         try:
             loop.run_forever()
         except Exception as ex:
@@ -276,12 +389,70 @@ class RPCManager(RPCRegistry):
     async def _keep_processes_running(self):
 
         while not self._closing:
-            for proc_id, item in enumerate(self._processes):
-                if not item.process.is_alive():
-                    self._restart_process(proc_id)
+            for proc_id, item in list(self._processes.items()):
+                if item.process.is_alive():
+                    continue
+                if proc_id in self._retiring:
+                    self._retiring.discard(proc_id)
+                    self._cmd_manager.release_process(proc_id)
+                    del self._processes[proc_id]
+                    Log.info(f'Process: {item.routing_key}, instance {item.instance_id} has been retired')
+                else:
+                    self._restart_process(proc_id, self._cmd_manager.recycle_reason(proc_id))
 
             await asyncio.sleep(RPCManager.PROCESS_RESTART_DELAY)
 
+    async def _autoscale(self):
+
+        while not self._closing:
+            now = time.monotonic()
+            for consumer_data in self._consumers:
+                if consumer_data.autoscaled():
+                    self._scale(consumer_data, self._queue_monitor.depth(consumer_data.routing_key), now)
+
+            await asyncio.sleep(QueueDepthMonitor.POLL_INTERVAL_SEC)
+
+        self._queue_monitor.stop()
+
+    def _scale(self, consumer_data: RPCConsumerData, depth: int, now: float):
+        """
+        Adds the processes to the pool having a backlog or retires the processes idle for SCALE_DOWN_IDLE_SEC;
+        the time of the backlog stands for the time the messages spend in the queue
+        """
+        routing_key = consumer_data.routing_key
+        proc_ids = [proc_id for proc_id, item in self._processes.items()
+                    if item.routing_key == routing_key and proc_id not in self._retiring]
+        idle_since = {proc_id: self._cmd_manager.idle_since(proc_id) for proc_id in proc_ids}
+        idle_ids = [proc_id for proc_id, since in idle_since.items() if since is not None]
+
+        if depth > 0:
+            backlog_since = self._backlog_since.setdefault(routing_key, now)
+            if len(proc_ids) >= consumer_data.max_instances:
+                return
+            if proc_ids and (idle_ids or now - backlog_since < self.SCALE_UP_WAIT_SEC):
+                return
+
+            budget = self.MAX_PROCESSES - len(self._processes) if self.MAX_PROCESSES else depth
+            count = min(consumer_data.max_instances - len(proc_ids), depth, budget)
+            if count <= 0:
+                Log.warn(f'{routing_key} has {depth} waiting requests, but the process budget is exhausted')
+                return
+            start_time = time.perf_counter()
+            for _ in range(count):
+                self._start_process(routing_key)
+            #  The next step waits for the new processes to take the backlog
+            self._backlog_since[routing_key] = now
+            Log.info(f'{routing_key} pool has been scaled up to {len(proc_ids) + count} processes '
+                     f'in {(time.perf_counter() - start_time) * 1000:.1f} ms')
+
+        else:
+            self._backlog_since.pop(routing_key, None)
+            retired = [proc_id for proc_id in idle_ids if now - idle_since[proc_id] >= self.SCALE_DOWN_IDLE_SEC]
+            for proc_id in retired[:len(proc_ids) - consumer_data.min_instances]:
+                self._cmd_manager.retire_process(proc_id)
+                self._retiring.add(proc_id)
+                Log.info(f'{routing_key} process {proc_id} is being retired')
+
     def _on_cmd_message(self, body, correlation_id):
         try:
             cmd = RPCManagerCMD.from_json(json.loads(body))
@@ -10,10 +10,19 @@ logging.disable(level=logging.INFO)
 LOGGER = logging.getLogger('RPC server')
 
 
-def parse_input() -> dict:
+def parse_input() -> (dict, argparse.Namespace):
     parser = argparse.ArgumentParser(description='Starts RPC server (a pool of specified consumers and a controller')
     parser.add_argument('--consumers', '-c', type=str, nargs='+', required=True,
-                        help='list of pairs (known consumer )')
+                        help='list of pairs (known consumer, instance count); the count given as min:max '
+                             'makes the pool autoscaled, e.g. road_generator 0:4')
+    parser.add_argument('--max-processes', type=int, default=0,
+                        help='max number of the consumer processes, 0 means no limit')
+    parser.add_argument('--max-tasks-per-process', type=int, default=0,
+                        help='a consumer process is replaced by a fresh one after the given number of tasks, '
+                             '0 means no limit')
+    parser.add_argument('--max-rss-mb', type=int, default=0,
+                        help='a consumer process is replaced by a fresh one once its RSS reaches the limit, '
+                             '0 means no limit')
     args = parser.parse_args()
 
     result = {}
@@ -23,22 +32,26 @@ def parse_input() -> dict:
     for i in range(0, consumer_count, 2):
         if args.consumers[i] in result:
             raise ValueError()
-        result[args.consumers[i]] = int(args.consumers[i + 1])
+        counts = args.consumers[i + 1].split(':')
+        if len(counts) > 2:
+            raise ValueError()
+        result[args.consumers[i]] = (int(counts[0]), int(counts[-1]))
 
     # Log.set_log_level(Log.INFO)
     # if args.log_level is not None:
     #     Log_dict = {'trace': Log.TRACE, 'debug': Log.DEBUG, 'info': Log.INFO, 'warning': Log.WARN, 'error': Log.ERROR}
     #     Log.set_log_level(Log_dict[args.log_level])
 
-    return result
+    return result, args
 
 
 def run_server():
 
-    consumers = parse_input()
+    consumers, args = parse_input()
+    RPCManager.MAX_PROCESSES = args.max_processes
     manager = RPCManager(regime=RPCManager.SERVER, amqp_url=SERVICE_CONFIG['task_scheduler_service']['amqp_url'])
-    for name, count in consumers.items():
-        manager.add_consumer(name, count)
+    for name, (min_count, max_count) in consumers.items():
+        manager.add_consumer(name, min_count, max_count, args.max_tasks_per_process, args.max_rss_mb)
 
     LOGGER.warning('Server is ready')
     manager.run()
@@ -155,6 +155,15 @@ class ExecutableNode:
         else:
             return f'<{name} {self._properties_str()}/>'
 
+    def routing_keys(self) -> Set[str]:
+        """
+        Routing keys of all the run nodes of the subtree
+        """
+        result = set()
+        for child in self:
+            result.update(child.routing_keys())
+        return result
+
     async def execute(self, task: TaskInterface) -> bool:
         raise NotImplementedError
 
@@ -164,6 +173,9 @@ class Scenario(ExecutableNode):
         ExecutableNode.__init__(self)
         self._name = name
         self._input_type = None
+        self._deduplicate = False
+        self._step_cache = True
+        self._tile_size = None
 
     def _properties_str(self) -> str:
         return f'name="{self.name()}", input={self.input_type()}'
@@ -177,6 +189,33 @@ class Scenario(ExecutableNode):
     def input_type(self) -> Union[int, None]:
         return self._input_type
 
+    def set_deduplicate(self, enabled: bool):
+        self._deduplicate = enabled
+
+    def deduplicate(self) -> bool:
+        """
+        Whether a submission identical to a running task is attached to it instead of being run again
+        """
+        return self._deduplicate
+
+    def set_step_cache(self, enabled: bool):
+        self._step_cache = enabled
+
+    def step_cache(self) -> bool:
+        """
+        Whether a step may be completed from the results of the same step run on the same input
+        """
+        return self._step_cache
+
+    def set_tile_size(self, tile_size: Union[float, None]):
+        self._tile_size = tile_size
+
+    def tile_size(self) -> Union[float, None]:
+        """
+        Max width and height of the input rect, degrees; a larger rect is split into tiles processed concurrently
+        """
+        return self._tile_size
+
     def check_input(self, payload: Dict[str, Any]) -> (bool, str):
 
         if self._input_type == ScenarioProviderBase.InputType.RECT:
@@ -256,5 +295,15 @@ class Run(ExecutableNode):
     def _properties_str(self):
         return f'routing-key="{self.routing_key}"'
 
+    def routing_keys(self) -> Set[str]:
+        return {self.routing_key}
+
     async def execute(self, task: TaskInterface):
-        return await task.task_manager().run_request(task.uuid(), self.routing_key)
+
+        tiles = task.tiles()
+        if not tiles or task.has_locked_data():
+            # The locked cells and objects can't be shared between the tiles
+            return await task.task_manager().run_request(task.uuid(), self.routing_key)
+
+        threads = list(task.task_manager().run_request(task.uuid(), self.routing_key, tile) for tile in tiles)
+        return False not in await asyncio.gather(*threads)
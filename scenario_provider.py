@@ -64,6 +64,8 @@ class ScenarioProvider(ScenarioProviderBase):
             raise self.ParseError('Duplicate notify binding: {}'.format(node.attrib['notify']))
 
         scenario = Scenario(name)
+        scenario.set_deduplicate(self._parse_bool(node.attrib, 'deduplicate', default=False))
+        scenario.set_step_cache(self._parse_bool(node.attrib, 'step_cache', default=True))
         for child in node:
             self._parse_tag(child, scenario)
 
@@ -84,6 +86,14 @@ class ScenarioProvider(ScenarioProviderBase):
 
         return None, f'Unknown scenario {task_id}'
 
+    def get_routing_keys(self, task_id: uuid.UUID) -> Set[str]:
+        """
+        Routing keys used by the scenario without copying it
+        """
+        if task_id in self._scenarios:
+            return self._scenarios[task_id].routing_keys()
+        return set()
+
     def get_task_id_by_notification(self, notify: str) -> Union[uuid.UUID, None]:
         return self._notify_bindings.get(notify, None)
 
@@ -93,6 +103,16 @@ class ScenarioProvider(ScenarioProviderBase):
     def notifications(self):
         return self._notify_bindings.keys()
 
+    @classmethod
+    def _parse_bool(cls, attrib: dict, name: str, default: bool) -> bool:
+
+        if name not in attrib:
+            return default
+        value = attrib[name].lower()
+        if value not in ('true', 'false'):
+            raise cls.ParseError(f'Attribute "{name}" must be "true" or "false"')
+        return value == 'true'
+
     @staticmethod
     def _create_locker(attrib: dict):
 
@@ -118,6 +138,17 @@ class ScenarioProvider(ScenarioProviderBase):
 
             parent.set_input_type(self.input_type_map[input_type])
 
+            if 'tile_size' in elem.attrib:
+                if parent.input_type() != self.InputType.RECT:
+                    raise self.ParseError('attribute "tile_size" is only allowed for the "rect" input')
+                try:
+                    tile_size = float(elem.attrib['tile_size'])
+                except ValueError:
+                    raise self.ParseError(f'Invalid tile size: {elem.attrib["tile_size"]}')
+                if tile_size <= 0.0:
+                    raise self.ParseError('Tile size must be positive')
+                parent.set_tile_size(tile_size)
+
         elif elem.tag in ('concurrent', 'consequent'):
 
             if not isinstance(parent, GroupExecution) and not isinstance(parent, Scenario):
@@ -15,6 +15,37 @@ RUN_TASK_SCHEMA = {
 }
 
 
+RUN_TASKS_SCHEMA = {
+    "$schema": "http://json-schema.org/schema#",
+    "type": "object",
+    "properties": {
+        "username": USERNAME_PROPERTY,
+        "task_id": {
+            "type": "string",
+            "length": 36,
+        },
+        "tasks": {
+            "type": "array",
+            "items": RUN_TASK_SCHEMA
+        },
+        "rects": {
+            "type": "array",
+            "items": {"type": "object"}
+        },
+        "cells": {
+            "type": "array",
+            "items": {"type": "array"}
+        }
+    },
+
+    "oneOf": [
+        {"required": ["tasks"]},
+        {"required": ["username", "task_id", "rects"]},
+        {"required": ["username", "task_id", "cells"]}
+    ]
+}
+
+
 RESPONSE_SCHEMA = {
     "$schema": "http://json-schema.org/schema#",
     "type": "object",
@@ -63,6 +94,30 @@ CMD_MESSAGE_SCHEMA = {
         "type": "number"
     },
 
+    "offset": {
+        "type": "number"
+    },
+
+    "query": {
+        "type": "string"
+    },
+
+    "event_type": {
+        "type": "number"
+    },
+
+    "status": {
+        "type": "number"
+    },
+
+    "since": {
+        "type": "string"
+    },
+
+    "until": {
+        "type": "string"
+    },
+
     "username": USERNAME_PROPERTY,
 
     "required": ["cmd"]
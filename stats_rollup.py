@@ -0,0 +1,120 @@
+import json
+from bisect import bisect_left
+from datetime import datetime
+from typing import *
+from backend.task_scheduler_service.metrics import LATENCY_BUCKETS
+
+
+__all__ = ['PERIODS', 'StatsSample', 'RollupStats', 'bucket_start']
+
+
+"""
+Rollup periods: the statistics are kept for every hour and every day
+"""
+PERIODS = ('hour', 'day')
+
+
+class StatsSample(NamedTuple):
+    """
+    Outcome of a finished task (routing_key is empty) or of its step
+    """
+    scenario: str
+    routing_key: str
+    finished: float
+    duration: Optional[float]
+    failed: bool
+    closed: bool
+    terminated: bool
+
+
+def bucket_start(timestamp: float, period: str) -> datetime:
+
+    moment = datetime.fromtimestamp(timestamp)
+    if period == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    elif period == 'day':
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f'Unknown rollup period: {period}')
+
+
+class RollupStats:
+    """
+    Counters of one rollup bucket; the durations are kept as a histogram over LATENCY_BUCKETS,
+    so the buckets are merged by adding and the percentiles are estimated without the raw samples
+    """
+
+    def __init__(self, count: int = 0, failed: int = 0, closed: int = 0, terminated: int = 0,
+                 duration_sum: float = 0.0, duration_max: float = 0.0, histogram: Optional[List[int]] = None):
+        self.count = count
+        self.failed = failed
+        self.closed = closed
+        self.terminated = terminated
+        self.duration_sum = duration_sum
+        self.duration_max = duration_max
+        self.histogram = histogram or [0] * (len(LATENCY_BUCKETS) + 1)
+
+    @classmethod
+    def from_fields(cls, fields: Dict[str, Any]) -> 'RollupStats':
+        return cls(fields['count'], fields['failed'], fields['closed'], fields['terminated'],
+                   fields['duration_sum'], fields['duration_max'], json.loads(fields['histogram']))
+
+    def to_fields(self) -> Dict[str, Any]:
+        return {'count': self.count, 'failed': self.failed, 'closed': self.closed, 'terminated': self.terminated,
+                'duration_sum': self.duration_sum, 'duration_max': self.duration_max,
+                'histogram': json.dumps(self.histogram)}
+
+    def add(self, sample: StatsSample):
+
+        self.count += 1
+        self.failed += sample.failed
+        self.closed += sample.closed
+        self.terminated += sample.terminated
+        if sample.duration is not None:
+            self.duration_sum += sample.duration
+            self.duration_max = max(self.duration_max, sample.duration)
+            self.histogram[bisect_left(LATENCY_BUCKETS, sample.duration)] += 1
+
+    def merge(self, other: 'RollupStats'):
+
+        self.count += other.count
+        self.failed += other.failed
+        self.closed += other.closed
+        self.terminated += other.terminated
+        self.duration_sum += other.duration_sum
+        self.duration_max = max(self.duration_max, other.duration_max)
+        self.histogram = [a + b for a, b in zip(self.histogram, other.histogram)]
+
+    def percentile(self, q: float) -> Optional[float]:
+        """
+        Estimates the duration percentile by linear interpolation inside the histogram bucket
+        :param q: 0..1
+        :return: None if no duration has been recorded
+        """
+        total = sum(self.histogram)
+        if not total:
+            return None
+
+        rank = q * total
+        cumulative = 0
+        for i, count in enumerate(self.histogram):
+            if count and cumulative + count >= rank:
+                lower = LATENCY_BUCKETS[i - 1] if i > 0 else 0.0
+                upper = LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else self.duration_max
+                return min(lower + (upper - lower) * (rank - cumulative) / count, self.duration_max)
+            cumulative += count
+        return self.duration_max
+
+    def summary(self) -> Dict[str, Any]:
+
+        timed = sum(self.histogram)
+        return {
+            'count': self.count,
+            'failed': self.failed,
+            'failure_rate': self.failed / self.count if self.count else 0.0,
+            'closed': self.closed,
+            'terminated': self.terminated,
+            'mean_duration': self.duration_sum / timed if timed else None,
+            'max_duration': self.duration_max if timed else None,
+            'p50_duration': self.percentile(0.5),
+            'p95_duration': self.percentile(0.95)
+        }
@@ -0,0 +1,66 @@
+from time import time
+from typing import *
+from collections import OrderedDict
+
+
+__all__ = ['StepResultCache']
+
+
+class StepResultCache:
+    """
+    Results of the completed scenario steps keyed by routing key and task input fingerprint;
+    each result remembers the edit history watermark at the moment the step completed
+    """
+
+    class Entry:
+
+        __slots__ = ('watermark', 'message', 'created')
+
+        def __init__(self, watermark: int, message: str):
+            self.watermark = watermark
+            self.message = message
+            self.created = time()
+
+    def __init__(self, max_size: int, max_age_sec: float):
+        """
+        :param max_size: max number of the stored results, 0 disables the cache
+        :param max_age_sec: results older than this are evicted
+        """
+        self._max_size = max_size
+        self._max_age_sec = max_age_sec
+        self._entries: 'OrderedDict[Tuple[str, str], StepResultCache.Entry]' = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def enabled(self) -> bool:
+        return self._max_size > 0
+
+    def get(self, routing_key: str, fingerprint: str) -> Union['StepResultCache.Entry', None]:
+
+        key = (routing_key, fingerprint)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        if time() - entry.created > self._max_age_sec:
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, routing_key: str, fingerprint: str, watermark: int, message: str):
+
+        if not self.enabled():
+            return
+
+        key = (routing_key, fingerprint)
+        self._entries.pop(key, None)
+        self._entries[key] = self.Entry(watermark, message)
+
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+    def discard(self, routing_key: str, fingerprint: str):
+        self._entries.pop((routing_key, fingerprint), None)
@@ -0,0 +1,185 @@
+from typing import *
+from collections import namedtuple
+from PluginEngine import quadtree
+from PluginEngine.quadtree import make_cell_by_raw_index
+
+
+__all__ = ['BoundBox', 'TaskArea', 'SpatialIndex', 'cell_bound_box', 'split_rect']
+
+
+class BoundBox(namedtuple('BoundBox', 'lon_min, lon_max, lat_min, lat_max')):
+
+    @classmethod
+    def from_rect(cls, rect: Dict[str, float]):
+        return cls(rect['lon_min'], rect['lon_max'], rect['lat_min'], rect['lat_max'])
+
+    def to_rect(self) -> Dict[str, float]:
+        return self._asdict()
+
+    def intersects(self, other: 'BoundBox') -> bool:
+        """
+        Whether the boxes overlap; the boxes sharing only a border don't
+        """
+        return self.lon_min < other.lon_max and other.lon_min < self.lon_max and \
+            self.lat_min < other.lat_max and other.lat_min < self.lat_max
+
+    def width(self) -> float:
+        return self.lon_max - self.lon_min
+
+    def height(self) -> float:
+        return self.lat_max - self.lat_min
+
+
+"""
+Max power of the rect subdivision, i.e. a rect is split into at most 4 ** MAX_SPLIT_POWER tiles
+"""
+MAX_SPLIT_POWER = 5
+
+
+def split_rect(rect: Dict[str, float], tile_size: float) -> List[Dict[str, float]]:
+    """
+    Splits the rect into 4 ** n equal tiles, n is the least power making the tiles fit into tile_size
+    :param tile_size: max width and height of the tile, degrees
+    :return: empty list if the rect already fits
+    """
+    box = BoundBox.from_rect(rect)
+    div_pow = 0
+    while max(box.width(), box.height()) / 2 ** div_pow > tile_size and div_pow < MAX_SPLIT_POWER:
+        div_pow += 1
+
+    if div_pow == 0:
+        return []
+
+    n = 2 ** div_pow
+    step_lon = box.width() / n
+    step_lat = box.height() / n
+    tiles = []
+    for i in range(n):
+        for j in range(n):
+            # the last row and column take the exact border of the rect to leave no gaps
+            tiles.append(BoundBox(box.lon_min + j * step_lon,
+                                  box.lon_max if j == n - 1 else box.lon_min + (j + 1) * step_lon,
+                                  box.lat_min + i * step_lat,
+                                  box.lat_max if i == n - 1 else box.lat_min + (i + 1) * step_lat).to_rect())
+    return tiles
+
+
+def cell_bound_box(cell: quadtree.QCell) -> BoundBox:
+
+    bl0 = quadtree.GeoVector()
+    bl1 = quadtree.GeoVector()
+    cell.get_bound_box(bl0, bl1)
+    return BoundBox(bl0.lon, bl1.lon, bl0.lat, bl1.lat)
+
+
+class TaskArea:
+    """
+    Geographic area of the task input: the rect and/or the cells
+    """
+
+    def __init__(self, boxes: List[BoundBox]):
+        self._boxes = boxes
+
+    @classmethod
+    def from_payload(cls, payload: Dict[str, Any]) -> Union['TaskArea', None]:
+        """
+        :return: None if the payload has neither rect nor cells
+        """
+        boxes = []
+        if payload.get('rect'):
+            boxes.append(BoundBox.from_rect(payload['rect']))
+        if payload.get('cells'):
+            boxes.extend(cell_bound_box(make_cell_by_raw_index(index)) for index in payload['cells'])
+
+        return cls(boxes) if boxes else None
+
+    def boxes(self) -> List[BoundBox]:
+        return self._boxes
+
+    def intersects_box(self, box: BoundBox) -> bool:
+        return any(item.intersects(box) for item in self._boxes)
+
+    def intersects(self, other: 'TaskArea') -> bool:
+        return any(self.intersects_box(box) for box in other.boxes())
+
+    def intersects_cells(self, cells: Iterable[quadtree.QCell]) -> bool:
+        return any(self.intersects_box(cell_bound_box(cell)) for cell in cells)
+
+
+class SpatialIndex:
+    """
+    Index of the task areas on a uniform lon/lat grid: an area is registered in every grid cell
+    covered by its boxes; boxes covering too many grid cells are kept aside and checked one by one
+    """
+
+    MAX_GRID_CELLS_PER_BOX = 256
+
+    def __init__(self, grid_step: float):
+        """
+        :param grid_step: size of the grid cell, degrees
+        """
+        self._grid_step = grid_step
+        self._grid: Dict[Tuple[int, int], Set[Hashable]] = {}
+        self._oversized: Set[Hashable] = set()
+        self._areas: Dict[Hashable, TaskArea] = {}
+        self._grid_cells: Dict[Hashable, List[Tuple[int, int]]] = {}
+
+    def __len__(self):
+        return len(self._areas)
+
+    def __contains__(self, key: Hashable):
+        return key in self._areas
+
+    def add(self, key: Hashable, area: TaskArea):
+
+        self.remove(key)
+        self._areas[key] = area
+        grid_cells = []
+        for box in area.boxes():
+            box_cells = self._box_grid_cells(box)
+            if box_cells is None:
+                self._oversized.add(key)
+            else:
+                grid_cells.extend(box_cells)
+
+        for grid_cell in grid_cells:
+            self._grid.setdefault(grid_cell, set()).add(key)
+        self._grid_cells[key] = grid_cells
+
+    def remove(self, key: Hashable):
+
+        if key not in self._areas:
+            return
+        del self._areas[key]
+        self._oversized.discard(key)
+        for grid_cell in self._grid_cells.pop(key):
+            keys = self._grid.get(grid_cell)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._grid[grid_cell]
+
+    def intersecting(self, area: TaskArea) -> Set[Hashable]:
+        """
+        Keys of the registered areas overlapping the given one
+        """
+        candidates = set(self._oversized)
+        for box in area.boxes():
+            box_cells = self._box_grid_cells(box)
+            if box_cells is None:
+                candidates.update(self._areas.keys())
+                break
+            for grid_cell in box_cells:
+                candidates.update(self._grid.get(grid_cell, ()))
+
+        return {key for key in candidates if self._areas[key].intersects(area)}
+
+    def _box_grid_cells(self, box: BoundBox) -> Union[List[Tuple[int, int]], None]:
+        """
+        :return: None if the box covers more than MAX_GRID_CELLS_PER_BOX grid cells
+        """
+        i_min, i_max = int(box.lon_min // self._grid_step), int(box.lon_max // self._grid_step)
+        j_min, j_max = int(box.lat_min // self._grid_step), int(box.lat_max // self._grid_step)
+        if (i_max - i_min + 1) * (j_max - j_min + 1) > self.MAX_GRID_CELLS_PER_BOX:
+            return None
+        return [(i, j) for i in range(i_min, i_max + 1) for j in range(j_min, j_max + 1)]
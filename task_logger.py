@@ -1,22 +1,29 @@
-import sys
-import traceback
+import os
 import asyncio
+import threading
 import uuid
 import json
 from typing import *
 from peewee import *
 from aiohttp import web
-from datetime import datetime
 from time import time
-from collections import deque
+from datetime import datetime, timedelta
+from functools import partial
+from collections import OrderedDict
+from playhouse.migrate import SqliteMigrator, migrate
+from playhouse.sqlite_ext import FTS5Model, SearchField, RowIDField
 from PluginEngine import Log, LogLevel
 from LandscapeEditor.backend.config import SERVICE_CONFIG
 from backend.task_scheduler_service.common import shorten_uuid
 from backend.task_scheduler_service.task_manager_common import TaskData
-from backend.task_scheduler_service.rpc_common import RPCData
+from backend.task_scheduler_service.rpc_common import RPCData, RPCStatus
 from backend.task_scheduler_service.task_manager_common import CloseRequest
+from backend.task_scheduler_service.log_writer import LogWriter
+from backend.task_scheduler_service.log_archive import LogArchive
+from backend.task_scheduler_service.ws_client import SharedMessage
+from backend.task_scheduler_service.stats_rollup import PERIODS, StatsSample, RollupStats, bucket_start
 
-db = SqliteDatabase(SERVICE_CONFIG['task_scheduler_service']['log_db'])
+db = SqliteDatabase(SERVICE_CONFIG['task_scheduler_service']['log_db'], pragmas={'journal_mode': 'wal'})
 
 
 class Event(Model):
@@ -26,9 +33,69 @@ class Event(Model):
     event_type = IntegerField()
     status = IntegerField(default=0)
     json_data = TextField()
+    uuid = CharField(null=True, unique=True)
 
     class Meta:
         database = db
+        #  The history is paginated by id, so every filter column is indexed together with it
+        indexes = (
+            (('username', 'id'), False),
+            (('event_type', 'id'), False),
+            (('status', 'id'), False),
+            (('created', 'id'), False),
+        )
+
+
+class StatsRollup(Model):
+    """
+    Statistics of the finished tasks per scenario and routing key for every hour and day,
+    the routing key is empty for the whole task
+    """
+
+    period = CharField()
+    bucket = DateTimeField()
+    scenario = CharField()
+    routing_key = CharField(default='')
+    count = IntegerField(default=0)
+    failed = IntegerField(default=0)
+    closed = IntegerField(default=0)
+    terminated = IntegerField(default=0)
+    duration_sum = FloatField(default=0.0)
+    duration_max = FloatField(default=0.0)
+    histogram = TextField()
+
+    class Meta:
+        database = db
+        table_name = 'stats_rollup'
+        indexes = (
+            (('period', 'scenario', 'routing_key', 'bucket'), True),
+        )
+
+
+class EventIndex(FTS5Model):
+    """
+    Full-text index of the events maintained by the triggers of the event table, the rowid is the event id
+    """
+
+    rowid = RowIDField()
+    username = SearchField()
+    name = SearchField()
+    message = SearchField()
+
+    class Meta:
+        database = db
+        table_name = 'event_search'
+
+
+#  The indexed text of the event row: the task and step names, the task, step and event messages
+_SEARCH_VALUES_SQL = """{row}.id, {row}.username,
+    coalesce(json_extract({row}.json_data, '$.name'), '') || ' ' ||
+    coalesce((SELECT group_concat(json_extract(value, '$.name'), ' ')
+              FROM json_each({row}.json_data, '$.steps')), ''),
+    coalesce(json_extract({row}.json_data, '$.message'), '') || ' ' ||
+    coalesce(json_extract({row}.json_data, '$.msg'), '') || ' ' ||
+    coalesce((SELECT group_concat(json_extract(value, '$.msg'), ' ')
+              FROM json_each({row}.json_data, '$.steps')), '')"""
 
 
 class EventType:
@@ -55,6 +122,8 @@ def task_descriptor(task_data: TaskData):
         'status': task_data.status(),
         'message': task_data.message,
         'username': task_data.task.username(),
+        'subscribers': list(task_data.subscribers),
+        'progress': task_data.progress(),
         'steps': list(map(step_descriptor, task_data.requests))
     }
 
@@ -107,57 +176,71 @@ class EventDescriptor:
     def update(self, data: Dict[str, Any]):
         self.__data = data
 
-    def to_str(self):
+    def to_dict(self) -> Dict[str, Any]:
         self.__data['created'] = str(self.__created)
         self.__data['id'] = self.__id
-        return json.dumps(self.__data)
+        return self.__data
+
+    def to_str(self):
+        return json.dumps(self.to_dict())
 
     def to_row(self) -> Dict[str, Any]:
 
         if self.__data['type'] == EventType.EVENT:
-            return {'created': self.__created, 'event_type': self.__data['type'], 'json_data': self.to_str()}
+            return {'username': '', 'created': self.__created, 'event_type': self.__data['type'], 'status': 0,
+                    'json_data': self.to_str(), 'uuid': None}
         elif self.__data['type'] in TaskLogger.task_types:
             return {'username': self.__data['username'],  'created': self.__created, 'event_type': self.__data['type'],
-                    'status': self.__data['status'], 'json_data': self.to_str()}
+                    'status': self.__data['status'], 'json_data': self.to_str(), 'uuid': self.__data['uuid']}
         assert False, 'Unknown event type ' + self.__data['type']
 
 
 class TaskLogger:
 
     group_size = 50
+    flush_interval = 1.0
+    max_queue_size = 10000
+    closed_cache_size = 1000
+    max_page_size = 1000
+    retention_days = 30
+    retention_interval = 3600.0
+    archive_segment_size = 10000
     task_types = (EventType.TASK, EventType.CMD)
 
     def __init__(self, app: 'aiohttp application'):
+        self._migrate()
         Event.create_table()
+        self._search_enabled = self._create_search_index()
+        StatsRollup.create_table()
+        self._stats_lock = threading.Lock()
         self._app = app
         self._tasks: Dict[str, EventDescriptor] = {}
-        self._events: List[EventDescriptor] = []
-        self._completed_events: List[EventDescriptor] = []
+        self._closed_tasks: 'OrderedDict[str, EventDescriptor]' = OrderedDict()
+        self._writer = LogWriter(
+            db, Event, conflict_target=Event.uuid, preserve=(Event.status, Event.json_data),
+            batch_size=int(SERVICE_CONFIG['task_scheduler_service'].get('log_batch_size', self.group_size)),
+            flush_interval=float(SERVICE_CONFIG['task_scheduler_service'].get('log_flush_interval',
+                                                                               self.flush_interval)),
+            max_queue_size=int(SERVICE_CONFIG['task_scheduler_service'].get('log_queue_size', self.max_queue_size)))
+        self._writer.start()
+        self._archive = LogArchive(SERVICE_CONFIG['task_scheduler_service'].get(
+            'log_archive_dir', os.path.join(os.path.dirname(SERVICE_CONFIG['task_scheduler_service']['log_db']),
+                                            'log_archive')))
+        self._drop_archived()
+
+    def run_in_loop(self, loop):
+        """
+        Starts the retention job moving the old events to the archive, the job is off if the retention is 0 days
+        """
+        days = float(SERVICE_CONFIG['task_scheduler_service'].get('log_retention_days', self.retention_days))
+        if days > 0:
+            loop.create_task(self._retain(loop, timedelta(days=days)))
 
     def update_close_request(self, req: CloseRequest):
-        uuid_str = req.uuid
-        data = close_request_descriptor(req)
-        event = self._tasks.get(uuid_str)
-        if not event:
-            self._events.append(EventDescriptor(datetime.now(), data))
-            event = self._tasks[uuid_str] = self._events[-1]
-        else:
-            event.update(data)
-        self._try_save_log()
-        self._send(event.to_str())
+        self._update_event(str(req.uuid), close_request_descriptor(req))
 
     def update_task(self, task_data: TaskData):
-        uuid_str = str(task_data.task.uuid())
-        data = task_descriptor(task_data)
-
-        event = self._tasks.get(uuid_str)
-        if not event:
-            self._events.append(EventDescriptor(datetime.now(), data))
-            event = self._tasks[uuid_str] = self._events[- 1]
-        else:
-            event.update(data)
-        self._try_save_log()
-        self._send(event.to_str())
+        self._update_event(str(task_data.task.uuid()), task_descriptor(task_data))
 
     def new_task(self, task_data: TaskData):
         self.update_task(task_data)
@@ -168,98 +251,377 @@ class TaskLogger:
     def error(self, msg: str):
         self.message(msg, LogLevel.ERROR)
 
-    async def load_log(self, ws: web.WebSocketResponse, num_rows: int, less_than: Union[int, None] = None):
+    async def load_log(self, client: 'WebSocketClient', num_rows: int, less_than: Union[int, None] = None,
+                       **filters):
         """
-        Sends event log from the DB to the client
-        :param ws: websocket to send data
+        Sends a page of the event log from the DB to the client as one JSON array, then the active events
+        :param client: websocket client to send data
         :param num_rows: maximum number of rows to be loaded
         :param less_than: the maximum id of the loaded rows must be less than the given arg
+        :param filters: see query_log
+        """
+        #  The active events are sent from memory
+        page = [item for item in await self.history(num_rows, less_than, **filters)
+                if item.get('uuid') not in self._tasks]
+        if page:
+            client.send(page)
+
+        #  The active events go through the client queue to keep the order with their updates
+        for uuid_str, event in self._tasks.items():
+            client.send(event.to_dict(), uuid_str)
+
+        client.send('ready')
 
+    async def history(self, num_rows: int, less_than: Union[int, None] = None, **filters) -> List[Dict[str, Any]]:
+        """
+        Queries the page of the event log in the executor, see query_log
+        """
+        loop = asyncio.get_event_loop()
+        #  The completed events are in the DB once the rows put before are saved
+        await loop.run_in_executor(None, self._writer.flush)
+        return await loop.run_in_executor(None, partial(self.query_log, num_rows, less_than, **filters))
+
+    def query_log(self, num_rows: int, less_than: Union[int, None] = None, username: Optional[str] = None,
+                  event_type: Optional[int] = None, status: Optional[int] = None,
+                  since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """
+        Loads the page of the event log, newest first; the next page is loaded with less_than set to the least id
+        of the page (keyset pagination)
+        :param num_rows: page size, limited by max_page_size
+        :param since: the least creation time of the events
+        :param until: the creation time of the events must be less than the given arg
+        """
+        query = Event.select()
+        if less_than is not None:
+            query = query.where(Event.id < less_than)
+        if username is not None:
+            query = query.where(Event.username == username)
+        if event_type is not None:
+            query = query.where(Event.event_type == event_type)
+        if status is not None:
+            query = query.where(Event.status == status)
+        if since is not None:
+            query = query.where(Event.created >= since)
+        if until is not None:
+            query = query.where(Event.created < until)
+
+        num_rows = min(num_rows, self.max_page_size)
+        with db.connection_context():
+            rows = list(query.order_by(Event.id.desc()).limit(num_rows))
+        page = [EventDescriptor.from_row(row).to_dict() for row in rows]
+
+        #  Paging past the hot DB reads through to the archive; the archived ids are mostly less than the hot ones,
+        #  but the events of the long running tasks are archived later, so the archive is merged by id
+        if len(page) >= num_rows and self._archive.max_id() < page[-1]['id']:
+            return page
+        archived = self._archive.query(num_rows, less_than, page[-1]['id'] if len(page) >= num_rows else None,
+                                       username=username, event_type=event_type, status=status,
+                                       since=since, until=until)
+        if archived:
+            page = sorted(page + archived, key=lambda item: item['id'], reverse=True)[:num_rows]
+        return page
+
+    def archive_old_events(self, older_than: datetime, exempt: Collection[str] = ()) -> int:
+        """
+        Moves the events created before the given time to the archive segments and deletes them from the DB
+        :param exempt: uuids of the events still being updated
+        :return: number of the archived events
         """
-        await self._load_log_from_db(ws, num_rows, less_than)
+        exempt = set(exempt)
+        count = 0
+        last_id = 0
+        while True:
+            query = Event.select().where((Event.created < older_than) & (Event.id > last_id))
+            with db.connection_context():
+                rows = list(query.order_by(Event.id).limit(self.archive_segment_size))
+            if not rows:
+                return count
+
+            last_id = rows[-1].id
+            #  Filtered here: an SQL variable per exempt uuid would exceed the SQLite limit of the query variables
+            rows = [row for row in rows if row.uuid is None or row.uuid not in exempt]
+            if not rows:
+                continue
+
+            self._archive.append([{'id': row.id, 'created': row.created, 'username': row.username,
+                                   'event_type': row.event_type, 'status': row.status,
+                                   'data': json.loads(row.json_data)} for row in rows])
+            self._delete_rows([row.id for row in rows])
+            count += len(rows)
+            Log.info(f'{len(rows)} events have been moved to the log archive')
+
+    def _drop_archived(self):
+        """
+        Deletes the rows of the last segment which might have been left in the DB by an interrupted retention job
+        """
+        segment = self._archive.last_segment()
+        if segment:
+            self._delete_rows([row['id'] for row in self._archive.read(segment)])
+
+    @staticmethod
+    def _delete_rows(ids: List[int]):
+
+        chunk_size = 500  # below the SQLite limit of the query variables
+        with db.connection_context():
+            with db.atomic():
+                for i in range(0, len(ids), chunk_size):
+                    Event.delete().where(Event.id.in_(ids[i:i + chunk_size])).execute()
+
+    async def _retain(self, loop, age: timedelta):
+
+        interval = float(SERVICE_CONFIG['task_scheduler_service'].get('log_retention_interval',
+                                                                       self.retention_interval))
+        while True:
+            #  The events still updated in memory would be written back to the DB, so they are kept
+            exempt = set(self._tasks) | set(self._closed_tasks)
+            try:
+                await loop.run_in_executor(None, self.archive_old_events, datetime.now() - age, exempt)
+            except Exception as err:
+                Log.error(f'Failed to archive the event log: {err}')
 
-        for event in self._completed_events:
-            await ws.send_str(event.to_str())
+            await asyncio.sleep(interval)
 
-        for event in self._events:
-            await ws.send_str(event.to_str())
+    async def search(self, text: str, num_rows: int, offset: int = 0, **filters) -> List[Dict[str, Any]]:
+        """
+        Runs the full-text search in the executor, see query_search
+        """
+        return await asyncio.get_event_loop().run_in_executor(
+            None, partial(self.query_search, text, num_rows, offset, **filters))
 
-        await ws.send_str('ready')
+    def query_search(self, text: str, num_rows: int, offset: int = 0, username: Optional[str] = None,
+                     event_type: Optional[int] = None, status: Optional[int] = None,
+                     since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """
+        Finds the events of the hot DB by the FTS5 query over the usernames, the task and step names and messages
+        :param text: FTS5 query, e.g. '"bridge import error"' or 'bridge AND fail*'
+        :return: the page of the hits ordered by relevance (bm25), every hit has the score field
+        :raise ValueError: on the incorrect query or if the search is not available
+        """
+        if not self._search_enabled:
+            raise ValueError('Full-text search is not available: SQLite is built without FTS5')
+
+        query = Event.select(Event, EventIndex.bm25().alias('score')) \
+            .join(EventIndex, on=(EventIndex.rowid == Event.id)) \
+            .where(EventIndex.match(text))
+        if username is not None:
+            query = query.where(Event.username == username)
+        if event_type is not None:
+            query = query.where(Event.event_type == event_type)
+        if status is not None:
+            query = query.where(Event.status == status)
+        if since is not None:
+            query = query.where(Event.created >= since)
+        if until is not None:
+            query = query.where(Event.created < until)
+        query = query.order_by(SQL('score'), Event.id.desc()).offset(offset).limit(min(num_rows, self.max_page_size))
+
+        try:
+            with db.connection_context():
+                rows = list(query)
+        except OperationalError as err:
+            raise ValueError(f'Incorrect search query: {err}')
+        return [dict(EventDescriptor.from_row(row).to_dict(), score=row.score) for row in rows]
+
+    @staticmethod
+    def parse_filters(params: Mapping[str, Any]) -> Dict[str, Any]:
+        """
+        Converts the history filters given as strings (query or command arguments)
+        :raise ValueError: on the incorrect value
+        """
+        filters = {}
+        if params.get('username') is not None:
+            filters['username'] = str(params['username'])
+        for name in ('event_type', 'status'):
+            if params.get(name) is not None:
+                filters[name] = int(params[name])
+        for name in ('since', 'until'):
+            if params.get(name) is not None:
+                filters[name] = datetime.fromisoformat(str(params[name]))
+        return filters
+
+    def resync(self, client: 'WebSocketClient', uuid_str: str):
+        """
+        Sends the whole descriptor of the task to the client which has missed an update
+        """
+        client.forget(uuid_str)
+        event = self._tasks.get(uuid_str) or self._closed_tasks.get(uuid_str)
+        if event:
+            client.send(event.to_dict(), uuid_str)
 
     def message(self, msg: str, log_level: int):
-        self._events.append(EventDescriptor(datetime.now(), message_descriptor(msg, log_level), completed=True))
-        self._send(self._events[-1].to_str())
-        self._try_save_log()
+        event = EventDescriptor(datetime.now(), message_descriptor(msg, log_level), completed=True)
+        self._writer.put(event.to_row())
+        self._send(event.to_dict())
+
+    def update_stats(self, task_data: TaskData):
+        """
+        Adds the finished task and its steps to the statistics rollups, the rollups are saved in the executor
+        """
+        scenario = task_data.task.name() or ''
+        finished = task_data.finished or time()
+        samples = [StatsSample(scenario, '', finished, finished - task_data.created,
+                               task_data.status() == RPCStatus.FAILED, task_data.close_requested,
+                               any(rpc.terminate_requested for rpc in task_data.requests))]
+        for rpc in task_data.requests:
+            duration = rpc.finished - rpc.started if rpc.started and rpc.finished else None
+            samples.append(StatsSample(scenario, rpc.routing_key, rpc.finished or finished, duration,
+                                       rpc.status == RPCStatus.FAILED, rpc.close_requested, rpc.terminate_requested))
+
+        asyncio.get_event_loop().run_in_executor(None, self.save_stats, samples)
+
+    def save_stats(self, samples: List[StatsSample]):
+
+        buckets: Dict[Tuple[str, datetime, str, str], RollupStats] = {}
+        for sample in samples:
+            for period in PERIODS:
+                key = (period, bucket_start(sample.finished, period), sample.scenario, sample.routing_key)
+                buckets.setdefault(key, RollupStats()).add(sample)
+
+        try:
+            #  The buckets are read and written back, so the concurrent saves are serialized
+            with self._stats_lock, db.connection_context(), db.atomic():
+                for (period, bucket, scenario, routing_key), stats in buckets.items():
+                    row = StatsRollup.get_or_none(
+                        (StatsRollup.period == period) & (StatsRollup.scenario == scenario) &
+                        (StatsRollup.routing_key == routing_key) & (StatsRollup.bucket == bucket))
+                    if row:
+                        stats.merge(RollupStats.from_fields(row.__data__))
+                    StatsRollup.insert(period=period, bucket=bucket, scenario=scenario, routing_key=routing_key,
+                                       **stats.to_fields()) \
+                        .on_conflict(conflict_target=(StatsRollup.period, StatsRollup.scenario,
+                                                      StatsRollup.routing_key, StatsRollup.bucket),
+                                     preserve=(StatsRollup.count, StatsRollup.failed, StatsRollup.closed,
+                                               StatsRollup.terminated, StatsRollup.duration_sum,
+                                               StatsRollup.duration_max, StatsRollup.histogram)) \
+                        .execute()
+        except Exception as err:
+            Log.error(f'Failed to save the task statistics: {err}')
+
+    async def stats(self, period: str, **kwargs) -> List[Dict[str, Any]]:
+        """
+        Queries the statistics rollups in the executor, see query_stats
+        """
+        return await asyncio.get_event_loop().run_in_executor(None, partial(self.query_stats, period, **kwargs))
+
+    @staticmethod
+    def query_stats(period: str, scenario: Optional[str] = None, routing_key: Optional[str] = None,
+                    since: Optional[datetime] = None, until: Optional[datetime] = None,
+                    total: bool = False) -> List[Dict[str, Any]]:
+        """
+        Loads the statistics rollups
+        :param period: 'hour' or 'day'
+        :param routing_key: empty string selects the statistics of the whole tasks, None selects all
+        :param since: the least bucket start
+        :param until: the bucket start must be less than the given arg
+        :param total: the buckets are merged for every scenario and routing key
+        :return: counts, failure rate and duration percentiles, newest buckets first
+        :raise ValueError: on the unknown period
+        """
+        if period not in PERIODS:
+            raise ValueError(f'Unknown rollup period: {period}, expected one of {", ".join(PERIODS)}')
+
+        query = StatsRollup.select().where(StatsRollup.period == period)
+        if scenario is not None:
+            query = query.where(StatsRollup.scenario == scenario)
+        if routing_key is not None:
+            query = query.where(StatsRollup.routing_key == routing_key)
+        if since is not None:
+            query = query.where(StatsRollup.bucket >= since)
+        if until is not None:
+            query = query.where(StatsRollup.bucket < until)
+
+        with db.connection_context():
+            rows = list(query.order_by(StatsRollup.bucket.desc(), StatsRollup.scenario, StatsRollup.routing_key))
+
+        if not total:
+            return [dict(period=row.period, bucket=str(row.bucket), scenario=row.scenario, routing_key=row.routing_key,
+                         **RollupStats.from_fields(row.__data__).summary()) for row in rows]
+
+        merged: 'OrderedDict[Tuple[str, str], RollupStats]' = OrderedDict()
+        for row in rows:
+            merged.setdefault((row.scenario, row.routing_key), RollupStats()).merge(
+                RollupStats.from_fields(row.__data__))
+        return [dict(period=period, scenario=scenario, routing_key=routing_key, **stats.summary())
+                for (scenario, routing_key), stats in merged.items()]
 
     def notify_task_closed(self, task_uuid: uuid.UUID):
 
         uuid_str = str(task_uuid)
-        event = self._tasks.get(uuid_str)
+        event = self._tasks.pop(uuid_str, None)
         if event:
+            #  The final state may still come with the next update, so the event is kept for a while
             event.completed = True
+            self._writer.put(event.to_row())
+            self._closed_tasks[uuid_str] = event
+            while len(self._closed_tasks) > self.closed_cache_size:
+                self._closed_tasks.popitem(last=False)
         else:
             Log.warn(f'Attempt to notify unknown task {shorten_uuid(uuid_str)} has been closed')
 
-    def _send(self, data: str):
-        asyncio.get_event_loop().create_task(self._async_send(data))
-
-    async def _async_send(self, data: str):
-        for _ws in self._app['websockets']:
-            try:
-                await _ws.send_str(data)
-            except Exception as e:
-                exc_type, exc_value, exc_traceback = sys.exc_info()
-                err_msg = "Socket error:\n{exc_info}".format(
-                    exc_info='\n'.join(traceback.format_exception(exc_type, exc_value, exc_traceback))
-                )
-                Log.error(err_msg)
+    def _send(self, data: Union[str, Dict[str, Any]], key: Optional[str] = None):
+        """
+        Queues the message to every client, the pending messages with the same key are replaced
+        """
+        if not isinstance(data, str):
+            data = SharedMessage(data)
+        for client in self._app['websockets']:
+            client.send(data, key)
 
     def close(self):
-        self._try_save_log(forced=True)
-
-    def _try_save_log(self, forced=False):
-
-        new_completed = 0
-        for item in self._events:
-            if not item.completed:
-                break
-            self._completed_events.append(item)
-            new_completed += 1
-            if item.type() in self.task_types:
-                del self._tasks[str(item.uuid())]
-
-        if new_completed:
-            self._events = self._events[new_completed:]
-
-        if len(self._completed_events) >= self.group_size or forced:
-            begin = time()
-            with db.connection_context():
-                Event.insert_many(item.to_row() for item in self._completed_events).execute()
-
-            self._log_event_stat(time() - begin)
-            self._completed_events.clear()
-
-    async def _load_log_from_db(self, ws: web.WebSocketResponse, num_rows: int, less_than: int):
-
-        events = deque()
-
-        for row in Event.select().where(Event.id < less_than).order_by(Event.id.desc()).limit(num_rows):
-            await ws.send_str(EventDescriptor.from_row(row).to_str())
-
-    def _log_event_stat(self, save_time: float, log_level=LogLevel.TRACE):
-
-        if Log.get_log_level() <= log_level:
-            Log.log_message(log_level, f"""
-------------------------------------
-{len(self._completed_events)} events have been saved to db
-{len(self._events)} events are active
-save time: {save_time * 1000} ms 
-------------------------------------
-""", Log.CONSOLE)
-
-
-
+        self._writer.close()
 
+    def _update_event(self, uuid_str: str, data: Dict[str, Any]):
+        """
+        Updates the task or command event and upserts its row, the rows of the active events are saved as they change
+        """
+        event = self._tasks.get(uuid_str) or self._closed_tasks.get(uuid_str)
+        if not event:
+            event = self._tasks[uuid_str] = EventDescriptor(datetime.now(), data)
+        else:
+            event.update(data)
+        self._writer.put(event.to_row())
+        self._send(event.to_dict(), uuid_str)
 
+    @staticmethod
+    def _create_search_index() -> bool:
+        """
+        Creates the full-text index with the triggers keeping it in sync with the event table,
+        the events written before are indexed once; the archived events are removed from the index
+        :return: False if SQLite has no FTS5
+        """
+        if not EventIndex.fts5_installed():
+            Log.warn('SQLite is built without FTS5, the full-text search of the event log is disabled')
+            return False
+
+        table = Event._meta.table_name
+        index = EventIndex._meta.table_name
+        with db.atomic():
+            if not EventIndex.table_exists():
+                EventIndex.create_table()
+                db.execute_sql(f'INSERT INTO {index}(rowid, username, name, message) '
+                               f'SELECT {_SEARCH_VALUES_SQL.format(row=table)} FROM {table}')
+
+            db.execute_sql(f'CREATE TRIGGER IF NOT EXISTS {index}_insert AFTER INSERT ON {table} BEGIN '
+                           f'INSERT INTO {index}(rowid, username, name, message) '
+                           f'VALUES ({_SEARCH_VALUES_SQL.format(row="new")}); END')
+            db.execute_sql(f'CREATE TRIGGER IF NOT EXISTS {index}_update AFTER UPDATE ON {table} BEGIN '
+                           f'DELETE FROM {index} WHERE rowid = old.id; '
+                           f'INSERT INTO {index}(rowid, username, name, message) '
+                           f'VALUES ({_SEARCH_VALUES_SQL.format(row="new")}); END')
+            db.execute_sql(f'CREATE TRIGGER IF NOT EXISTS {index}_delete AFTER DELETE ON {table} BEGIN '
+                           f'DELETE FROM {index} WHERE rowid = old.id; END')
+        return True
+
+    @staticmethod
+    def _migrate():
+        """
+        Adds the uuid column to the event table created by the previous versions
+        """
+        if not Event.table_exists() or \
+                'uuid' in (column.name for column in db.get_columns(Event._meta.table_name)):
+            return
 
+        migrator = SqliteMigrator(db)
+        migrate(migrator.add_column(Event._meta.table_name, 'uuid', CharField(null=True)),
+                migrator.add_index(Event._meta.table_name, ('uuid',), True))
 
@@ -1,20 +1,40 @@
 import uuid
 import asyncio
 from time import time
-from collections import namedtuple
+from typing import *
+from collections import namedtuple, OrderedDict
 from PluginEngine import Log
 from PluginEngine.asserts import require
 from LandscapeEditor.backend.config import SERVICE_CONFIG
-from backend.task_scheduler_service.common import ResponseObject, ResponseStatus
+from LandscapeEditor.backend import TaskInputInterface
+from backend.task_scheduler_service.common import ResponseObject, ResponseStatus, payload_fingerprint, shorten_uuid
 from backend.task_scheduler_service.task_manager_common import Task, TaskData, CloseRequest
-from backend.task_scheduler_service.rpc_common import RPCStatus, RPCData, RPCErrorCallbackInterface
+from backend.task_scheduler_service.rpc_common import RPCStatus, RPCData, RPCErrorCallbackInterface, RPCRegistry
 from backend.task_scheduler_service.scenario_provider import ScenarioProvider
 from backend.task_scheduler_service.rpc_manager import RPCManager
-from backend.task_scheduler_service.task_logger import TaskLogger
+from backend.task_scheduler_service.reply_dispatcher import ReplyDispatcher
+from backend.task_scheduler_service.admission_queue import FairAdmissionQueue, parse_user_weights
+from backend.task_scheduler_service.step_cache import StepResultCache
+from backend.task_scheduler_service.task_area import TaskArea, SpatialIndex
+from backend.task_scheduler_service.metrics import REGISTRY
+from backend.task_scheduler_service.queue_monitor import QueueDepthMonitor
+from backend.task_scheduler_service.task_logger import TaskLogger, task_descriptor
 from backend.task_scheduler_service.common import TaskManagerInterface, EditLockManagerInterface
 
 
-RequestData = namedtuple('RequestData', 'task_uuid, queue')
+RequestData = namedtuple('RequestData', 'task_uuid, routing_key')
+
+QUEUE_WAIT = REGISTRY.histogram('task_scheduler_queue_wait_seconds',
+                                'Time from publishing a step request to its first reply', ('routing_key',))
+FIRST_PROGRESS = REGISTRY.histogram('task_scheduler_first_progress_seconds',
+                                    'Time from publishing a step request to its first non-zero progress',
+                                    ('routing_key',))
+EXECUTION_TIME = REGISTRY.histogram('task_scheduler_execution_seconds',
+                                    'Time from the first reply to the end of a step', ('routing_key', 'status'))
+STEPS = REGISTRY.counter('task_scheduler_steps_total', 'Finished steps', ('routing_key', 'status'))
+REPLIES = REGISTRY.counter('task_scheduler_replies_total', 'Received step replies', ('routing_key', 'status'))
+CLOSE_TIME = REGISTRY.histogram('task_scheduler_close_seconds', 'Duration of the close requests', ('status',))
+REJECTED = REGISTRY.counter('task_scheduler_rejected_tasks_total', 'Tasks rejected by backpressure', ('reason',))
 
 
 class TaskManager(TaskManagerInterface):
@@ -43,110 +63,294 @@ class TaskManager(TaskManagerInterface):
         TaskManager.START_TIMEOUT = int(SERVICE_CONFIG['task_scheduler_service']['start_timeout'])
         TaskManager.CLOSE_TIMEOUT = int(SERVICE_CONFIG['task_scheduler_service']['close_timeout'])
         TaskManager.TERMINATE_TIMEOUT = int(SERVICE_CONFIG['task_scheduler_service']['terminate_timeout'])
+        TaskManager.MAX_ACTIVE_TASKS = int(SERVICE_CONFIG['task_scheduler_service'].get('max_active_tasks', 0))
+        TaskManager.STEP_CACHE_SIZE = int(SERVICE_CONFIG['task_scheduler_service'].get('step_cache_size', 1000))
+        TaskManager.STEP_CACHE_MAX_AGE = int(SERVICE_CONFIG['task_scheduler_service'].get('step_cache_max_age', 86400))
+        TaskManager.MAX_INFLIGHT_TASKS = int(SERVICE_CONFIG['task_scheduler_service'].get('max_inflight_tasks', 0))
+        TaskManager.MAX_QUEUE_BACKLOG = int(SERVICE_CONFIG['task_scheduler_service'].get('max_queue_backlog', 0))
+        TaskManager.RETRY_AFTER = int(SERVICE_CONFIG['task_scheduler_service'].get('retry_after', 30))
+        TaskManager.CLOSED_TASK_CACHE_SIZE = int(
+            SERVICE_CONFIG['task_scheduler_service'].get('closed_task_cache_size', 1000))
+        TaskManager.LONG_POLL_TIMEOUT = float(SERVICE_CONFIG['task_scheduler_service'].get('long_poll_timeout', 30))
         self._tasks = {}
         self._requests = {}
         self._close_requests = {}
-        self._closed_tasks = []
+        self._task_requests: Dict[uuid.UUID, Set[uuid.UUID]] = {}
+        self._task_close_requests: Dict[uuid.UUID, Set[uuid.UUID]] = {}
+        self._fingerprints: Dict[str, uuid.UUID] = {}
+        self._blocked_by: Dict[uuid.UUID, Set[uuid.UUID]] = {}
+        self._blocking: Dict[uuid.UUID, Set[uuid.UUID]] = {}
+        self._closed_tasks: 'OrderedDict[uuid.UUID, Dict[str, Any]]' = OrderedDict()
+        self._task_watchers: Dict[uuid.UUID, List[asyncio.Future]] = {}
         self._scenario_provider = scenario_provider
         self._lock_manager = lock_manager
         self._event_logger = task_logger
         self._rpc_manager = None
+        self._queue_monitor = None
+        self._dispatcher = ReplyDispatcher()
+        self._admission = FairAdmissionQueue(
+            TaskManager.MAX_ACTIVE_TASKS,
+            parse_user_weights(SERVICE_CONFIG['task_scheduler_service'].get('user_weights', '')))
+        self._step_cache = StepResultCache(TaskManager.STEP_CACHE_SIZE, TaskManager.STEP_CACHE_MAX_AGE)
+        self._spatial_index = SpatialIndex(
+            float(SERVICE_CONFIG['task_scheduler_service'].get('spatial_grid_step', 0.25)))
         self._amqp_url = amqp_url
 
-    async def run_request(self, task_uuid: uuid.UUID, routing_key: str):
+        REGISTRY.gauge('task_scheduler_active_tasks', 'Tasks known to the task manager', lambda: len(self._tasks))
+        REGISTRY.gauge('task_scheduler_inflight_requests', 'Step requests waiting for the end',
+                       lambda: len(self._requests))
+        REGISTRY.gauge('task_scheduler_admission_queue_length', 'Tasks waiting for admission',
+                       lambda: len(self._admission))
+
+    async def run_request(self, task_uuid: uuid.UUID, routing_key: str, tile: Optional[Dict[str, float]] = None):
 
         require(task_uuid in self._tasks, f'Unknown task id: {task_uuid}')
         task_data = self._tasks[task_uuid]
         if task_data.close_requested:
             return False
 
-        task_input = task_data.task.make_task_input()
+        task_input = task_data.task.make_task_input(tile)
+
+        fingerprint = None
+        watermark = None
+        #  The edits of the locked cells are consumed by the task, so its steps must run
+        if self._step_cache.enabled() and task_data.task.step_cache_enabled() and \
+                not task_data.task.has_locked_data():
+            fingerprint = payload_fingerprint(routing_key, task_input.to_dict())
+            if await self._complete_from_cache(task_data, routing_key, fingerprint, task_input):
+                STEPS.inc(routing_key, 'cached')
+                return True
+            #  Taken before the step starts, so the edits made while it runs are newer than the cached result
+            watermark = await asyncio.get_event_loop().run_in_executor(None, self._lock_manager.history_watermark)
+
         rpc = self._rpc_manager.request(routing_key, task_input)
         if rpc.status == RPCStatus.WAITING:
             task_data.set_waiting()
-            task_data.requests.append(rpc)
-            queue = asyncio.Queue()
-            self._requests[rpc.uuid] = RequestData(task_data.task.uuid(), queue)
+            self._register_request(task_data, rpc)
         else:
             return False
 
         task_started = False
+        progress_reported = False
+        published = time()
+        started = None
         timeout = TaskManager.START_TIMEOUT  # TODO
+        self._dispatcher.register(rpc.uuid, timeout)
+
+        self._notify_task_changed(task_data)
+
+        try:
+            while True:
+
+                try:
+
+                    rsp = await self._dispatcher.get(rpc.uuid)
+                    rpc.message = rsp.message
+                    rpc.progress = rsp.progress
+
+                    if not task_started:
+                        task_started = True
+                        started = rpc.started = time()
+                        QUEUE_WAIT.observe(started - published, routing_key)
+                        timeout = self._rpc_manager.heartbit_timeout(routing_key)
+                        self._dispatcher.set_timeout(rpc.uuid, timeout)
+
+                    if not progress_reported and rsp.progress > 0.0:
+                        progress_reported = True
+                        FIRST_PROGRESS.observe(time() - published, routing_key)
+
+                    if rsp.status == ResponseStatus.IN_PROGRESS:
+                        rpc.set_in_progress()
+                        task_data.set_in_progress()
+
+                    elif rsp.status == ResponseStatus.FAILED:
+                        rpc.set_failed()
+                        task_data.set_failed()
+                        self.request_stop_task(task_uuid, task_input.username())
+                        Log.error(f'{routing_key} failed: {rsp.message}')
+                        return False
+
+                    elif rsp.status == ResponseStatus.COMPLETED:
+                        rpc.set_completed()
+                        if fingerprint and not task_data.close_requested:
+                            self._step_cache.put(routing_key, fingerprint, watermark, rsp.message)
+                        return True
+                    else:
+                        Log.warn(f'Unexpected rpc response status: {rsp.status}')
+                        continue
 
-        self._event_logger.new_task(task_data)
-
-        while True:
-
-            try:
-
-                rsp = await asyncio.wait_for(queue.get(), timeout)
-                rpc.message = rsp.message
-                rpc.progress = rsp.progress
-
-                if not task_started:
-                    task_started = True
-                    timeout = self._rpc_manager.heartbit_timeout(routing_key)
-
-                if rsp.status == ResponseStatus.IN_PROGRESS:
-                    rpc.set_in_progress()
-                    task_data.set_in_progress()
-
-                elif rsp.status == ResponseStatus.FAILED:
-                    rpc.set_failed()
-                    task_data.set_failed()
+                except asyncio.TimeoutError as err:
+                    # The place for request's thread termination
+                    rpc.message = f'heartbit timeout {timeout} seconds has been reached'
                     self.request_stop_task(task_uuid, task_input.username())
-                    Log.error(f'{routing_key} failed: {rsp.message}')
-                    return False
-
-                elif rsp.status == ResponseStatus.COMPLETED:
-                    rpc.set_completed()
-                    return True
-                else:
-                    Log.warn(f'Unexpected rpc response status: {rsp.status}')
                     continue
 
-            except asyncio.TimeoutError as err:
-                # The place for request's thread termination
-                rpc.message = f'heartbit timeout {timeout} seconds has been reached'
-                self.request_stop_task(task_uuid, task_input.username())
-                continue
-
-            finally:
-                self.process_close_requests(rpc)
-                self._event_logger.update_task(task_data)
+                finally:
+                    self.process_close_requests(rpc)
+                    self._notify_task_changed(task_data)
+        finally:
+            self._dispatcher.unregister(rpc.uuid)
+            status = RPCStatus.verbose(rpc.status)
+            STEPS.inc(routing_key, status)
+            if started is not None:
+                EXECUTION_TIME.observe(time() - started, routing_key, status)
 
     def notify_task_closed(self, task_uuid: uuid.UUID):
 
-        to_delete = [key for key, value in self._requests.items() if value.task_uuid == task_uuid]
-        for key in to_delete:
+        for key in self._task_requests.pop(task_uuid, ()):
             del self._requests[key]
 
         if task_uuid in self._tasks:
 
             task_data = self._tasks[task_uuid]
             task_data.set_closed()
+            if task_data.fingerprint:
+                del self._fingerprints[task_data.fingerprint]
             self._event_logger.notify_task_closed(task_uuid)
-            self._event_logger.update_task(task_data)
-            self._closed_tasks = task_data
+            self._event_logger.update_stats(task_data)
+            self._notify_task_changed(task_data)
+            self._closed_tasks[task_uuid] = self._task_status(task_data)
+            while len(self._closed_tasks) > TaskManager.CLOSED_TASK_CACHE_SIZE:
+                self._closed_tasks.popitem(last=False)
             del self._tasks[task_uuid]
 
+        self._spatial_index.remove(task_uuid)
+        for waiter_uuid in self._blocking.pop(task_uuid, ()):
+            blockers = self._blocked_by[waiter_uuid]
+            blockers.discard(task_uuid)
+            if not blockers:
+                del self._blocked_by[waiter_uuid]
+                self._submit_task(self._tasks[waiter_uuid])
+
+        if self._admission.release(task_uuid):
+            self._admit_tasks()
+
         self._log_task_info()
 
-    async def start_task(self, task_id: uuid.UUID, payload: dict):
+    def check_backpressure(self, task_id: uuid.UUID) -> (bool, str):
+        """
+        Whether a new task of the given type may be accepted now
+        """
+        ok, msg = self.check_inflight()
+        if not ok:
+            return ok, msg
+
+        return self.check_backlog(task_id)
+
+    def check_inflight(self, count: int = 1) -> (bool, str):
+        """
+        Whether the given number of new tasks of any types fits the limit of the unfinished tasks
+        """
+        if 0 < TaskManager.MAX_INFLIGHT_TASKS < len(self._tasks) + count:
+            REJECTED.inc('inflight')
+            return False, f'Too many unfinished tasks: {len(self._tasks)}'
+
+        return True, 'Ok'
+
+    def check_backlog(self, task_id: uuid.UUID) -> (bool, str):
+        """
+        Whether the queues of the steps of the given task type are short enough to accept a new task
+        """
+        if self._queue_monitor is not None:
+            for routing_key in self._scenario_provider.get_routing_keys(task_id):
+                depth = self._queue_monitor.depth(routing_key)
+                if depth > TaskManager.MAX_QUEUE_BACKLOG:
+                    REJECTED.inc('backlog')
+                    return False, f'Too many waiting {routing_key} requests: {depth}'
+
+        return True, 'Ok'
+
+    async def start_task(self, task_id: uuid.UUID, payload: dict) -> (bool, str, Optional[uuid.UUID]):
+        """
+        :return: result, message and uuid of the created task or of the running identical one (None on failure)
+        """
+        result = self._create_task(task_id, payload)
+        self._log_task_info()
+        return result
+
+    async def start_tasks(self, tasks: List[Tuple[uuid.UUID, dict]]) -> List[Tuple[bool, str, Optional[uuid.UUID]]]:
+        """
+        Creates the batch of tasks
+        :param tasks: scenario id and payload of every task
+        :return: result, message and the task uuid (None on failure) of every task
+        """
+        result = [self._create_task(task_id, payload) for task_id, payload in tasks]
+        self._log_task_info()
+        return result
 
+    def _create_task(self, task_id: uuid.UUID, payload: dict) -> (bool, str, Optional[uuid.UUID]):
+        """
+        :return: result, message and uuid of the created task or of the running identical one
+        """
         task_uuid = uuid.uuid4()
         task = Task(task_uuid, task_id, payload, task_manager=self, lock_manager=self._lock_manager)
         ok, msg = task.load(provider=self._scenario_provider)  # TODO ???
+
+        fingerprint = payload_fingerprint(str(task_id), payload) if ok and task.deduplicate() else None
+        if fingerprint in self._fingerprints:
+            running_uuid = self._fingerprints[fingerprint]
+            ok, msg = self._attach_task(self._tasks[running_uuid], task.username())
+            return ok, msg, running_uuid
+
         if ok:
-            self._tasks[task_uuid] = TaskData(task)
-            asyncio.get_event_loop().create_task(task.run())
+            task_data = self._tasks[task_uuid] = TaskData(task)
+            msg = f'Task {task_uuid} has been created by {task.username()}'
+            if fingerprint:
+                task_data.fingerprint = fingerprint
+                self._fingerprints[fingerprint] = task_uuid
+
+            area = TaskArea.from_payload(payload)
+            blockers = self._spatial_index.intersecting(area) if area else set()
+            if area:
+                self._spatial_index.add(task_uuid, area)
+
+            if blockers:
+                self._blocked_by[task_uuid] = blockers
+                for blocker_uuid in blockers:
+                    self._blocking.setdefault(blocker_uuid, set()).add(task_uuid)
+                task_data.set_queued(f'waiting for {len(blockers)} overlapping task(s)')
+                self._notify_task_changed(task_data)
+            else:
+                self._submit_task(task_data)
 
         else:
             self._event_logger.error(msg)
+            task_uuid = None
 
-        self._log_task_info()
+        return ok, msg, task_uuid
 
-        return ok, msg
+    def task_status(self, task_uuid: uuid.UUID) -> Union[Dict[str, Any], None]:
+        """
+        :return: descriptor of the running or recently closed task, None if the task is unknown
+        """
+        if task_uuid in self._tasks:
+            return self._task_status(self._tasks[task_uuid])
+        return self._closed_tasks.get(task_uuid)
+
+    async def wait_task_status(self, task_uuid: uuid.UUID, since_version: int,
+                               timeout: float) -> Union[Dict[str, Any], None]:
+        """
+        Waits up to timeout seconds for the task version to exceed since_version
+        :return: descriptor of the task, None if the task is unknown
+        """
+        status = self.task_status(task_uuid)
+        if status is None or status['version'] > since_version or task_uuid not in self._tasks:
+            return status
+
+        watcher = asyncio.get_event_loop().create_future()
+        watchers = self._task_watchers.setdefault(task_uuid, [])
+        watchers.append(watcher)
+        try:
+            await asyncio.wait_for(watcher, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            if watcher in watchers:
+                watchers.remove(watcher)
+            if not watchers and self._task_watchers.get(task_uuid) is watchers:
+                del self._task_watchers[task_uuid]
+
+        return self.task_status(task_uuid)
 
     def request_stop_task(self, task_uuid: uuid.UUID, username: str):
 
@@ -155,6 +359,22 @@ class TaskManager(TaskManagerInterface):
 
         task_data = self._tasks[task_uuid]
         task_data.close_requested = True
+        if task_data.fingerprint:
+            #  The closing task is no longer a substitute for new identical submissions
+            del self._fingerprints[task_data.fingerprint]
+            task_data.fingerprint = None
+
+        if task_uuid in self._blocked_by:
+            for blocker_uuid in self._blocked_by.pop(task_uuid):
+                self._blocking[blocker_uuid].discard(task_uuid)
+            task_data.set_failed(f'cancelled by {username}')
+            self.notify_task_closed(task_uuid)
+            return True, 'Task has been removed from the queue'
+
+        if self._admission.remove(task_uuid):
+            task_data.set_failed(f'cancelled by {username}')
+            self.notify_task_closed(task_uuid)
+            return True, 'Task has been removed from the queue'
 
         not_found = True
 
@@ -188,14 +408,15 @@ class TaskManager(TaskManagerInterface):
             self._event_logger.warning(msg)
             return
 
-        req_data.queue.put_nowait(response)
+        REPLIES.inc(req_data.routing_key, ResponseStatus.verbose(response.status))
+        self._dispatcher.dispatch(response.request_id, response)
 
     def tear_down_request(self, request_id: uuid.UUID):
 
         if request_id in self._requests:
             response = ResponseObject(str(request_id), ResponseStatus.FAILED, progress=1.0,
                                       message='Tear down from server side')
-            self._requests[request_id].queue.put_nowait(response)
+            self._dispatcher.dispatch(request_id, response)
         else:
             msg = f'Attempt to tear down unknown request: {request_id}'
             Log.warn(msg)
@@ -205,13 +426,16 @@ class TaskManager(TaskManagerInterface):
 
         require(rpc.status in (RPCStatus.IN_PROGRESS, RPCStatus.WAITING))
         require(rpc.uuid in self._requests)
-        task = self._tasks[self._requests[rpc.uuid].task_uuid].task
+        task_uuid = self._requests[rpc.uuid].task_uuid
+        task = self._tasks[task_uuid].task
 
-        req = self._close_requests[rpc.uuid] = CloseRequest(task_uuid=self._requests[rpc.uuid].task_uuid,
+        req = self._close_requests[rpc.uuid] = CloseRequest(task_uuid=task_uuid,
                                                             rpc_uuid=rpc.uuid,
                                                             task_name=task.name(),
                                                             username=username,
                                                             queue=asyncio.Queue())
+        self._task_close_requests.setdefault(task_uuid, set()).add(rpc.uuid)
+        rpc.close_requested = True
         Log.trace('new close request')
         self._log_close_requests_info()
 
@@ -243,6 +467,9 @@ class TaskManager(TaskManagerInterface):
     def is_close_requested(self, rpc: RPCData):
         return rpc.uuid in self._close_requests
 
+    def task_close_requests(self, task_uuid: uuid.UUID) -> List[CloseRequest]:
+        return [self._close_requests[rpc_uuid] for rpc_uuid in self._task_close_requests.get(task_uuid, ())]
+
     async def _run_close_request(self, req: CloseRequest, rpc: RPCData):
 
         if rpc.status == RPCStatus.WAITING:
@@ -253,6 +480,7 @@ class TaskManager(TaskManagerInterface):
             timeout = TaskManager.CLOSE_TIMEOUT
 
         termination_requested = False
+        created = time()
 
         while True:
             begin = time()
@@ -270,9 +498,10 @@ class TaskManager(TaskManagerInterface):
 
                 elif rsp == RPCStatus.COMPLETED:
                     req.set_completed()
+                    CLOSE_TIME.observe(time() - created, 'terminated' if termination_requested else 'closed')
                     self._rpc_manager.notify_task_closed(req.rpc_uuid, req.username)
                     self._event_logger.notify_task_closed(req.uuid)
-                    del self._close_requests[req.rpc_uuid]
+                    self._remove_close_request(req)
                     break
 
             except asyncio.TimeoutError as err:
@@ -280,14 +509,16 @@ class TaskManager(TaskManagerInterface):
                     ok, msg = self._rpc_manager.close_request(req.rpc_uuid, req.username, terminate=True)
                     require(ok)
                     req.set_terminate_requested()
+                    rpc.terminate_requested = True
                     timeout = TaskManager.TERMINATE_TIMEOUT
                     termination_requested = True
 
                 else:
                     req.set_failed()
+                    CLOSE_TIME.observe(time() - created, 'failed')
                     self._rpc_manager.notify_task_closed(req.rpc_uuid, req.username)  # TODO: ?
                     self._event_logger.notify_task_closed(req.uuid)
-                    del self._close_requests[req.rpc_uuid]
+                    self._remove_close_request(req)
                     self.tear_down_request(rpc.uuid)
                     break
             finally:
@@ -301,12 +532,101 @@ class TaskManager(TaskManagerInterface):
                                        error_callback=self.ErrorCallbackHandler(self._event_logger))
 
         self._rpc_manager.run_async(io_loop)
+        self._dispatcher.run_in_loop(io_loop)
+
+        if TaskManager.MAX_QUEUE_BACKLOG > 0:
+            self._queue_monitor = QueueDepthMonitor(self._amqp_url, RPCRegistry.queue_names())
+            self._queue_monitor.run_in_loop(io_loop)
 
     def lock_manager(self) -> EditLockManagerInterface:
         return self._lock_manager
 
+    async def _complete_from_cache(self, task_data: TaskData, routing_key: str, fingerprint: str,
+                                   task_input: TaskInputInterface) -> bool:
+        """
+        Completes the step without running it if the same input has been processed
+        and the area of the input has not been edited since then
+        """
+        entry = self._step_cache.get(routing_key, fingerprint)
+        if entry is None:
+            return False
+
+        edited_cells = await asyncio.get_event_loop().run_in_executor(
+            None, self._lock_manager.edited_cells_since, entry.watermark)
+        if edited_cells is None:
+            self._step_cache.discard(routing_key, fingerprint)
+            return False
+        if edited_cells:
+            area = TaskArea.from_payload(task_input.to_dict())
+            if area is None or area.intersects_cells(edited_cells):
+                self._step_cache.discard(routing_key, fingerprint)
+                return False
+
+        task_data.requests.append(RPCData(uuid.uuid4(), routing_key, 1.0, RPCStatus.COMPLETED,
+                                          f'{entry.message} (cached)'))
+        self._notify_task_changed(task_data)
+        Log.trace(f'{routing_key} of task {shorten_uuid(task_data.task.uuid())} has been completed from cache')
+        return True
+
+    @staticmethod
+    def _task_status(task_data: TaskData) -> Dict[str, Any]:
+        status = task_descriptor(task_data)
+        status['version'] = task_data.version
+        return status
+
+    def _notify_task_changed(self, task_data: TaskData):
+        """
+        Bumps the task version, sends the task to the event log and wakes up the long-polling clients
+        """
+        task_data.version += 1
+        self._event_logger.update_task(task_data)
+
+        for watcher in self._task_watchers.pop(task_data.task.uuid(), ()):
+            if not watcher.done():
+                watcher.set_result(task_data.version)
+
+    def _attach_task(self, task_data: TaskData, username: str) -> (bool, str):
+
+        task_data.attach(username)
+        self._notify_task_changed(task_data)
+        return True, f'Identical task {task_data.task.uuid()} is running, {username} has been attached to it'
+
+    def _submit_task(self, task_data: TaskData):
+
+        task_uuid = task_data.task.uuid()
+        self._admission.push(task_uuid, task_data.task.username())
+        self._admit_tasks()
+        if self._admission.is_queued(task_uuid):
+            task_data.set_queued()
+            self._notify_task_changed(task_data)
+
+    def _admit_tasks(self):
+
+        for task_uuid in self._admission.admit():
+            asyncio.get_event_loop().create_task(self._tasks[task_uuid].task.run())
+
+    def _register_request(self, task_data: TaskData, rpc: RPCData):
+
+        task_uuid = task_data.task.uuid()
+        task_data.requests.append(rpc)
+        self._requests[rpc.uuid] = RequestData(task_uuid, rpc.routing_key)
+        self._task_requests.setdefault(task_uuid, set()).add(rpc.uuid)
+
+    def _remove_close_request(self, req: CloseRequest):
+
+        del self._close_requests[req.rpc_uuid]
+        rpc_uuids = self._task_close_requests.get(req.task_uuid)
+        if rpc_uuids is not None:
+            rpc_uuids.discard(req.rpc_uuid)
+            if not rpc_uuids:
+                del self._task_close_requests[req.task_uuid]
+
     def _log_close_requests_info(self, log_level=Log.TRACE):
-         Log.log_message(log_level, log_type=Log.CONSOLE, message='''
+
+        if Log.get_log_level() > log_level:
+            return
+
+        Log.log_message(log_level, log_type=Log.CONSOLE, message='''
 close requests:
 ------------------------------------
 {requests}
@@ -315,6 +635,9 @@ close requests:
 
     def _log_task_info(self, log_level=Log.TRACE):
 
+        if Log.get_log_level() > log_level:
+            return
+
         Log.log_message(log_level, log_type=Log.CONSOLE, message='''
 active tasks
 ------------------------------------
@@ -1,5 +1,6 @@
 import uuid
 import asyncio
+from time import time
 from typing import *
 from PluginEngine.asserts import require
 from PluginEngine.quadtree import QCell, make_cell_by_raw_index
@@ -9,6 +10,7 @@ from backend.task_scheduler_service.common import TaskManagerInterface, TaskInte
 from backend.task_scheduler_service.rpc_common import RPCRegistry, RPCStatus, RPCData
 from backend.task_scheduler_service.scenario_provider import ScenarioProvider
 from backend.task_scheduler_service.rpc_common import shorten_uuid
+from backend.task_scheduler_service.task_area import split_rect
 
 
 TaskStatus = RPCStatus
@@ -93,8 +95,10 @@ class InputProducer:
         self._locked_cells: Set[LockedData] = set()
         self._locked_objects: Set[LockedData] = set()
 
-    def make_task_input(self) -> TaskInput:
+    def make_task_input(self, tile: Optional[Dict[str, float]] = None) -> TaskInput:
         data = dict(self._data)
+        if tile is not None:
+            data['rect'] = tile
 
         if self._locked_cells:
             d = {}
@@ -122,6 +126,9 @@ class InputProducer:
     def remove_locked_objects(self, objects: LockedData):
         self._locked_objects.remove(objects)
 
+    def has_locked_data(self) -> bool:
+        return bool(self._locked_cells or self._locked_objects)
+
     @staticmethod
     def _add_cells_to_dict(lock: LockedData, output: Dict[Tuple[int, int], Set[QCell]]):
         for type_id, subtypes in lock:
@@ -162,6 +169,7 @@ class Task(TaskInterface):
         self._task_manager = task_manager
         self._lock_manager = lock_manager
         self._input_producer = InputProducer(self._init_payload)
+        self._tiles = []
 
     def task_manager(self):
         return self._task_manager
@@ -175,8 +183,14 @@ class Task(TaskInterface):
     def init_payload(self) -> dict:
         return self._init_payload
 
-    def make_task_input(self) -> TaskInputInterface:
-        return self._input_producer.make_task_input()
+    def make_task_input(self, tile: Optional[Dict[str, float]] = None) -> TaskInputInterface:
+        return self._input_producer.make_task_input(tile)
+
+    def tiles(self) -> List[Dict[str, float]]:
+        return self._tiles
+
+    def has_locked_data(self) -> bool:
+        return self._input_producer.has_locked_data()
 
     def load(self, provider: ScenarioProvider) -> (bool, str):
 
@@ -194,6 +208,9 @@ class Task(TaskInterface):
         if not ok:
             return False, msg
 
+        if self._scenario.tile_size() and self._init_payload.get('rect'):
+            self._tiles = split_rect(self._init_payload['rect'], self._scenario.tile_size())
+
         self._valid = True
         return True, 'Ok'
 
@@ -201,6 +218,12 @@ class Task(TaskInterface):
         if self._scenario:
             return self._scenario.name()
 
+    def deduplicate(self) -> bool:
+        return bool(self._scenario and self._scenario.deduplicate())
+
+    def step_cache_enabled(self) -> bool:
+        return bool(self._scenario and self._scenario.step_cache())
+
     def add_cells(self, cells: LockedData):
         self._input_producer.add_locked_cells(cells)
 
@@ -232,21 +255,47 @@ class TaskData:
         self._status = TaskStatus.INACTIVE
         self.message = ''
         self.close_requested = False
+        self.fingerprint = None
+        self.subscribers = [task.username()]
+        self.version = 0
+        self.created = time()
+        self.finished = None
+
+    def attach(self, username: str):
+        """
+        Adds the submitter of an identical task which is served by this one
+        """
+        self.subscribers.append(username)
 
     def status(self):
         return self._status
 
+    def progress(self) -> float:
+        """
+        Mean progress of the started steps, the tiles of a split rect count as separate steps
+        """
+        if not self.requests:
+            return 0.0
+        return sum(1.0 if rpc.status == RPCStatus.COMPLETED else rpc.progress for rpc in self.requests) / \
+            len(self.requests)
+
     def set_waiting(self):
         if self._status <= TaskStatus.WAITING:
             self._status = TaskStatus.WAITING
             self.message = 'waiting'
 
+    def set_queued(self, msg='queued'):
+        if self._status <= TaskStatus.WAITING:
+            self._status = TaskStatus.WAITING
+            self.message = msg
+
     def set_in_progress(self):
         if self._status <= TaskStatus.IN_PROGRESS:
             self._status = TaskStatus.IN_PROGRESS
             self.message = 'in progress'
 
     def set_closed(self):
+        self.finished = time()
         if self._status != TaskStatus.FAILED:
             self._status = TaskStatus.COMPLETED
             self.message = 'completed'
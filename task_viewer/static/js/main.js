@@ -9,7 +9,8 @@ Object.freeze(EventType);
 const LogLevel = {"TRACE": 0, "DEBUG": 1, "INFO": 2, "WARN": 3, "ERROR": 4, "SUCCESS": 5};
 Object.freeze(LogLevel);
 
-const CMDType = {"OK": 0, "CLOSE_TASK": 1, "NOTIFY_TASK_CLOSED": 2, "LOAD_LOG": 3, "TERMINATE_TASK": 4};
+const CMDType = {"OK": 0, "CLOSE_TASK": 1, "NOTIFY_TASK_CLOSED": 2, "LOAD_LOG": 3, "TERMINATE_TASK": 4, "RESYNC": 5,
+                 "SEARCH": 6};
 Object.freeze(CMDType);
 
 const TaskStatusToLogLevel = [2, 2, 2, 2, 4];
@@ -18,9 +19,13 @@ const LogLevelToBSClass = ["text-muted", "text-muted", "text", "text-warning", "
 const RPCStatusToText = ["inactive", "waiting", "in progress", "completed", "failed"];
 
 const EVENT_INCREMENT = 30
+const SEARCH_INCREMENT = 30
 var sock
 var min_event_id = Number.MAX_SAFE_INTEGER
 var username = "undefined" // TODO
+var taskStates = {} // the last known descriptors of the tasks updated by deltas
+var search_query = ""
+var search_offset = 0
 
 /**
  * @param {String} HTML representing a single element
@@ -146,7 +151,10 @@ function updateTaskHeader(taskBlock, task){
     p.setAttribute('class', 'task-header ' + LogLevelToBSClass[level]);
 
     span = taskBlock.querySelector('.task-message');
-    span.innerText = task.message;
+    if(task.status == TaskStatus.IN_PROGRESS && task.progress !== undefined)
+        span.innerText = `${task.message} (${Math.floor(task.progress * 100.0)}%)`;
+    else
+        span.innerText = task.message;
 }
 
 function updateCloseBtn(taskBlock, obj){
@@ -191,9 +199,55 @@ function updateCMDDescription(obj) {
     updateTaskBlock(messageElem, obj, false, false);
 }
 
-function showLog(json_data) {
-//    console.log('data: ', json_data)
-    let obj = JSON.parse(json_data);
+// apply the task delta to the known state, request the whole state if an update is missed
+function applyDelta(obj) {
+    let state = taskStates[obj.uuid];
+    if(!state || obj.seq != state.seq + 1) {
+        delete taskStates[obj.uuid];
+        sock.send(JSON.stringify({
+        'cmd': CMDType.RESYNC,
+        'request_id': obj.uuid
+        }));
+        return null;
+    }
+    Object.assign(state, obj.fields);
+    for(let [index, fields] of obj.steps) {
+        state.steps[index] = Object.assign(state.steps[index] || {}, fields);
+    }
+    state.seq = obj.seq;
+    return state;
+}
+
+function trackState(obj) {
+    if(obj.seq === undefined)
+        return obj;
+    if(obj.delta)
+        obj = applyDelta(obj);
+    else
+        taskStates[obj.uuid] = obj;
+    if(obj && obj.status >= TaskStatus.COMPLETED)
+        delete taskStates[obj.uuid];
+    return obj;
+}
+
+// data: the message decoded from a JSON text frame or a msgpack binary frame
+function showLog(data) {
+//    console.log('data: ', data)
+    if(data.hits !== undefined) {
+        showSearchHits(data);
+    } else if(Array.isArray(data)) {
+        // a page of the log history
+        for(let item of data)
+            showLogObject(item);
+    } else {
+        showLogObject(data);
+    }
+}
+
+function showLogObject(obj) {
+    obj = trackState(obj);
+    if(!obj)
+        return;
     if(obj.id > 0 && min_event_id > obj.id) {
         min_event_id = obj.id;
     }
@@ -204,10 +258,37 @@ function showLog(json_data) {
     else if(obj.type == EventType.CMD)
         updateCMDDescription(obj);
     else
-        showMessage('Error: unknown log type, message: ' + json_data);
+        showMessage('Error: unknown log type, message: ' + JSON.stringify(obj));
     //window.scrollTo(0,document.body.scrollHeight);
 }
 
+// show the search hits in div#searchResults, the first page replaces the previous results
+function showSearchHits(data) {
+    if(data.query != search_query)
+        return;
+    let resultsElem = document.getElementById('searchResults');
+    if(data.offset == 0)
+        resultsElem.innerHTML = '';
+    for(let hit of data.hits) {
+        let text = hit.type == EventType.MESSAGE ? hit.msg :
+            `${hit.name} ${hit.uuid.slice(0, 8)}: ${hit.message} (${RPCStatusToText[hit.status]})`;
+        let level = hit.type == EventType.MESSAGE ? hit.level : TaskStatusToLogLevel[hit.status];
+        resultsElem.append(prepareMsgElement(new Date(hit.created), text, level));
+    }
+    search_offset = data.offset + data.hits.length;
+    $('#searchMore').toggle(data.hits.length == SEARCH_INCREMENT);
+}
+
+function searchEvents(query, offset){
+    search_query = query;
+    sock.send(JSON.stringify({
+    'cmd': CMDType.SEARCH,
+    'query': query,
+    'count': SEARCH_INCREMENT,
+    'offset': offset
+    }));
+}
+
 function onCloseBtnClick(task_id) {
     sock.send(JSON.stringify({
     'cmd': CMDType.CLOSE_TASK,
@@ -239,12 +320,16 @@ $(document).ready(function(){
 
     function connect() {
 
+        // the binary encoding is requested if the decoder is loaded, JSON is used otherwise
+        let query = '/ws?protocol=2' + (typeof msgpackDecode === 'function' ? '&encoding=msgpack' : '');
         try{
-            sock = new WebSocket('ws://' + window.location.host + '/ws');
+            sock = new WebSocket('ws://' + window.location.host + query);
         }
         catch(err){
-            sock = new WebSocket('wss://' + window.location.host + '/ws');
+            sock = new WebSocket('wss://' + window.location.host + query);
         }
+        sock.binaryType = 'arraybuffer';
+        taskStates = {};
 
         sock.onopen = function(){
             showMessage('Connection to server started');
@@ -257,12 +342,15 @@ $(document).ready(function(){
 
         // income message handler
         sock.onmessage = function(event) {
-            if(event.data == 'ready') {
+            if(event.data instanceof ArrayBuffer) {
+                showLog(msgpackDecode(event.data));
+            }
+            else if(event.data == 'ready') {
                 $('.temporary').remove();
 //                window.scrollTo(0, document.body.scrollHeight);
             }
             else {
-                showLog(event.data);
+                showLog(JSON.parse(event.data));
             }
         };
 
@@ -305,4 +393,18 @@ $(document).ready(function(){
     $('#loadMore').click(function(){
         loadEvents(EVENT_INCREMENT);
     });
+
+    $('#search').keyup(function(e){
+        if(e.keyCode == 13){
+            let query = $('#search').val().trim();
+            if(query)
+                searchEvents(query, 0);
+            else
+                $('#searchResults').empty();
+        }
+    });
+
+    $('#searchMore').click(function(){
+        searchEvents(search_query, search_offset);
+    });
 });
@@ -6,8 +6,10 @@ from datetime import datetime
 from aiohttp import web
 
 from PluginEngine import Log
+from LandscapeEditor.backend.config import SERVICE_CONFIG
 from backend.task_scheduler_service.rpc_common import CMDType
 from backend.task_scheduler_service.schemas import SOCKET_MESSAGE_SCHEMA
+from backend.task_scheduler_service.ws_client import WebSocketClient, ENCODINGS
 
 
 class ChatList(web.View):
@@ -24,16 +26,23 @@ class ChatList(web.View):
 
 class WebSocket(web.View):
     async def get(self):
-        ws = web.WebSocketResponse()
+        #  permessage-deflate is used if the client offers it in the handshake
+        ws = web.WebSocketResponse(compress=bool(int(SERVICE_CONFIG['task_scheduler_service'].get('ws_compress', 1))))
         await ws.prepare(self.request)
 
         # session = await get_session(self.request)
         # user = User(self.request.db, {'id': session.get('user')})
         # login = await user.get_login()
 
-        for _ws in self.request.app['websockets']:
-            await _ws.send_str('joined')
-        self.request.app['websockets'].append(ws)
+        for client in self.request.app['websockets']:
+            client.send('joined')
+        #  Protocol 2: task updates are sent as deltas; encoding=msgpack: the messages are sent as binary frames
+        encoding = self.request.query.get('encoding', 'json')
+        if encoding not in ENCODINGS:
+            Log.info(f'Unknown websocket encoding: {encoding}, JSON is used')
+            encoding = 'json'
+        client = WebSocketClient(ws, delta=self.request.query.get('protocol') == '2', encoding=encoding)
+        self.request.app['websockets'].append(client)
 
         async for msg in ws:
 
@@ -47,7 +56,15 @@ class WebSocket(web.View):
                         self.request.app['task_manager'].request_stop_task(
                             task_uuid=uuid.UUID(cmd['request_id']), username=cmd['username'])
                     elif cmd['cmd'] == CMDType.LOAD_LOG:
-                        await self.request.app['logger'].load_log(ws, cmd['count'], cmd['less_than'])
+                        logger = self.request.app['logger']
+                        await logger.load_log(client, cmd['count'], cmd['less_than'], **logger.parse_filters(cmd))
+                    elif cmd['cmd'] == CMDType.RESYNC:
+                        self.request.app['logger'].resync(client, cmd['request_id'])
+                    elif cmd['cmd'] == CMDType.SEARCH:
+                        logger = self.request.app['logger']
+                        hits = await logger.search(cmd['query'], cmd['count'], cmd.get('offset', 0),
+                                                   **logger.parse_filters(cmd))
+                        client.send({'query': cmd['query'], 'offset': cmd.get('offset', 0), 'hits': hits})
                     else:
                         Log.error(f'Unsupported cmd: {cmd}')
                 except json.JSONDecodeError as err:
@@ -55,6 +72,9 @@ class WebSocket(web.View):
 
                 except jsonschema.ValidationError as err:
                     Log.info(f'Incorrect JSON format: {err}')
+
+                except ValueError as err:
+                    Log.info(f'Incorrect command argument: {err}')
                 # message = Message(self.request.db)
                 # result = await message.save(user=login, msg=msg.data)
                 # log.debug(result)
@@ -63,9 +83,10 @@ class WebSocket(web.View):
             # elif msg.tp == MsgType.error:
             #     Log.debug('ws connection closed with exception %s' % ws.exception())
 
-        self.request.app['websockets'].remove(ws)
-        for _ws in self.request.app['websockets']:
-            await _ws.send_str('disconected')
+        self.request.app['websockets'].remove(client)
+        await client.close()
+        for _client in self.request.app['websockets']:
+            _client.send('disconected')
         Log.debug('websocket connection closed')
 
         return ws
\ No newline at end of file
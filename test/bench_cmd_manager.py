@@ -0,0 +1,81 @@
+"""
+Measures the latency of the task open/close handshake between the consumer processes and CMDManager
+and the CPU time CMDManager spends while the consumers are idle,
+with the pipes watched by the event loop and with the pipes polled every CMD_SLEEP_SEC.
+The RPC server is mocked, so RabbitMQ is not required.
+"""
+import uuid
+import asyncio
+import statistics
+from time import perf_counter, process_time
+from multiprocessing import Process, Queue, Event
+from unittest.mock import MagicMock
+from backend.task_scheduler_service.rpc_common import CMDManager, CMDHandler
+
+
+PROCESS_COUNT = 64
+HANDSHAKE_COUNT = 50
+IDLE_SEC = 2.0
+
+
+def run_consumer(handler: CMDHandler, handshake_count: int, start: Event, results: Queue):
+
+    start.wait()
+    latencies = []
+    for _ in range(handshake_count):
+        begin = perf_counter()
+        handler.try_open_task(uuid.uuid4())
+        opened = perf_counter()
+        handler.notify_task_closed()
+        latencies.append((opened - begin, perf_counter() - opened))
+    results.put(latencies)
+
+
+async def measure(event_driven: bool):
+
+    loop = asyncio.get_event_loop()
+    manager = CMDManager(rpc_server=MagicMock())
+    handlers = [manager.create_cmd_handler(process_id) for process_id in range(PROCESS_COUNT)]
+    if event_driven:
+        manager.run_in_loop(loop)
+    else:
+        loop.create_task(manager._poll_coro())
+
+    begin = process_time()
+    await asyncio.sleep(IDLE_SEC)
+    idle_cpu = process_time() - begin
+
+    # the handshakes begin when all the processes have been started
+    start = Event()
+    results = Queue()
+    processes = [Process(target=run_consumer, args=(handler, HANDSHAKE_COUNT, start, results))
+                 for handler in handlers]
+    for process in processes:
+        process.start()
+    await asyncio.sleep(1.0)
+    start.set()
+
+    latencies = []
+    for _ in processes:
+        latencies.extend(await loop.run_in_executor(None, results.get))
+    for process in processes:
+        await loop.run_in_executor(None, process.join)
+
+    for name, values in (('open', [item[0] for item in latencies]), ('close', [item[1] for item in latencies])):
+        values.sort()
+        print(f'  {name}: mean {statistics.mean(values) * 1000:.2f} ms, '
+              f'p50 {values[len(values) // 2] * 1000:.2f} ms, p95 {values[int(len(values) * 0.95)] * 1000:.2f} ms')
+    print(f'  idle CPU time: {idle_cpu / IDLE_SEC * 100:.1f}% of {IDLE_SEC} s')
+
+
+def run_benchmark():
+
+    print(f'{PROCESS_COUNT} consumer processes, {HANDSHAKE_COUNT} handshakes each')
+    for event_driven in (True, False):
+        print('event driven (add_reader):' if event_driven else 'polling:')
+        asyncio.run(measure(event_driven))
+
+
+if __name__ == '__main__':
+
+    run_benchmark()
@@ -0,0 +1,69 @@
+"""
+Measures how long a consumer process takes to become ready with the default start method of the platform
+(the server has the heavy modules imported, like rpc_server.py does), with fork and the gc frozen,
+with spawn and when forked from the template with the heavy modules preloaded.
+aiohttp stands for the generator stack, so neither RabbitMQ nor LandscapeEditor is required
+"""
+import gc
+import time
+import statistics
+import multiprocessing
+from multiprocessing import Pipe
+
+
+PROCESS_COUNT = 16
+HEAVY_MODULES = ['aiohttp']
+TEMPLATE_MODULE = 'backend.task_scheduler_service.consumer_template'
+
+
+def run_consumer(conn):
+
+    for name in HEAVY_MODULES:
+        __import__(name)
+    conn.send(time.monotonic())
+    conn.close()
+
+
+def measure(context, freeze: bool = False):
+
+    latencies = []
+    for _ in range(PROCESS_COUNT):
+        parent_conn, child_conn = Pipe()
+        begin = time.monotonic()
+        process = context.Process(target=run_consumer, args=(child_conn,))
+        if freeze:
+            gc.freeze()
+        process.start()
+        if freeze:
+            gc.unfreeze()
+        latencies.append(parent_conn.recv() - begin)
+        process.join()
+
+    first, rest = latencies[0], sorted(latencies[1:])
+    print(f'  first: {first * 1000:.1f} ms, next: mean {statistics.mean(rest) * 1000:.1f} ms, '
+          f'p95 {rest[int(len(rest) * 0.95)] * 1000:.1f} ms')
+
+
+def run_benchmark():
+
+    for name in HEAVY_MODULES:
+        __import__(name)
+
+    print(f'{PROCESS_COUNT} processes started one by one, ready when {", ".join(HEAVY_MODULES)} is imported')
+    print(f'default ({multiprocessing.get_start_method()}):')
+    measure(multiprocessing.get_context())
+    if 'fork' in multiprocessing.get_all_start_methods():
+        print('fork with the gc frozen:')
+        measure(multiprocessing.get_context('fork'), freeze=True)
+    print('spawn:')
+    measure(multiprocessing.get_context('spawn'))
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        print('template (forkserver with preload):')
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(HEAVY_MODULES + [TEMPLATE_MODULE])
+        measure(context)
+
+
+if __name__ == '__main__':
+
+    run_benchmark()
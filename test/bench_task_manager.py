@@ -0,0 +1,62 @@
+"""
+Measures the cost of TaskManager.notify_task_closed with many tasks in flight.
+The RPC manager and the task logger are mocked, so neither RabbitMQ nor the log DB is required.
+"""
+import uuid
+from time import perf_counter
+from unittest.mock import MagicMock
+from PluginEngine.common import empty_uuid
+from backend.task_scheduler_service.rpc_common import RPCData, RPCStatus
+from backend.task_scheduler_service.task_manager import TaskManager
+from backend.task_scheduler_service.task_manager_common import Task, TaskData
+
+
+TASK_COUNT = 100000
+STEP_COUNT = 2
+BATCH_SIZE = 10000
+
+
+def create_rpc_manager_mock() -> MagicMock:
+
+    rpc_manager = MagicMock()
+    rpc_manager.request.side_effect = \
+        lambda routing_key, task_input: RPCData(uuid.uuid4(), routing_key, 0.0, RPCStatus.WAITING, 'sent')
+    return rpc_manager
+
+
+def populate(manager: TaskManager, task_count: int, step_count: int) -> list:
+
+    task_uuids = []
+    for _ in range(task_count):
+        task_uuid = uuid.uuid4()
+        task = Task(task_uuid, empty_uuid, {'username': 'bench'}, task_manager=manager, lock_manager=MagicMock())
+        task_data = manager._tasks[task_uuid] = TaskData(task)
+        for step in range(step_count):
+            rpc = manager._rpc_manager.request(f'step_{step}', None)
+            manager._register_request(task_data, rpc)
+        task_uuids.append(task_uuid)
+    return task_uuids
+
+
+def run_benchmark():
+
+    manager = TaskManager('amqp://bench', scenario_provider=MagicMock(), lock_manager=MagicMock(),
+                          task_logger=MagicMock())
+    manager._rpc_manager = create_rpc_manager_mock()
+
+    task_uuids = populate(manager, TASK_COUNT, STEP_COUNT)
+    print(f'{TASK_COUNT} tasks, {len(manager._requests)} requests in flight')
+
+    for begin in range(0, TASK_COUNT, BATCH_SIZE):
+        in_flight = len(manager._tasks)
+        start = perf_counter()
+        for task_uuid in task_uuids[begin:begin + BATCH_SIZE]:
+            manager.notify_task_closed(task_uuid)
+        elapsed = perf_counter() - start
+        print(f'{in_flight:>7} tasks in flight: {elapsed / BATCH_SIZE * 1e6:.2f} us per close')
+
+    assert not manager._tasks and not manager._requests and not manager._task_requests
+
+
+if __name__ == '__main__':
+    run_benchmark()
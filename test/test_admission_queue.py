@@ -0,0 +1,41 @@
+import unittest
+from backend.task_scheduler_service.admission_queue import FairAdmissionQueue, parse_user_weights
+
+
+class FairAdmissionQueueTestCase(unittest.TestCase):
+
+    def test_fair_order(self):
+
+        queue = FairAdmissionQueue(max_active=1)
+        for i in range(5):
+            queue.push(f'bulk_{i}', 'bulk_user')
+        queue.push('interactive', 'interactive_user')
+
+        order = []
+        while len(queue):
+            admitted = queue.admit()
+            self.assertEqual(len(admitted), 1)
+            order.extend(admitted)
+            queue.release(admitted[0])
+
+        self.assertEqual(order[:2], ['bulk_0', 'interactive'])
+        self.assertEqual(order[2:], ['bulk_1', 'bulk_2', 'bulk_3', 'bulk_4'])
+
+    def test_weights_and_removal(self):
+
+        queue = FairAdmissionQueue(max_active=0, weights=parse_user_weights('a: 2, b: 1'))
+        for i in range(2):
+            queue.push(f'a_{i}', 'a')
+            queue.push(f'b_{i}', 'b')
+        self.assertTrue(queue.remove('b_0'))
+        self.assertFalse(queue.remove('b_0'))
+
+        self.assertEqual(queue.admit(), ['a_0', 'a_1', 'b_1'])
+        self.assertEqual(queue.active_count(), 3)
+        self.assertTrue(queue.release('a_0'))
+        self.assertFalse(queue.release('b_0'))
+
+
+if __name__ == '__main__':
+
+    unittest.main()
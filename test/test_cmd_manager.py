@@ -0,0 +1,112 @@
+import os
+import uuid
+import asyncio
+import threading
+import unittest
+from unittest.mock import MagicMock
+from backend.task_scheduler_service.rpc_common import CMDManager, current_rss
+
+
+class CMDManagerTestCase(unittest.TestCase):
+
+    @staticmethod
+    def handshake(manager: CMDManager, process_id: int, target, *args):
+
+        result = []
+        thread = threading.Thread(target=lambda: result.append(target(*args)))
+        thread.start()
+        conn = manager._processes[process_id].conn
+        if conn.poll(5.0):
+            manager._poll(conn)
+        thread.join(5.0)
+        return result[0]
+
+    def test_close_flag(self):
+
+        manager = CMDManager(MagicMock())
+        handler = manager.create_cmd_handler(0)
+        task_uuid = uuid.uuid4()
+
+        self.assertTrue(self.handshake(manager, 0, handler.try_open_task, task_uuid))
+        self.assertFalse(handler.is_task_close_requested())
+
+        manager.close_request(task_uuid)
+        self.assertTrue(handler.is_task_close_requested())
+
+        self.handshake(manager, 0, handler.notify_task_closed)
+
+        # the flag of the previous task is not seen by the next one
+        self.assertTrue(self.handshake(manager, 0, handler.try_open_task, uuid.uuid4()))
+        self.assertFalse(handler.is_task_close_requested())
+
+    @unittest.skipUnless(os.name == 'posix', 'the pipes are watched on POSIX only')
+    def test_pipes_watched_without_processes(self):
+
+        loop = asyncio.SelectorEventLoop()
+        try:
+            manager = CMDManager(MagicMock())
+            manager.run_in_loop(loop)
+            # the pools may start empty, the pipe of the later process is watched too
+            handler = manager.create_cmd_handler(0)
+            task_uuid = uuid.uuid4()
+            opened = loop.run_until_complete(loop.run_in_executor(None, handler.try_open_task, task_uuid))
+            self.assertTrue(opened)
+            self.assertIn(task_uuid, manager._tasks_id_to_process_id)
+        finally:
+            loop.close()
+
+    def test_close_before_open(self):
+
+        manager = CMDManager(MagicMock())
+        handler = manager.create_cmd_handler(0)
+        task_uuid = uuid.uuid4()
+
+        manager.close_request(task_uuid)
+        self.assertFalse(self.handshake(manager, 0, handler.try_open_task, task_uuid))
+
+    def test_retire(self):
+
+        manager = CMDManager(MagicMock())
+        handler = manager.create_cmd_handler(0)
+        self.assertIsNotNone(manager.idle_since(0))
+
+        self.assertTrue(self.handshake(manager, 0, handler.try_open_task, uuid.uuid4()))
+        self.assertIsNone(manager.idle_since(0))
+        self.handshake(manager, 0, handler.notify_task_closed)
+        self.assertIsNotNone(manager.idle_since(0))
+
+        self.assertFalse(handler.is_retire_requested())
+        manager.retire_process(0)
+        self.assertTrue(handler.is_retire_requested())
+
+        manager.release_process(0)
+        self.assertNotIn(0, manager._processes)
+
+    def test_recycle(self):
+
+        manager = CMDManager(MagicMock())
+        handler = manager.create_cmd_handler(0, max_tasks=2)
+        for _ in range(2):
+            self.assertIsNone(manager.recycle_reason(0))
+            self.assertTrue(self.handshake(manager, 0, handler.try_open_task, uuid.uuid4()))
+            self.handshake(manager, 0, handler.notify_task_closed)
+
+        self.assertEqual(manager.recycle_reason(0), '2 tasks')
+        self.assertTrue(handler.is_retire_requested())
+
+    def test_recycle_rss(self):
+
+        manager = CMDManager(MagicMock())
+        handler = manager.create_cmd_handler(0, max_rss_mb=1)
+        self.assertTrue(self.handshake(manager, 0, handler.try_open_task, uuid.uuid4()))
+        self.handshake(manager, 0, handler.notify_task_closed)
+
+        if current_rss() is None:
+            self.skipTest('RSS is unknown on this platform')
+        self.assertTrue(manager.recycle_reason(0).startswith('RSS'))
+        self.assertTrue(handler.is_retire_requested())
+
+
+if __name__ == '__main__':
+
+    unittest.main()
@@ -0,0 +1,50 @@
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from backend.task_scheduler_service.log_archive import LogArchive
+
+
+def make_rows(ids, username='user'):
+    begin = datetime(2020, 1, 1)
+    return [{'id': i, 'created': begin + timedelta(minutes=i), 'username': username, 'event_type': 1, 'status': 3,
+             'data': {'type': 1, 'uuid': str(i)}} for i in ids]
+
+
+class LogArchiveTestCase(unittest.TestCase):
+
+    def test_query(self):
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+
+            archive = LogArchive(tmp_dir)
+            archive.append(make_rows([i for i in range(1, 11) if i != 6]))
+            archive.append(make_rows(range(11, 21), username='other'))
+            # a long running task archived later than the newer events
+            archive.append(make_rows([6]))
+
+            page = archive.query(5)
+            self.assertEqual([item['id'] for item in page], [20, 19, 18, 17, 16])
+            self.assertEqual(page[0]['uuid'], '20')
+            self.assertEqual(page[0]['created'], str(datetime(2020, 1, 1, 0, 20)))
+
+            page = archive.query(3, less_than=8)
+            self.assertEqual([item['id'] for item in page], [7, 6, 5])
+
+            page = archive.query(3, less_than=8, greater_than=5)
+            self.assertEqual([item['id'] for item in page], [7, 6])
+
+            page = archive.query(100, username='user', since=datetime(2020, 1, 1, 0, 9))
+            self.assertEqual([item['id'] for item in page], [10, 9])
+
+            page = archive.query(100, greater_than=17)
+            self.assertEqual([item['id'] for item in page], [20, 19, 18])
+
+            # the index is loaded by the new instance
+            self.assertEqual(len(LogArchive(tmp_dir).segments()), 3)
+            self.assertEqual(LogArchive(tmp_dir).max_id(), 20)
+            self.assertEqual(LogArchive(tempfile.mkdtemp(dir=tmp_dir)).max_id(), 0)
+
+
+if __name__ == '__main__':
+
+    unittest.main()
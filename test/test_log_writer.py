@@ -0,0 +1,138 @@
+import os
+import tempfile
+import threading
+import unittest
+from peewee import SqliteDatabase, Model, IntegerField, CharField
+from backend.task_scheduler_service.log_writer import LogWriter
+
+
+class LogWriterTestCase(unittest.TestCase):
+
+    def test_write_behind(self):
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+
+            db = SqliteDatabase(os.path.join(tmp_dir, 'log.db'), pragmas={'journal_mode': 'wal'})
+
+            class Row(Model):
+                value = IntegerField()
+
+                class Meta:
+                    database = db
+
+            Row.create_table()
+            writer = LogWriter(db, Row, batch_size=7, flush_interval=0.05, max_queue_size=100)
+            writer.start()
+            for i in range(50):
+                self.assertTrue(writer.put({'value': i}))
+            writer.flush()
+            self.assertEqual(Row.select().count(), 50)
+
+            for i in range(5):
+                writer.put({'value': i})
+            writer.close()
+            self.assertEqual(Row.select().count(), 55)
+            self.assertEqual(writer.queue_depth(), 0)
+            db.close()
+
+    def test_upsert(self):
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+
+            db = SqliteDatabase(os.path.join(tmp_dir, 'log.db'))
+
+            class Row(Model):
+                value = IntegerField()
+                uuid = CharField(null=True, unique=True)
+
+                class Meta:
+                    database = db
+
+            Row.create_table()
+            writer = LogWriter(db, Row, batch_size=100, flush_interval=0.05, max_queue_size=100,
+                               conflict_target=Row.uuid, preserve=(Row.value,))
+            writer.start()
+            writer.put({'value': 0, 'uuid': 'task'})
+            writer.flush()
+            for i in range(1, 5):
+                writer.put({'value': i, 'uuid': 'task'})
+                writer.put({'value': -i, 'uuid': None})
+            writer.close()
+
+            self.assertEqual(Row.select().count(), 5)
+            self.assertEqual(Row.get(Row.uuid == 'task').value, 4)
+            db.close()
+
+    def test_flush_barrier(self):
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+
+            db = SqliteDatabase(os.path.join(tmp_dir, 'log.db'))
+
+            class Row(Model):
+                value = IntegerField()
+
+                class Meta:
+                    database = db
+
+            Row.create_table()
+            writer = LogWriter(db, Row, batch_size=10, flush_interval=0.05, max_queue_size=100)
+            writer.start()
+            writer.put({'value': -1})
+
+            # the rows put after the flush doesn't delay it
+            stop = threading.Event()
+
+            def produce():
+                while not stop.is_set():
+                    writer.put({'value': 0})
+
+            producer = threading.Thread(target=produce)
+            producer.start()
+            flushed = threading.Thread(target=writer.flush)
+            flushed.start()
+            flushed.join(5.0)
+            stop.set()
+            producer.join()
+
+            self.assertFalse(flushed.is_alive())
+            self.assertEqual(Row.select().where(Row.value == -1).count(), 1)
+            writer.close()
+            db.close()
+
+
+    def test_keyed_rows_are_never_dropped(self):
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+
+            db = SqliteDatabase(os.path.join(tmp_dir, 'log.db'))
+
+            class Row(Model):
+                value = IntegerField()
+                uuid = CharField(null=True, unique=True)
+
+                class Meta:
+                    database = db
+
+            Row.create_table()
+            writer = LogWriter(db, Row, batch_size=100, flush_interval=0.05, max_queue_size=2,
+                               conflict_target=Row.uuid, preserve=(Row.value,))
+            # the writer is not started, so the rows stay pending
+            self.assertTrue(writer.put({'value': 0, 'uuid': None}))
+            self.assertTrue(writer.put({'value': 0, 'uuid': None}))
+            self.assertFalse(writer.put({'value': 0, 'uuid': None}))
+            for i in range(10):
+                self.assertTrue(writer.put({'value': i, 'uuid': f'task{i % 3}'}))
+            self.assertEqual(writer.queue_depth(), 5)
+
+            writer.start()
+            writer.flush()
+            self.assertEqual(Row.select().count(), 5)
+            self.assertEqual(Row.get(Row.uuid == 'task0').value, 9)
+            writer.close()
+            db.close()
+
+
+if __name__ == '__main__':
+
+    unittest.main()
@@ -0,0 +1,32 @@
+import unittest
+from backend.task_scheduler_service.metrics import MetricsRegistry
+
+
+class MetricsRegistryTestCase(unittest.TestCase):
+
+    def test_render(self):
+
+        registry = MetricsRegistry()
+        replies = registry.counter('replies_total', 'Replies', ('routing_key',))
+        latency = registry.histogram('latency_seconds', 'Latency', ('routing_key',), buckets=(0.1, 1.0))
+        registry.gauge('active', 'Active', lambda: 3)
+
+        replies.inc('road_osm_import')
+        replies.inc('road_osm_import')
+        latency.observe(0.05, 'road_osm_import')
+        latency.observe(0.1, 'road_osm_import')
+        latency.observe(5.0, 'road_osm_import')
+
+        self.assertIs(registry.counter('replies_total', 'Replies', ('routing_key',)), replies)
+        text = registry.render()
+        self.assertIn('replies_total{routing_key="road_osm_import"} 2.0', text)
+        self.assertIn('latency_seconds_bucket{routing_key="road_osm_import",le="0.1"} 2', text)
+        self.assertIn('latency_seconds_bucket{routing_key="road_osm_import",le="1.0"} 2', text)
+        self.assertIn('latency_seconds_bucket{routing_key="road_osm_import",le="+Inf"} 3', text)
+        self.assertIn('latency_seconds_count{routing_key="road_osm_import"} 3', text)
+        self.assertIn('active 3', text)
+
+
+if __name__ == '__main__':
+
+    unittest.main()
@@ -0,0 +1,33 @@
+import unittest
+from backend.task_scheduler_service.common import payload_fingerprint
+
+
+class PayloadFingerprintTestCase(unittest.TestCase):
+
+    RECT = {'lon_min': 60.0, 'lon_max': 61.0, 'lat_min': 56.0, 'lat_max': 56.3}
+
+    def test_ignored_keys(self):
+
+        first = {'username': 'first', 'task_id': 'a', 'rect': self.RECT}
+        second = {'username': 'second', 'task_id': 'b', 'rect': dict(self.RECT)}
+        self.assertEqual(payload_fingerprint('scenario', first), payload_fingerprint('scenario', second))
+
+    def test_cell_order(self):
+
+        first = {'username': 'test', 'cells': [3, 1, 2],
+                 'locked_cells': [[2, None, [5, 4]], [1, 7, [9, 8]], [1, None, [6]]]}
+        second = {'username': 'test', 'cells': [1, 2, 3],
+                  'locked_cells': [[1, None, [6]], [2, None, [4, 5]], [1, 7, [8, 9]]]}
+        self.assertEqual(payload_fingerprint('scenario', first), payload_fingerprint('scenario', second))
+
+    def test_different_payloads(self):
+
+        payload = {'username': 'test', 'rect': self.RECT}
+        other_rect = {'username': 'test', 'rect': dict(self.RECT, lon_max=62.0)}
+        self.assertNotEqual(payload_fingerprint('scenario', payload), payload_fingerprint('scenario', other_rect))
+        self.assertNotEqual(payload_fingerprint('scenario', payload), payload_fingerprint('other', payload))
+
+
+if __name__ == '__main__':
+
+    unittest.main()
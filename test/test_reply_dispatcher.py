@@ -0,0 +1,55 @@
+import uuid
+import asyncio
+import unittest
+from backend.task_scheduler_service.reply_dispatcher import TimerWheel, ReplyDispatcher
+
+
+class TimerWheelTestCase(unittest.TestCase):
+
+    def test_expiration(self):
+
+        wheel = TimerWheel(tick_sec=1.0, slot_count=8)
+        wheel.advance(0.0)
+        wheel.schedule('a', 2.0)
+        wheel.schedule('b', 20.0)  # several rounds of the wheel
+        wheel.schedule('c', 3.0)
+        wheel.cancel('c')
+
+        self.assertEqual(wheel.advance(1.0), [])
+        self.assertEqual(wheel.advance(2.0), ['a'])
+        self.assertEqual(wheel.advance(19.0), [])
+        self.assertEqual(wheel.advance(100.0), ['b'])
+        self.assertEqual(len(wheel), 0)
+
+
+class ReplyDispatcherTestCase(unittest.TestCase):
+
+    def test_dispatch_and_timeout(self):
+
+        ReplyDispatcher.TICK_SEC = 0.01
+        loop = asyncio.new_event_loop()
+        dispatcher = ReplyDispatcher()
+        dispatcher.run_in_loop(loop)
+        request_id = uuid.uuid4()
+
+        async def scenario():
+            dispatcher.register(request_id, timeout=0.05)
+            self.assertTrue(dispatcher.dispatch(request_id, 1))
+            self.assertTrue(dispatcher.dispatch(request_id, 2))
+            self.assertEqual(await dispatcher.get(request_id), 1)
+            self.assertEqual(await dispatcher.get(request_id), 2)
+            with self.assertRaises(asyncio.TimeoutError):
+                await dispatcher.get(request_id)
+            dispatcher.unregister(request_id)
+            self.assertFalse(dispatcher.dispatch(request_id, 3))
+
+        try:
+            loop.run_until_complete(asyncio.wait_for(scenario(), 5.0))
+        finally:
+            ReplyDispatcher.TICK_SEC = 1.0
+            loop.close()
+
+
+if __name__ == '__main__':
+
+    unittest.main()
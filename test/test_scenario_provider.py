@@ -33,6 +33,8 @@ class ScenarioProviderTestCase(unittest.TestCase):
         node_0.add_child(node_2)
         expected.add_child(node_0)
         self.assertEqual(str(scenario), str(expected))
+        self.assertTrue(scenario.deduplicate())
+        self.assertEqual(scenario.tile_size(), 0.5)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,43 @@
+import unittest
+from datetime import datetime
+from backend.task_scheduler_service.stats_rollup import StatsSample, RollupStats, bucket_start
+
+
+def make_sample(duration, failed=False):
+    return StatsSample('road_osm_import', 'road', datetime(2020, 1, 1, 10, 30).timestamp(), duration, failed,
+                       False, False)
+
+
+class StatsRollupTestCase(unittest.TestCase):
+
+    def test_bucket_start(self):
+
+        timestamp = datetime(2020, 1, 1, 10, 30, 15).timestamp()
+        self.assertEqual(bucket_start(timestamp, 'hour'), datetime(2020, 1, 1, 10))
+        self.assertEqual(bucket_start(timestamp, 'day'), datetime(2020, 1, 1))
+        self.assertRaises(ValueError, bucket_start, timestamp, 'week')
+
+    def test_summary(self):
+
+        stats = RollupStats()
+        for i in range(1, 101):
+            stats.add(make_sample(float(i), failed=i % 10 == 0))
+        stats.add(make_sample(None))
+
+        other = RollupStats.from_fields(stats.to_fields())
+        other.merge(stats)
+
+        summary = other.summary()
+        self.assertEqual(summary['count'], 202)
+        self.assertEqual(summary['failed'], 20)
+        self.assertAlmostEqual(summary['mean_duration'], 50.5)
+        self.assertEqual(summary['max_duration'], 100.0)
+        # the percentiles are estimated within the histogram buckets
+        self.assertTrue(30.0 <= summary['p50_duration'] <= 60.0)
+        self.assertTrue(60.0 <= summary['p95_duration'] <= 100.0)
+        self.assertIsNone(RollupStats().summary()['p50_duration'])
+
+
+if __name__ == '__main__':
+
+    unittest.main()
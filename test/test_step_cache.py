@@ -0,0 +1,90 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from backend.task_scheduler_service.step_cache import StepResultCache
+from backend.task_scheduler_service.edit_lock_manager import EditLockManager
+
+
+class StepResultCacheTestCase(unittest.TestCase):
+
+    def test_lru(self):
+
+        cache = StepResultCache(max_size=2, max_age_sec=60)
+        cache.put('step', 'a', 1, 'a done')
+        cache.put('step', 'b', 1, 'b done')
+        # a is used, so b is the least recently used one
+        self.assertEqual(cache.get('step', 'a').message, 'a done')
+        cache.put('step', 'c', 1, 'c done')
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('step', 'b'))
+        self.assertIsNotNone(cache.get('step', 'a'))
+        self.assertIsNotNone(cache.get('step', 'c'))
+
+    def test_age(self):
+
+        cache = StepResultCache(max_size=10, max_age_sec=60)
+        with patch('backend.task_scheduler_service.step_cache.time', return_value=1000.0):
+            cache.put('step', 'a', 1, 'done')
+        with patch('backend.task_scheduler_service.step_cache.time', return_value=1060.0):
+            self.assertIsNotNone(cache.get('step', 'a'))
+        with patch('backend.task_scheduler_service.step_cache.time', return_value=1061.0):
+            self.assertIsNone(cache.get('step', 'a'))
+        self.assertEqual(len(cache), 0)
+
+    def test_discard(self):
+
+        cache = StepResultCache(max_size=10, max_age_sec=60)
+        cache.put('step_1', 'a', 1, 'done')
+        cache.put('step_2', 'a', 1, 'done')
+        cache.discard('step_1', 'a')
+        cache.discard('step_1', 'unknown')
+
+        self.assertIsNone(cache.get('step_1', 'a'))
+        self.assertIsNotNone(cache.get('step_2', 'a'))
+
+    def test_disabled(self):
+
+        cache = StepResultCache(max_size=0, max_age_sec=60)
+        cache.put('step', 'a', 1, 'done')
+        self.assertFalse(cache.enabled())
+        self.assertIsNone(cache.get('step', 'a'))
+
+
+class ConsumedEditsTestCase(unittest.TestCase):
+
+    def setUp(self):
+
+        patcher = patch('backend.task_scheduler_service.edit_lock_manager.UseDatabase')
+        use_database = patcher.start()
+        self.addCleanup(patcher.stop)
+        # the transient table is empty, every edit below has been consumed by a task
+        cursor = use_database.return_value.__enter__.return_value
+        cursor.fetchone.return_value = (0,)
+        cursor.__iter__.side_effect = lambda: iter([])
+        self.manager = EditLockManager(MagicMock())
+
+    def test_consumed_edits_are_seen(self):
+
+        self.manager._log_consumed_edits([(1, 10), (2, 20)])
+
+        self.assertEqual(self.manager.history_watermark(), 2)
+        self.assertEqual(len(self.manager.edited_cells_since(0)), 2)
+        self.assertEqual(len(self.manager.edited_cells_since(1)), 1)
+        self.assertEqual(self.manager.edited_cells_since(2), [])
+
+    def test_forgotten_edits(self):
+
+        self.manager.MAX_CONSUMED_EDITS = 2
+        self.manager._log_consumed_edits([(1, 10), (2, 20)])
+        self.manager._log_consumed_edits([(3, 30)])
+
+        # the record 1 is forgotten, so an edit newer than the watermark 0 may be missed
+        self.assertIsNone(self.manager.edited_cells_since(0))
+        self.assertEqual(len(self.manager.edited_cells_since(1)), 2)
+        self.assertEqual(len(self.manager.edited_cells_since(2)), 1)
+        self.assertEqual(self.manager.history_watermark(), 3)
+
+
+if __name__ == '__main__':
+
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+from backend.task_scheduler_service.task_area import TaskArea, SpatialIndex, BoundBox, split_rect
+
+
+def make_area(lon_min: float, lon_max: float, lat_min: float, lat_max: float) -> TaskArea:
+    return TaskArea.from_payload({'rect': {'lon_min': lon_min, 'lon_max': lon_max,
+                                           'lat_min': lat_min, 'lat_max': lat_max}})
+
+
+class SpatialIndexTestCase(unittest.TestCase):
+
+    def test_intersecting(self):
+
+        index = SpatialIndex(grid_step=0.25)
+        index.add('a', make_area(60.0, 60.1, 56.0, 56.1))
+        index.add('b', make_area(60.1, 60.2, 56.0, 56.1))  # shares a border with 'a'
+        index.add('country', make_area(0.0, 180.0, 0.0, 80.0))
+
+        self.assertEqual(index.intersecting(make_area(60.05, 60.15, 56.05, 56.06)), {'a', 'b', 'country'})
+        self.assertEqual(index.intersecting(make_area(60.12, 60.13, 56.05, 56.06)), {'b', 'country'})
+        self.assertEqual(index.intersecting(make_area(-10.0, -9.0, 56.0, 56.1)), set())
+
+        index.remove('country')
+        index.remove('b')
+        self.assertEqual(index.intersecting(make_area(60.05, 60.15, 56.05, 56.06)), {'a'})
+        self.assertEqual(len(index), 1)
+
+
+class SplitRectTestCase(unittest.TestCase):
+
+    def test_split(self):
+
+        rect = {'lon_min': 60.0, 'lon_max': 61.0, 'lat_min': 56.0, 'lat_max': 56.3}
+        self.assertEqual(split_rect(rect, tile_size=1.0), [])
+
+        tiles = split_rect(rect, tile_size=0.3)
+        self.assertEqual(len(tiles), 16)
+        boxes = list(map(BoundBox.from_rect, tiles))
+        self.assertTrue(all(box.width() <= 0.3 for box in boxes))
+        self.assertAlmostEqual(sum(box.width() * box.height() for box in boxes), 0.3)
+        self.assertEqual(max(box.lon_max for box in boxes), 61.0)
+        self.assertEqual(max(box.lat_max for box in boxes), 56.3)
+        self.assertFalse(any(a.intersects(b) for i, a in enumerate(boxes) for b in boxes[i + 1:]))
+
+
+if __name__ == '__main__':
+
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import tempfile
+import threading
+import unittest
+from datetime import datetime
+from backend.task_scheduler_service import task_logger
+from backend.task_scheduler_service.task_logger import TaskLogger, StatsRollup
+from backend.task_scheduler_service.stats_rollup import StatsSample
+
+
+def make_sample(routing_key, finished, duration, failed=False):
+    return StatsSample('road_osm_import', routing_key, finished.timestamp(), duration, failed, False, False)
+
+
+class TaskLoggerStatsTestCase(unittest.TestCase):
+
+    def setUp(self):
+
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        database = task_logger.db.database
+        task_logger.db.init(os.path.join(tmp_dir.name, 'log.db'), pragmas={'journal_mode': 'wal'})
+        self.addCleanup(task_logger.db.init, database, pragmas={'journal_mode': 'wal'})
+        self.addCleanup(task_logger.db.close)
+
+        StatsRollup.create_table()
+        # only the statistics are saved, so neither the log writer nor the archive is started
+        self.logger = TaskLogger.__new__(TaskLogger)
+        self.logger._stats_lock = threading.Lock()
+
+    def test_same_bucket(self):
+
+        self.logger.save_stats([make_sample('', datetime(2020, 1, 1, 10, 10), 10.0),
+                                make_sample('road', datetime(2020, 1, 1, 10, 10), 4.0)])
+        self.logger.save_stats([make_sample('', datetime(2020, 1, 1, 10, 50), 20.0, failed=True)])
+
+        rows = TaskLogger.query_stats('hour', routing_key='')
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['count'], 2)
+        self.assertEqual(rows[0]['failed'], 1)
+        self.assertEqual(rows[0]['max_duration'], 20.0)
+
+    def test_query(self):
+
+        self.logger.save_stats([make_sample('', datetime(2020, 1, 1, 10, 10), 10.0),
+                                make_sample('', datetime(2020, 1, 1, 12, 10), 10.0),
+                                make_sample('road', datetime(2020, 1, 2, 10, 10), 4.0)])
+
+        self.assertEqual(len(TaskLogger.query_stats('hour')), 3)
+        self.assertEqual(len(TaskLogger.query_stats('day')), 2)
+        self.assertEqual([row['bucket'] for row in TaskLogger.query_stats('hour', routing_key='')],
+                         [str(datetime(2020, 1, 1, 12)), str(datetime(2020, 1, 1, 10))])
+
+        rows = TaskLogger.query_stats('hour', routing_key='road')
+        self.assertEqual([row['routing_key'] for row in rows], ['road'])
+
+        rows = TaskLogger.query_stats('hour', since=datetime(2020, 1, 1, 11), until=datetime(2020, 1, 2, 10))
+        self.assertEqual([row['bucket'] for row in rows], [str(datetime(2020, 1, 1, 12))])
+
+        rows = TaskLogger.query_stats('hour', routing_key='', total=True)
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['count'], 2)
+
+    def test_unknown_period(self):
+
+        self.assertRaises(ValueError, TaskLogger.query_stats, 'week')
+
+
+if __name__ == '__main__':
+
+    unittest.main()
@@ -0,0 +1,154 @@
+import uuid
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+from PluginEngine.common import empty_uuid
+from backend.task_scheduler_service.common import ResponseObject, ResponseStatus
+from backend.task_scheduler_service.rpc_common import RPCData, RPCStatus
+from backend.task_scheduler_service.step_cache import StepResultCache
+from backend.task_scheduler_service.task_manager import TaskManager
+from backend.task_scheduler_service.task_manager_common import Task, TaskData
+
+
+class FakeLockManager:
+    """
+    The edit history: the watermark is the id of the last edit
+    """
+
+    def __init__(self):
+        self.edits = []
+
+    def edit(self):
+        self.edits.append((len(self.edits) + 1, MagicMock()))
+
+    def history_watermark(self) -> int:
+        return len(self.edits)
+
+    def edited_cells_since(self, watermark: int) -> list:
+        return [cell for edit_id, cell in self.edits if edit_id > watermark]
+
+
+def create_rpc_manager_mock() -> MagicMock:
+
+    rpc_manager = MagicMock()
+    rpc_manager.request.side_effect = \
+        lambda routing_key, task_input: RPCData(uuid.uuid4(), routing_key, 0.0, RPCStatus.WAITING, 'sent')
+    return rpc_manager
+
+
+class StepCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+
+        self.lock_manager = FakeLockManager()
+        self.manager = TaskManager('amqp://test', scenario_provider=MagicMock(), lock_manager=self.lock_manager,
+                                   task_logger=MagicMock())
+        self.manager._rpc_manager = create_rpc_manager_mock()
+        self.manager._step_cache = StepResultCache(max_size=10, max_age_sec=60)
+        self.edit_during_step = False
+
+        async def get(rpc_uuid):
+            if self.edit_during_step:
+                self.lock_manager.edit()
+            return ResponseObject(str(rpc_uuid), ResponseStatus.COMPLETED, 1.0, 'done')
+
+        self.manager._dispatcher = MagicMock()
+        self.manager._dispatcher.get.side_effect = get
+
+    def run_step(self) -> bool:
+
+        task_uuid = uuid.uuid4()
+        task = Task(task_uuid, empty_uuid, {'username': 'test'}, task_manager=self.manager,
+                    lock_manager=self.lock_manager)
+        task._scenario = MagicMock()
+        task._scenario.step_cache.return_value = True
+        self.manager._tasks[task_uuid] = TaskData(task)
+
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(self.manager.run_request(task_uuid, 'step'))
+        finally:
+            loop.close()
+
+    def test_cache_hit(self):
+
+        self.assertTrue(self.run_step())
+        self.assertTrue(self.run_step())
+        self.assertEqual(self.manager._rpc_manager.request.call_count, 1)
+
+    def test_edit_during_step(self):
+
+        self.edit_during_step = True
+        self.assertTrue(self.run_step())
+        self.edit_during_step = False
+
+        # the edit is newer than the watermark of the cached result, so the step runs again
+        self.assertTrue(self.run_step())
+        self.assertEqual(self.manager._rpc_manager.request.call_count, 2)
+
+
+class DeduplicationTestCase(unittest.TestCase):
+
+    def setUp(self):
+
+        scenario = MagicMock()
+        scenario.check_input.return_value = (True, 'Ok')
+        scenario.tile_size.return_value = None
+        scenario.deduplicate.return_value = True
+        scenario.execute = AsyncMock()
+        scenario_provider = MagicMock()
+        scenario_provider.get_scenario.return_value = (scenario, 'Ok')
+
+        self.manager = TaskManager('amqp://test', scenario_provider=scenario_provider, lock_manager=MagicMock(),
+                                   task_logger=MagicMock())
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def start_task(self, username: str) -> uuid.UUID:
+
+        payload = {'username': username, 'task_id': str(empty_uuid),
+                   'rect': {'lon_min': 60.0, 'lon_max': 61.0, 'lat_min': 56.0, 'lat_max': 56.3}}
+        ok, msg, task_uuid = self.loop.run_until_complete(self.manager.start_task(empty_uuid, payload))
+        self.assertTrue(ok, msg)
+        return task_uuid
+
+    def test_attach(self):
+
+        task_uuid = self.start_task('first')
+        self.assertEqual(self.start_task('second'), task_uuid)
+        self.assertEqual(len(self.manager._tasks), 1)
+        self.assertEqual(self.manager._tasks[task_uuid].subscribers, ['first', 'second'])
+
+    def test_release(self):
+
+        task_uuid = self.start_task('first')
+        self.manager.notify_task_closed(task_uuid)
+        self.assertFalse(self.manager._fingerprints)
+
+        # the identical task submitted later is a new one
+        new_uuid = self.start_task('second')
+        self.assertNotEqual(new_uuid, task_uuid)
+        self.assertIn(new_uuid, self.manager._tasks)
+
+
+class BackpressureTestCase(unittest.TestCase):
+
+    def test_inflight_of_batch(self):
+
+        manager = TaskManager('amqp://test', scenario_provider=MagicMock(), lock_manager=MagicMock(),
+                              task_logger=MagicMock())
+        for _ in range(2):
+            task_uuid = uuid.uuid4()
+            task = Task(task_uuid, empty_uuid, {'username': 'test'}, task_manager=manager, lock_manager=MagicMock())
+            manager._tasks[task_uuid] = TaskData(task)
+
+        with patch.object(TaskManager, 'MAX_INFLIGHT_TASKS', 4):
+            self.assertTrue(manager.check_backpressure(empty_uuid)[0])
+            self.assertTrue(manager.check_inflight(2)[0])
+            # the whole batch counts whatever the task types are
+            self.assertFalse(manager.check_inflight(3)[0])
+
+
+if __name__ == '__main__':
+
+    unittest.main()
@@ -0,0 +1,102 @@
+import json
+import asyncio
+import unittest
+from backend.task_scheduler_service.ws_client import WebSocketClient, SharedMessage, task_delta, msgpack
+
+
+class FakeWebSocket:
+
+    def __init__(self):
+        self.frames = []
+
+    async def send_str(self, data):
+        self.frames.append(data)
+
+    async def send_bytes(self, data):
+        self.frames.append(data)
+
+    async def close(self, code, message):
+        pass
+
+
+class BrokenWebSocket(FakeWebSocket):
+
+    async def send_str(self, data):
+        raise ConnectionResetError('Cannot write to closing transport')
+
+
+class TaskDeltaTestCase(unittest.TestCase):
+
+    def test_delta(self):
+
+        old = {'type': 1, 'uuid': 'a', 'status': 2, 'message': 'in progress',
+               'steps': [{'uuid': 's0', 'progress': 0.5, 'status': 2}]}
+        new = {'type': 1, 'uuid': 'a', 'status': 2, 'message': 'in progress (cached)',
+               'steps': [{'uuid': 's0', 'progress': 0.75, 'status': 2},
+                         {'uuid': 's1', 'progress': 0.0, 'status': 1}]}
+
+        delta = task_delta(old, new)
+        self.assertTrue(delta['delta'])
+        self.assertEqual(delta['fields'], {'message': 'in progress (cached)'})
+        self.assertEqual(delta['steps'], [[0, {'progress': 0.75}], [1, new['steps'][1]]])
+        self.assertEqual(task_delta(new, new)['steps'], [])
+
+    def test_encoding(self):
+
+        async def send_all(encoding):
+            ws = FakeWebSocket()
+            client = WebSocketClient(ws, delta=True, encoding=encoding)
+            client.send({'type': 1, 'uuid': 'a', 'status': 2, 'steps': []}, 'a')
+            client.send([{'type': 0, 'msg': 'page'}])
+            client.send('ready')
+            await asyncio.sleep(0.01)
+            await client.close()
+            return ws.frames
+
+        frames = asyncio.run(send_all('json'))
+        self.assertEqual(json.loads(frames[0])['seq'], 0)
+        self.assertEqual(json.loads(frames[1]), [{'type': 0, 'msg': 'page'}])
+        self.assertEqual(frames[2], 'ready')
+
+        if msgpack is not None:
+            frames = asyncio.run(send_all('msgpack'))
+            self.assertEqual(msgpack.unpackb(frames[0])['uuid'], 'a')
+            self.assertEqual(msgpack.unpackb(frames[1]), [{'type': 0, 'msg': 'page'}])
+            self.assertEqual(frames[2], 'ready')
+
+    def test_shared_message(self):
+
+        async def broadcast():
+            clients = [WebSocketClient(FakeWebSocket(), delta=delta) for delta in (False, False, True)]
+            message = SharedMessage({'type': 1, 'uuid': 'a', 'status': 2, 'steps': []})
+            for client in clients:
+                client.send(message, 'a')
+            await asyncio.sleep(0.01)
+            for client in clients:
+                await client.close()
+            return [client.ws.frames[0] for client in clients]
+
+        frames = asyncio.run(broadcast())
+        # the non-delta clients share the encoded frame, the delta client encodes its own
+        self.assertIs(frames[0], frames[1])
+        self.assertNotIn('seq', json.loads(frames[0]))
+        self.assertEqual(json.loads(frames[2])['seq'], 0)
+
+    def test_connection_error(self):
+
+        async def send_all():
+            client = WebSocketClient(BrokenWebSocket())
+            for i in range(3):
+                client.send({'type': 0, 'msg': str(i)})
+            await asyncio.sleep(0.01)
+            return client
+
+        client = asyncio.run(send_all())
+        # the client is dropped at the first error instead of failing on every pending message
+        self.assertEqual(client.pending_count(), 0)
+        self.assertFalse(client.send('ready'))
+
+
+if __name__ == '__main__':
+
+    unittest.main()
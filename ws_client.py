@@ -0,0 +1,218 @@
+import json
+import asyncio
+import itertools
+from typing import *
+from collections import OrderedDict
+from aiohttp import web, WSCloseCode
+from PluginEngine import Log
+from backend.task_scheduler_service.metrics import REGISTRY
+from backend.task_scheduler_service.rpc_common import RPCStatus
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+__all__ = ['WebSocketClient', 'SharedMessage', 'task_delta', 'ENCODINGS']
+
+
+"""
+Encodings of the messages: JSON text frames or msgpack binary frames, the control words are always sent as text
+"""
+ENCODINGS = ('json', 'msgpack')
+
+
+DROPPED_CLIENTS = REGISTRY.counter('task_scheduler_ws_dropped_clients_total', 'Websocket clients dropped as too slow')
+COALESCED_MESSAGES = REGISTRY.counter('task_scheduler_ws_coalesced_messages_total',
+                                      'Websocket messages replaced by a newer state before being sent')
+
+
+def encode_message(message: Union[Dict[str, Any], List[Any]], encoding: str) -> Union[str, bytes]:
+
+    if encoding == 'msgpack':
+        return msgpack.packb(message, use_bin_type=True)
+    return json.dumps(message)
+
+
+class SharedMessage:
+    """
+    Message broadcast to all the clients: it is encoded once per encoding by the first client sending it
+    """
+
+    __slots__ = ('data', '_encoded')
+
+    def __init__(self, data: Union[Dict[str, Any], List[Any]]):
+        self.data = data
+        self._encoded: Dict[str, Union[str, bytes]] = {}
+
+    def encode(self, encoding: str) -> Union[str, bytes]:
+
+        encoded = self._encoded.get(encoding)
+        if encoded is None:
+            encoded = self._encoded[encoding] = encode_message(self.data, encoding)
+        return encoded
+
+
+def task_delta(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Changes of the task descriptor: the changed top level fields and the changed fields of every step,
+    the steps are only appended so they are matched by index
+    """
+    fields = {key: value for key, value in new.items() if key != 'steps' and old.get(key) != value}
+    old_steps = old.get('steps', [])
+    steps = []
+    for i, step in enumerate(new.get('steps', [])):
+        old_step = old_steps[i] if i < len(old_steps) else {}
+        changed = {key: value for key, value in step.items() if old_step.get(key) != value}
+        if changed:
+            steps.append([i, changed])
+
+    return {'type': new['type'], 'uuid': new['uuid'], 'delta': True, 'fields': fields, 'steps': steps}
+
+
+class WebSocketClient:
+    """
+    Outgoing queue of a websocket served by its own sender task, so a slow client doesn't delay the others;
+    a pending message with the same key (task uuid) is replaced by the latest one keeping its place in the queue,
+    the client is dropped if the queue overflows, the connection fails or sending the pending messages
+    takes too long.
+    With the delta protocol the first message of a task carries the whole descriptor and the next ones
+    carry only the changes against the state last sent to this client; every task message has a sequence number
+    and the client asks for a resync if it misses one.
+    The messages are encoded at send time, as JSON text or msgpack binary frames; a SharedMessage is encoded
+    once for all the clients, only the delta messages are encoded by every client
+    """
+
+    MAX_PENDING = 1000
+    SEND_TIMEOUT = 10.0
+
+    _counter = itertools.count()
+
+    def __init__(self, ws: web.WebSocketResponse, delta: bool = False, encoding: str = 'json'):
+        """
+        :param encoding: one of ENCODINGS, msgpack falls back to JSON if the package is not installed
+        """
+        if encoding == 'msgpack' and msgpack is None:
+            Log.warn('msgpack is not installed, the websocket messages are sent as JSON')
+            encoding = 'json'
+
+        self.ws = ws
+        self._delta = delta
+        self._encoding = encoding
+        self._pending: 'OrderedDict[Hashable, Tuple[Union[str, SharedMessage], bool]]' = OrderedDict()
+        self._sent: Dict[Hashable, Tuple[int, Dict[str, Any]]] = {}
+        self._ready = asyncio.Event()
+        self._dropped = False
+        self._sender = asyncio.get_event_loop().create_task(self._run())
+
+    def send(self, data: Union[str, Dict[str, Any], List[Any], SharedMessage], key: Optional[Hashable] = None) -> bool:
+        """
+        Queues the message without waiting
+        :param data: control word, JSON serializable message or the task descriptor sent with the key,
+        the message broadcast to many clients should be passed as SharedMessage
+        :param key: messages with the same key are coalesced, None means the message is always sent
+        :return: False if the client has been dropped
+        """
+        if self._dropped:
+            return False
+
+        if not isinstance(data, (str, SharedMessage)):
+            data = SharedMessage(data)
+
+        is_state = key is not None
+        if key is None:
+            key = ('message', next(self._counter))
+        elif key in self._pending:
+            COALESCED_MESSAGES.inc()
+            self._pending[key] = (data, is_state)
+            return True
+
+        if len(self._pending) >= self.MAX_PENDING:
+            self._drop(f'{len(self._pending)} messages are pending')
+            return False
+
+        self._pending[key] = (data, is_state)
+        self._ready.set()
+        return True
+
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def forget(self, key: Hashable):
+        """
+        The next message with the key carries the whole descriptor
+        """
+        self._sent.pop(key, None)
+
+    async def close(self, code: int = WSCloseCode.GOING_AWAY, message: bytes = b''):
+        self._sender.cancel()
+        await self.ws.close(code=code, message=message)
+
+    async def _run(self):
+
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            #  One deadline for the messages pending at the start of the drain, the later ones get the next drain
+            try:
+                await asyncio.wait_for(self._drain(len(self._pending)), self.SEND_TIMEOUT)
+            except asyncio.TimeoutError:
+                self._drop(f'send timeout {self.SEND_TIMEOUT} seconds has been reached')
+                return
+            except ConnectionError as err:
+                self._drop(f'socket error: {err}')
+                return
+            if self._pending:
+                self._ready.set()
+
+    async def _drain(self, count: int):
+
+        for _ in range(min(count, len(self._pending))):
+            key, (data, is_state) = self._pending.popitem(last=False)
+            try:
+                payload = self._encode(key, data, is_state)
+            except (TypeError, ValueError) as err:
+                Log.error(f'Failed to encode the websocket message: {err}')
+                continue
+            if isinstance(payload, str):
+                await self.ws.send_str(payload)
+            else:
+                await self.ws.send_bytes(payload)
+
+    def _encode(self, key: Hashable, data: Union[str, SharedMessage], is_state: bool) -> Union[str, bytes]:
+
+        if isinstance(data, str):
+            return data
+        if is_state and self._delta:
+            return encode_message(self._state_message(key, data.data), self._encoding)
+        return data.encode(self._encoding)
+
+    def _state_message(self, key: Hashable, state: Dict[str, Any]) -> Dict[str, Any]:
+
+        sent = self._sent.get(key)
+        if sent is None:
+            seq = 0
+            message = dict(state)
+        else:
+            seq = sent[0] + 1
+            message = task_delta(sent[1], state)
+        message['seq'] = seq
+
+        if state.get('status', RPCStatus.INACTIVE) >= RPCStatus.COMPLETED:
+            self._sent.pop(key, None)
+        else:
+            self._sent[key] = (seq, state)
+        return message
+
+    def _drop(self, reason: str):
+
+        self._dropped = True
+        self._pending.clear()
+        DROPPED_CLIENTS.inc()
+        Log.warn(f'Websocket client has been dropped: {reason}')
+        # The handler of the websocket removes the client when the connection is closed
+        asyncio.get_event_loop().create_task(
+            self.ws.close(code=WSCloseCode.POLICY_VIOLATION, message=b'Too slow client'))
+        if asyncio.current_task() is not self._sender:
+            self._sender.cancel()